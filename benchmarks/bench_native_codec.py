@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""Compare blackboxprotobuf against the compiled google.protobuf path on the sample captures."""
+
+import sys
+import timeit
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import blackboxprotobuf  # noqa: E402
+
+from capture_codec import decoder  # noqa: E402
+from capture_codec.proto_codec import NativeCodec  # noqa: E402
+
+SAMPLES = ["test", "ss", "room1", "room2"]
+
+
+def load_body(name):
+    """Strip a sample capture down to its protobuf body."""
+    return bytes(decoder.run_layers((ROOT / name).read_bytes()))
+
+
+def single_repeated():
+    """One-element packed and seen_repeated fields, which blackboxprotobuf still returns as lists."""
+    typedef = {
+        "1": {"type": "packed_int"},
+        "2": {"type": "int", "seen_repeated": True},
+        "3": {"type": "message", "seen_repeated": True, "message_typedef": {"1": {"type": "int"}}},
+        "4": {"type": "string"},
+    }
+    return blackboxprotobuf.encode_message({"1": [5], "2": [6], "3": [{"1": 7}], "4": "x"}, typedef), typedef
+
+
+def best_of(func, number, repeat=5):
+    """Best time per call in microseconds."""
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number * 1e6
+
+
+def main():
+    """Main function."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--number", type=int, default=200, help="Calls per timing run")
+    args = parser.parse_args()
+
+    decoder.VERBOSE = False
+    print(f"{'sample':<8} {'bytes':>6} {'bbpb dec':>10} {'native dec':>11} {'bbpb enc':>10} {'native enc':>11}  (us/msg)")
+    cases = [(name, load_body(name), None) for name in SAMPLES]
+    cases.append(("repeated", *single_repeated()))
+    for name, data, typedef in cases:
+        msg, typedef = blackboxprotobuf.decode_message(data, typedef)
+        codec = NativeCodec(typedef)
+        assert codec.decode(data) == msg, f"{name}: native decode differs from blackboxprotobuf"
+
+        bbpb_dec = best_of(lambda: blackboxprotobuf.decode_message(data, typedef), args.number)
+        native_dec = best_of(lambda: codec.decode(data), args.number)
+        bbpb_enc = best_of(lambda: blackboxprotobuf.encode_message(msg, typedef), args.number)
+        native_enc = best_of(lambda: codec.encode(msg), args.number)
+        print(f"{name:<8} {len(data):>6} {bbpb_dec:>10.1f} {native_dec:>11.1f} {bbpb_enc:>10.1f} {native_enc:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Measure output size and write throughput of each output format on the sample captures."""
+
+import io
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from capture_codec import decoder, output_writers  # noqa: E402
+from capture_codec.output_writers import FORMATS, RecordWriter  # noqa: E402
+
+SAMPLES = ["a", "test", "ss", "room", "room1", "room2", "msg"]
+
+
+def load_records():
+    """Decode every sample once. Returns (records, total payload bytes)."""
+    records = []
+    payload_bytes = 0
+    for name in SAMPLES:
+        raw = (ROOT / name).read_bytes()
+        msg, typedef = decoder.decode_capture(raw)
+        records.append({"source": name, "message_content": msg, "schema_definition": typedef})
+        payload_bytes += len(raw)
+    return records, payload_bytes
+
+
+def time_format(records, fmt, repeat):
+    """Write records repeat times. Returns (seconds, output bytes)."""
+    out = io.BytesIO()
+    started = time.perf_counter()
+    writer = RecordWriter(out, fmt)
+    for _ in range(repeat):
+        for record in records:
+            writer.write(record)
+    return time.perf_counter() - started, out.tell()
+
+
+def main():
+    """Main function."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-r", "--repeat", type=int, default=200, help="Times to write the sample set")
+    args = parser.parse_args()
+
+    decoder.VERBOSE = False
+    records, payload_bytes = load_records()
+    payload_total = payload_bytes * args.repeat
+    json_engine = "orjson" if output_writers.load_orjson() is not None else "stdlib json"
+    print(f"{len(records) * args.repeat} records, {payload_total} capture bytes, JSON via {json_engine}")
+    print(f"{'format':<8} {'output bytes':>13} {'x capture':>10} {'MB/s out':>9} {'MB/s in':>8}")
+    for fmt in FORMATS:
+        seconds, size = time_format(records, fmt, args.repeat)
+        print(
+            f"{fmt:<8} {size:>13} {size / payload_total:>10.2f} "
+            f"{size / seconds / 1e6:>9.1f} {payload_total / seconds / 1e6:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
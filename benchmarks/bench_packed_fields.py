@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""Compare blackboxprotobuf's packed field decoders with the bulk ones in packed_fields.py on synthetic runs."""
+
+import random
+import struct
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import blackboxprotobuf  # noqa: E402
+from blackboxprotobuf.lib.types.varint import encode_svarint, encode_uvarint  # noqa: E402
+
+from capture_codec import packed_fields  # noqa: E402
+
+# name -> (packed type, element generator)
+PAYLOADS = {
+    "uint <128": ("packed_uint", lambda rnd: rnd.randrange(128)),
+    "uint ids": ("packed_uint", lambda rnd: rnd.randrange(1 << 20, 1 << 40)),
+    "sint +-": ("packed_sint", lambda rnd: rnd.randrange(-(1 << 30), 1 << 30)),
+    "fixed32": ("packed_fixed32", lambda rnd: rnd.randrange(1 << 32)),
+    "fixed64": ("packed_fixed64", lambda rnd: rnd.randrange(1 << 64)),
+    "double": ("packed_double", lambda rnd: rnd.random()),
+}
+ENCODE = {
+    "packed_uint": encode_uvarint,
+    "packed_sint": encode_svarint,
+    "packed_fixed32": lambda value: struct.pack("<I", value),
+    "packed_fixed64": lambda value: struct.pack("<Q", value),
+    "packed_double": lambda value: struct.pack("<d", value),
+}
+
+
+def make_field(field_type, generate, count, seed=1):
+    """Field 1 of a message: one packed run of count elements. Returns (message, payload offset)."""
+    rnd = random.Random(seed)
+    encode = ENCODE[field_type]
+    payload = b"".join(encode(generate(rnd)) for _ in range(count))
+    header = b"\x0a" + encode_uvarint(len(payload))
+    return header + payload, len(header)
+
+
+def best_of(func, repeat):
+    """Best wall time of func() in milliseconds."""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def main():
+    """Main function."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="100000,1000000", help="Comma-separated element counts")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="Timing runs per case (best is kept)")
+    args = parser.parse_args()
+
+    numpy = packed_fields.load_numpy()
+    print(f"numpy: {numpy.__version__ if numpy is not None else 'not installed'}")
+    print(
+        f"{'payload':<10} {'elements':>9} {'bytes':>9} {'bbpb ms':>9} {'array ms':>9} "
+        f"{'no-numpy ms':>11} {'decode ms':>10} {'speedup':>8}"
+    )
+    for count in (int(size) for size in args.sizes.split(",")):
+        for name, (field_type, generate) in PAYLOADS.items():
+            data, payload_start = make_field(field_type, generate, count)
+            typedef = {"1": {"type": field_type}}
+
+            packed_fields.uninstall()
+            expected, _ = blackboxprotobuf.decode_message(data, typedef)
+            bbpb_ms = best_of(lambda: blackboxprotobuf.decode_message(data, typedef), args.repeat)
+
+            array_ms = best_of(lambda: packed_fields.decode_packed(data, field_type, payload_start), args.repeat)
+            packed_fields.numpy = None
+            python_ms = best_of(lambda: packed_fields.decode_packed(data, field_type, payload_start), args.repeat)
+            packed_fields.numpy = numpy
+
+            packed_fields.install()
+            got, _ = blackboxprotobuf.decode_message(data, typedef)
+            assert got == expected, f"{name}: bulk decode differs from blackboxprotobuf"
+            decode_ms = best_of(lambda: blackboxprotobuf.decode_message(data, typedef), args.repeat)
+            print(
+                f"{name:<10} {count:>9} {len(data):>9} {bbpb_ms:>9.1f} {array_ms:>9.1f} "
+                f"{python_ms:>11.1f} {decode_ms:>10.1f} {bbpb_ms / decode_ms:>7.1f}x"
+            )
+    print("array: decode_packed to an array.array; decode: blackboxprotobuf.decode_message with the bulk decoders installed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Compare blackboxprotobuf's encoder with the two-pass one in sized_encoder.py on the samples and synthetic trees."""
+
+import json
+import sys
+import timeit
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import blackboxprotobuf  # noqa: E402
+from blackboxprotobuf.lib.api import TypeDef, default_config  # noqa: E402
+from blackboxprotobuf.lib.types.length_delim import encode_message as encode_with_typedef  # noqa: E402
+
+from capture_codec import decoder  # noqa: E402
+from capture_codec.encoder import restore_types  # noqa: E402
+from capture_codec.sized_encoder import SizedEncoder, encode_sized  # noqa: E402
+
+# Decoder JSON files (message_content + schema_definition) and raw captures
+JSON_SAMPLES = ["msg.json", "room.json", "test.json"]
+CAPTURE_SAMPLES = ["msg", "room1", "room2", "ss"]
+
+
+def load_json(name):
+    with open(ROOT / name, encoding="utf-8") as f:
+        data = json.load(f)
+    typedef = data["schema_definition"]
+    return restore_types(data["message_content"], typedef), typedef
+
+
+def load_capture(name):
+    body = bytes(decoder.run_layers((ROOT / name).read_bytes()))
+    return blackboxprotobuf.decode_message(body)
+
+
+def deep_tree(depth, payload=64):
+    """A chain of depth nested messages, each with an int, a string and the next level."""
+    msg = {"1": 1, "2": "x" * payload}
+    typedef = {"1": {"type": "int"}, "2": {"type": "string"}}
+    for level in range(depth - 1):
+        msg = {"1": level, "2": "x" * payload, "3": msg}
+        typedef = {"1": {"type": "int"}, "2": {"type": "string"}, "3": {"type": "message", "message_typedef": typedef}}
+    return msg, typedef
+
+
+def wide_tree(fanout, depth, payload=16):
+    """fanout repeated child messages per level, depth levels, strings at the leaves."""
+    msg = {"1": 7, "2": "x" * payload}
+    typedef = {"1": {"type": "int"}, "2": {"type": "string"}}
+    for _ in range(depth - 1):
+        msg = {"1": 7, "3": [msg] * fanout}
+        typedef = {
+            "1": {"type": "int"},
+            "3": {"seen_repeated": True, "message_typedef": typedef, "type": "message"},
+        }
+    return msg, typedef
+
+
+def best_of(func, number, repeat=5):
+    """Best time per call in microseconds."""
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number * 1e6
+
+
+def main():
+    """Main function."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--number", type=int, default=20, help="Calls per timing run")
+    args = parser.parse_args()
+
+    decoder.VERBOSE = False
+    cases = [(name, *load_json(name)) for name in JSON_SAMPLES if (ROOT / name).exists()]
+    cases += [(name, *load_capture(name)) for name in CAPTURE_SAMPLES if (ROOT / name).exists()]
+    cases += [(f"deep {depth}", *deep_tree(depth)) for depth in (16, 64, 160)]
+    cases += [("deep 32 4k", *deep_tree(32, 4096))]
+    cases += [(f"wide {fanout}x{depth}", *wide_tree(fanout, depth)) for fanout, depth in ((1000, 2), (8, 5), (4, 8))]
+
+    print(f"{'message':<14} {'bytes':>9} {'bbpb us':>11} {'sized us':>11} {'one-shot us':>12} {'speedup':>8}")
+    for name, msg, typedef in cases:
+        typedef_obj = TypeDef.from_dict(typedef)
+        try:
+            expected = bytes(encode_with_typedef(msg, default_config, typedef_obj))
+        except Exception as err:
+            print(f"{name:<14} skipped, blackboxprotobuf cannot encode it: {err}")
+            continue
+        sized = SizedEncoder(typedef_obj)
+        assert sized.encode(msg) == expected, f"{name}: output differs"
+        bbpb_us = best_of(lambda: encode_with_typedef(msg, default_config, typedef_obj), args.number)
+        sized_us = best_of(lambda: sized.encode(msg), args.number)
+        once_us = best_of(lambda: encode_sized(msg, typedef_obj), args.number)
+        print(
+            f"{name:<14} {len(expected):>9} {bbpb_us:>11.1f} {sized_us:>11.1f} {once_us:>12.1f} "
+            f"{bbpb_us / sized_us:>7.2f}x"
+        )
+    print("bbpb and sized reuse one TypeDef/SizedEncoder per message, as EncodePlan does; one-shot builds a")
+    print("new SizedEncoder (field lookups) per call. Typedef dict conversion is not timed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Time each stage of the decode/encode pipeline on the bundled samples and on
+larger synthetic frames, and write the results as JSON.
+
+Every sample is taken down to its protobuf body and then rebuilt in each
+framing, so every stage runs on every sample:
+
+    http_strip        strip_http_framing on an HTTP response wrapping the capture
+    msgpack_envelope  strip_msgpack_envelope on an uncompressed {IsZip, ZipDataLen} frame
+    gunzip            gunzip of the gzip-compressed body
+    decode_message    blackboxprotobuf.decode_message of the body
+    json_output       the indented JSON decoder.py writes
+    jsonl_output      the compact JSONL record
+    restore_types     encoder.restore_types on the JSON-loaded message
+    encode_message    blackboxprotobuf.encode_message of the restored message
+
+Compare a run with an earlier one with --baseline; stages that got slower
+than --threshold are listed and the exit status is 1.
+"""
+
+import gzip
+import json
+import platform
+import subprocess
+import sys
+import time
+import timeit
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import blackboxprotobuf  # noqa: E402
+import msgpack  # noqa: E402
+
+from capture_codec import decoder, encoder  # noqa: E402
+from capture_codec.gunzip_stream import gunzip  # noqa: E402
+from capture_codec.output_writers import serialize  # noqa: E402
+
+CAPTURE_SAMPLES = ["a", "test", "ss", "room1", "room2", "room_encoded"]
+JSON_SAMPLES = ["msg.json"]
+# Body the synthetic frames are built from, and their default sizes.
+SYNTHETIC_SOURCE = "ss"
+SYNTHETIC_SIZES = [64 * 1024, 1024 * 1024]
+OUTPUT_FILE = "bench_stages.json"
+
+
+def http_response(payload):
+    """Wrap a payload in a minimal HTTP/1.1 response."""
+    head = f"HTTP/1.1 200 OK\r\nContent-Type: application/x-protobuf\r\nContent-Length: {len(payload)}\r\n\r\n"
+    return head.encode("ascii") + payload
+
+
+def envelope(payload, zipped):
+    """Prefix a payload with the {IsZip, ZipDataLen} msgpack map."""
+    return msgpack.packb({"IsZip": zipped, "ZipDataLen": len(payload)}) + payload
+
+
+def load_cases(synthetic_sizes):
+    """Returns a list of (name, protobuf body or None, message, typedef)."""
+    cases = []
+    for name in CAPTURE_SAMPLES:
+        body = bytes(decoder.run_layers((ROOT / name).read_bytes()))
+        cases.append((name, body, None, None))
+
+    for name in JSON_SAMPLES:
+        # Already-decoded output: only the JSON and encode stages apply.
+        data = json.loads((ROOT / name).read_text(encoding="utf-8"))
+        cases.append((name, None, data["message_content"], data["schema_definition"]))
+
+    source = bytes(decoder.run_layers((ROOT / SYNTHETIC_SOURCE).read_bytes()))
+    for size in synthetic_sizes:
+        # Back-to-back copies of a message are one valid message whose
+        # fields are all repeated.
+        body = source * max(1, size // len(source))
+        cases.append((f"synthetic-{size // 1024}k", body, None, None))
+    return cases
+
+
+def stages_for(body, msg, typedef):
+    """Yield (stage, input size, zero-argument callable) for one case."""
+    if body is not None:
+        gz = gzip.compress(body)
+        plain_frame = envelope(body, False)
+        http = http_response(envelope(gz, True))
+        yield "http_strip", len(http), lambda: decoder.strip_http_framing(http)
+        yield "msgpack_envelope", len(plain_frame), lambda: decoder.strip_msgpack_envelope(plain_frame)
+        yield "gunzip", len(gz), lambda: gunzip(gz, len(gz))
+        yield "decode_message", len(body), lambda: blackboxprotobuf.decode_message(body)
+        msg, typedef = blackboxprotobuf.decode_message(body)
+
+    record = {"message_content": msg, "schema_definition": typedef}
+    json_text = serialize(record, "json")
+    yield "json_output", len(json_text), lambda: serialize(record, "json")
+    yield "jsonl_output", len(json_text), lambda: serialize(record, "jsonl")
+
+    loaded = json.loads(json_text)
+    loaded_msg, loaded_typedef = loaded["message_content"], loaded["schema_definition"]
+    yield "restore_types", len(json_text), lambda: encoder.restore_types(loaded_msg, loaded_typedef)
+    restored = encoder.restore_types(loaded_msg, loaded_typedef)
+    yield "encode_message", len(json_text), lambda: blackboxprotobuf.encode_message(restored, loaded_typedef)
+
+
+def measure(func, repeat, min_time):
+    """Best and mean seconds per call over repeat runs of at least min_time each."""
+    timer = timeit.Timer(func)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 2 if elapsed == 0 else max(2, min(10, int(min_time / elapsed) + 1))
+    runs = [elapsed] + timer.repeat(repeat - 1, number) if repeat > 1 else [elapsed]
+    per_call = [run / number for run in runs]
+    return min(per_call), sum(per_call) / len(per_call), number
+
+
+def environment():
+    """Versions and revision the numbers were measured with."""
+    info = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+    try:
+        from importlib.metadata import version
+
+        info["blackboxprotobuf"] = version("bbpb")
+    except Exception:
+        info["blackboxprotobuf"] = None
+    try:
+        info["revision"] = subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except Exception:
+        info["revision"] = None
+    return info
+
+
+def compare(results, baseline_file, threshold):
+    """Print stages slower than threshold times the baseline. Returns how many."""
+    with open(baseline_file, "r", encoding="utf-8") as f:
+        baseline = {(r["case"], r["stage"]): r for r in json.load(f)["results"]}
+
+    regressions = 0
+    for result in results:
+        old = baseline.get((result["case"], result["stage"]))
+        if not old or "best_us" not in old or "best_us" not in result:
+            continue
+        ratio = result["best_us"] / old["best_us"]
+        if ratio > threshold:
+            regressions += 1
+            print(
+                f"REGRESSION {result['case']}/{result['stage']}: "
+                f"{old['best_us']:.1f}us -> {result['best_us']:.1f}us ({ratio:.2f}x)"
+            )
+    print(f"{regressions} stage(s) slower than {threshold:.2f}x the baseline")
+    return regressions
+
+
+def main():
+    """Main function."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-o", "--output", default=OUTPUT_FILE, help=f"Results file (default: {OUTPUT_FILE})")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="Timing runs per stage (default: 5)")
+    parser.add_argument(
+        "--min-time", type=float, default=0.05, help="Minimum seconds per timing run (default: 0.05)"
+    )
+    parser.add_argument(
+        "--synthetic",
+        type=lambda s: [int(x) for x in s.split(",") if x],
+        default=SYNTHETIC_SIZES,
+        help="Comma-separated byte sizes of synthetic frames (default: 65536,1048576; empty for none)",
+    )
+    parser.add_argument("--baseline", help="Earlier results file to compare against")
+    parser.add_argument(
+        "--threshold", type=float, default=1.2, help="Slowdown ratio reported as a regression (default: 1.2)"
+    )
+    args = parser.parse_args()
+
+    decoder.VERBOSE = False
+    started = time.perf_counter()
+    results = []
+    print(f"{'case':<16} {'stage':<17} {'bytes':>9} {'best us':>11} {'MB/s':>8}")
+    for name, body, msg, typedef in load_cases(args.synthetic):
+        for stage, size, func in stages_for(body, msg, typedef):
+            result = {"case": name, "stage": stage, "bytes": size}
+            try:
+                func()
+            except Exception as err:
+                # e.g. typedef types the installed blackboxprotobuf cannot encode
+                result["error"] = str(err)
+                print(f"{name:<16} {stage:<17} {size:>9}  skipped: {err}")
+                results.append(result)
+                continue
+            best, mean, number = measure(func, args.repeat, args.min_time)
+            result.update(
+                best_us=best * 1e6,
+                mean_us=mean * 1e6,
+                calls_per_run=number,
+                mb_per_s=size / best / 1e6,
+            )
+            results.append(result)
+            print(f"{name:<16} {stage:<17} {size:>9} {best * 1e6:>11.1f} {size / best / 1e6:>8.2f}")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"environment": environment(), "results": results}, f, indent=2)
+    print(f"{len(results)} measurements in {time.perf_counter() - started:.1f}s saved to '{args.output}'")
+
+    if args.baseline and compare(results, args.baseline, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
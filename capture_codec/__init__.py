@@ -0,0 +1,52 @@
+"""
+Decode captured protobuf payloads (HTTP response, msgpack envelope and
+gzip framing around blackboxprotobuf-decoded messages) and encode them back.
+
+    from capture_codec import decode_capture, encode_message
+
+    msg, typedef = decode_capture(raw_bytes)
+    body = encode_message(msg, typedef)
+
+Names are resolved on first use, so importing the package does not load
+blackboxprotobuf, msgpack or any submodule. The command line lives in
+__main__.py (python -m capture_codec decode|encode).
+"""
+
+import importlib
+
+# Public name -> submodule that defines it.
+_EXPORTS = {
+    "decode_capture": "decoder",
+    "run_layers": "decoder",
+    "register_layer": "decoder",
+    "encode_message": "encoder",
+    "encode_sized": "sized_encoder",
+    "restore_types": "encoder",
+    "FORMATS": "output_writers",
+    "RecordWriter": "output_writers",
+    "iter_records": "output_writers",
+    "message_to_json": "output_writers",
+    "message_from_json": "output_writers",
+    "TypedefRegistry": "typedef_registry",
+    "DecodeCache": "decode_cache",
+    "CaptureIndex": "capture_index",
+    "diff_messages": "structural_diff",
+    "decode_packed": "packed_fields",
+    "stream_record": "stream_json",
+    "DecompressionError": "gunzip_stream",
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,129 @@
+"""
+Streaming command line: python -m capture_codec decode|encode.
+
+Input defaults to stdin and output to stdout, so captures can be piped
+through one file at a time:
+
+    python -m capture_codec decode < capture > capture.json
+    python -m capture_codec decode --frames < dump.bin | grep ...
+    python -m capture_codec encode < capture.json > capture.pb
+
+Only the stages a capture actually needs are imported. The file-oriented
+tools with batch, registry and profiling options are still
+python -m capture_codec.decoder and python -m capture_codec.encoder.
+"""
+
+import sys
+
+
+def _open_input(path):
+    return sys.stdin.buffer if path in (None, "-") else open(path, "rb")
+
+
+def _open_output(path):
+    return sys.stdout.buffer if path in (None, "-") else open(path, "wb")
+
+
+def decode_command(args):
+    """Decode one capture (or a stream of frames) to records."""
+    from . import decoder
+    from .output_writers import RecordWriter
+
+    layers = [name for name in args.layers.split(",") if name] if args.layers else None
+    paths = [path for path in args.paths.split(",") if path] if args.paths else None
+    if paths and args.frames:
+        raise ValueError("--paths does not work with --frames")
+    src = _open_input(args.input)
+    dst = _open_output(args.output)
+    try:
+        fmt = args.format or ("jsonl" if args.frames else "json")
+        writer = RecordWriter(dst, fmt)
+        if args.frames:
+            # Frames are decoded and written one at a time as they arrive.
+            for record in decoder.iter_decoded_frames(src):
+                writer.write(record)
+                dst.flush()
+        else:
+            msg, typedef = decoder.decode_capture(src.read(), layers=layers, paths=paths)
+            writer.write({"message_content": msg, "schema_definition": typedef})
+        dst.flush()
+    finally:
+        if src is not sys.stdin.buffer:
+            src.close()
+        if dst is not sys.stdout.buffer:
+            dst.close()
+
+
+def encode_command(args):
+    """Encode one JSON record, or every record of a record stream as frames."""
+    import json
+
+    from .encoder import PlanCache, write_frame
+    from .output_writers import iter_records
+
+    cache = PlanCache(args.native)
+    src = _open_input(args.input)
+    dst = _open_output(args.output)
+    try:
+        if args.format == "json":
+            record = json.load(src)
+            dst.write(cache.get(record["schema_definition"]).encode(record["message_content"]))
+        else:
+            for record in iter_records(src, args.format):
+                if "message_content" not in record:
+                    raise ValueError(f"Record has no message_content: {record.get('error')}")
+                write_frame(dst, cache.get(record["schema_definition"]).encode(record["message_content"]))
+        dst.flush()
+    finally:
+        if src is not sys.stdin.buffer:
+            src.close()
+        if dst is not sys.stdout.buffer:
+            dst.close()
+
+
+def main(argv=None):
+    """Main function."""
+    import argparse
+
+    # Kept in sync with output_writers.FORMATS without importing it up front.
+    formats = ("json", "jsonl", "msgpack", "typed")
+
+    parser = argparse.ArgumentParser(prog="python -m capture_codec", description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    decode = commands.add_parser("decode", help="Decode a capture to JSON (or another record format)")
+    decode.add_argument("input", nargs="?", help="Capture file (default: stdin)")
+    decode.add_argument("-o", "--output", help="Output file (default: stdout)")
+    decode.add_argument("--format", choices=formats, help="Output format (default: json, jsonl with --frames)")
+    decode.add_argument(
+        "--frames", action="store_true", help="Input is a stream of {IsZip, ZipDataLen} frames; one record each"
+    )
+    decode.add_argument("--layers", help="Comma-separated framing layers to try (default: http,msgpack,gzip)")
+    decode.add_argument("--paths", help="Comma-separated field paths to decode, e.g. 1 for the RPC header")
+    decode.set_defaults(func=decode_command)
+
+    encode = commands.add_parser("encode", help="Encode decoder output back to protobuf bytes")
+    encode.add_argument("input", nargs="?", help="Decoded record file (default: stdin)")
+    encode.add_argument("-o", "--output", help="Output file (default: stdout)")
+    encode.add_argument(
+        "--format",
+        choices=formats,
+        default="json",
+        help="Input format; anything but json is a record stream written out as frames (default: json)",
+    )
+    encode.add_argument("--native", action="store_true", help="Encode through compiled google.protobuf classes")
+    encode.set_defaults(func=encode_command)
+
+    args = parser.parse_args(argv)
+    try:
+        args.func(args)
+    except BrokenPipeError:
+        # The reader (head, grep -m ...) went away; that is not an error.
+        sys.stderr.close()
+    except Exception as err:
+        print(f"An error occurred: {err}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
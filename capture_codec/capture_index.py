@@ -0,0 +1,422 @@
+"""
+SQLite index over decoded captures, so they can be found by RPC without
+decoding the corpus again.
+
+    python -m capture_codec.capture_index update captures.db caps/
+    python -m capture_codec.capture_index query captures.db \\
+        --method Family.GetFamilyBaseInfo --since 2026-01-06 --until 2026-01-07
+    python -m capture_codec.capture_index query captures.db --where 1.9=2 --field 2.1 --records
+    python -m capture_codec.capture_index update captures.db caps/ --index-field 2.1
+    python -m capture_codec.capture_index query captures.db --where 2.1=BlackPlugins
+
+Each capture file gets a row with its RPC header fields (1.1 service,
+1.7 method, 1.2 timestamp, 1.9) in indexed columns, pointing at its decoded
+(message, typedef) stored as msgpack in a bodies table. Identical decoded
+bodies are stored once. update only decodes files that are new or whose
+size or mtime changed, and drops rows for files that are gone. With
+--header-only just field 1 is decoded and stored (see lazy_decode.py),
+which indexes a corpus of large captures much faster but leaves nothing
+else to query.
+
+Field paths are dotted field numbers (2.1 is field 1 of the message in
+field 2). The header paths are answered from the columns. Paths named
+with update --index-field get their values stored in a field_values
+table, for the bodies already indexed and every one added later, and are
+answered from it too. Any other --where path is checked by unpacking the
+stored body of every row the other filters leave, which on a broad query
+costs about as much as reading the whole corpus back.
+"""
+
+import hashlib
+import os
+import sqlite3
+import sys
+import time
+
+from .decoder import batch_settings, collect_inputs, iter_batch_lines
+
+# Header field (path within the message) -> column.
+HEADER_COLUMNS = {
+    "1.1": "service",
+    "1.7": "method",
+    "1.2": "timestamp",
+    "1.9": "header_9",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS captures (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    service TEXT,
+    method TEXT,
+    timestamp INTEGER,
+    timestamp_ms INTEGER,
+    header_9 INTEGER,
+    body_key TEXT,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS bodies (
+    key TEXT PRIMARY KEY,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS field_paths (
+    path TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS field_values (
+    path TEXT NOT NULL,
+    value TEXT NOT NULL,
+    body_key TEXT NOT NULL,
+    PRIMARY KEY (path, value, body_key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS captures_method ON captures (method, timestamp_ms);
+CREATE INDEX IF NOT EXISTS captures_service ON captures (service, timestamp_ms);
+CREATE INDEX IF NOT EXISTS captures_time ON captures (timestamp_ms);
+"""
+
+
+def timestamp_ms(value):
+    """
+    Header field 1.2 in milliseconds. Most captures carry milliseconds, some
+    nanoseconds (or microseconds); the magnitude tells them apart.
+    """
+    if not isinstance(value, int) or value <= 0:
+        return None
+    if value >= 10**17:
+        return value // 10**6
+    if value >= 10**14:
+        return value // 10**3
+    return value
+
+
+def parse_time(text):
+    """Milliseconds since the epoch from an integer or an ISO date/time (naive means local time)."""
+    from datetime import datetime
+
+    if text.isdigit():
+        return timestamp_ms(int(text))
+    return int(datetime.fromisoformat(text).timestamp() * 1000)
+
+
+def _header_value(value):
+    if isinstance(value, list):
+        value = value[0] if value else None
+    if isinstance(value, bytes):
+        return value.decode("utf-8", "replace")
+    if isinstance(value, dict):
+        return None
+    return value
+
+
+def read_header(msg):
+    """Returns {column: value} for the header fields of a decoded message."""
+    header = msg.get("1")
+    if isinstance(header, list):
+        header = header[0] if header else None
+    if not isinstance(header, dict):
+        return {column: None for column in HEADER_COLUMNS.values()}
+    return {column: _header_value(header.get(path.split(".")[1])) for path, column in HEADER_COLUMNS.items()}
+
+
+def field_values(msg, path):
+    """Every value at a dotted field path; repeated fields contribute each element."""
+    values = [msg]
+    for number in path.split("."):
+        found = []
+        for value in values:
+            if not isinstance(value, dict) or number not in value:
+                continue
+            value = value[number]
+            found.extend(value if isinstance(value, list) else [value])
+        values = found
+    return values
+
+
+def _value_text(value):
+    """A field value as --where compares it, or None for a nested message."""
+    if isinstance(value, bytes):
+        return value.decode("utf-8", "replace")
+    return None if isinstance(value, dict) else str(value)
+
+
+def _matches(value, wanted):
+    text = _value_text(value)
+    return text is not None and text == wanted
+
+
+class CaptureIndex:
+    """An index database; see the module docstring."""
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def indexed_paths(self):
+        """The field paths whose values are kept in field_values."""
+        return {row[0] for row in self.db.execute("SELECT path FROM field_paths")}
+
+    def _index_values(self, key, msg, paths):
+        rows = set()
+        for path in paths:
+            for value in field_values(msg, path):
+                text = _value_text(value)
+                if text is not None:
+                    rows.add((path, text, key))
+        self.db.executemany("INSERT OR IGNORE INTO field_values VALUES (?, ?, ?)", rows)
+
+    def add_paths(self, paths):
+        """
+        Keep the values of more field paths in field_values, starting with
+        the bodies already stored. Header paths are columns already and are
+        skipped. Call inside a transaction.
+        """
+        known = self.indexed_paths()
+        new = [path for path in dict.fromkeys(paths) if path not in HEADER_COLUMNS and path not in known]
+        if not new:
+            return
+        self.db.executemany("INSERT INTO field_paths VALUES (?)", [(path,) for path in new])
+        for (key,) in self.db.execute("SELECT key FROM bodies").fetchall():
+            msg, _ = self.body(key)
+            self._index_values(key, msg, new)
+
+    def update(self, pattern, workers=None, layers=None, header_only=False, index_fields=()):
+        """
+        Index new and changed captures under a directory or glob and drop
+        rows for removed files. index_fields adds field paths to keep in
+        field_values (see add_paths). Returns (indexed, failed, removed).
+        """
+        import msgpack
+
+        from .lazy_decode import HEADER_PATHS
+
+        paths = collect_inputs(pattern)
+        known = {row[0]: (row[1], row[2]) for row in self.db.execute("SELECT path, size, mtime_ns FROM captures")}
+        stats = {}
+        for path in paths:
+            stat = os.stat(path)
+            if known.get(path) != (stat.st_size, stat.st_mtime_ns):
+                stats[path] = (stat.st_size, stat.st_mtime_ns)
+
+        failed = 0
+        settings = batch_settings(layers=layers, fmt="msgpack", paths=HEADER_PATHS if header_only else None)
+        # One transaction: an interrupted update leaves the index as it was.
+        with self.db:
+            self.add_paths(index_fields)
+            value_paths = self.indexed_paths()
+            rows = []
+            for error, serialized, _, _ in iter_batch_lines(list(stats), workers, settings=settings):
+                record = msgpack.unpackb(serialized, raw=False)
+                path = record["source"]
+                size, mtime_ns = stats[path]
+                if error is not None:
+                    failed += 1
+                    rows.append((path, size, mtime_ns, None, None, None, None, None, None, error))
+                    continue
+                msg = record["message_content"]
+                body = msgpack.packb([msg, record["schema_definition"]], use_bin_type=True)
+                key = hashlib.blake2b(body, digest_size=20).hexdigest()
+                cursor = self.db.execute("INSERT OR IGNORE INTO bodies (key, data) VALUES (?, ?)", (key, body))
+                if cursor.rowcount and value_paths:
+                    self._index_values(key, msg, value_paths)
+                header = read_header(msg)
+                rows.append((
+                    path, size, mtime_ns, header["service"], header["method"], header["timestamp"],
+                    timestamp_ms(header["timestamp"]), header["header_9"], key, None,
+                ))
+            self.db.executemany("INSERT OR REPLACE INTO captures VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+            current = set(paths)
+            gone = [(path,) for path in known if path not in current and not os.path.exists(path)]
+            self.db.executemany("DELETE FROM captures WHERE path = ?", gone)
+            self.db.execute("DELETE FROM bodies WHERE key NOT IN (SELECT body_key FROM captures WHERE body_key IS NOT NULL)")
+            self.db.execute("DELETE FROM field_values WHERE body_key NOT IN (SELECT key FROM bodies)")
+        return len(rows), failed, len(gone)
+
+    def body(self, key):
+        """The stored (message, typedef) for a body key."""
+        import msgpack
+
+        (data,) = self.db.execute("SELECT data FROM bodies WHERE key = ?", (key,)).fetchone()
+        msg, typedef = msgpack.unpackb(data, raw=False, strict_map_key=False)
+        return msg, typedef
+
+    def query(self, service=None, method=None, since=None, until=None, where=(), limit=None):
+        """
+        Yield matching rows as dicts, oldest first. service and method may
+        use * and ? wildcards; since/until are milliseconds (until is
+        exclusive); where is (path, value) pairs that all have to match.
+        Header and indexed paths are answered in SQL; rows checked against
+        any other path get "message_content" and "schema_definition"
+        loaded, and every row the SQL selects has its body unpacked.
+        """
+        clauses, params = ["error IS NULL"], []
+        for column, value in (("service", service), ("method", method)):
+            if value is not None:
+                clauses.append(f"{column} GLOB ?" if any(c in value for c in "*?[") else f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            clauses.append("timestamp_ms >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("timestamp_ms < ?")
+            params.append(until)
+        body_filters = []
+        value_paths = self.indexed_paths() if where else ()
+        for path, value in where:
+            column = HEADER_COLUMNS.get(path)
+            if column is not None:
+                clauses.append(f"CAST({column} AS TEXT) = ?")
+                params.append(value)
+            elif path in value_paths:
+                clauses.append("body_key IN (SELECT body_key FROM field_values WHERE path = ? AND value = ?)")
+                params.extend((path, value))
+            else:
+                body_filters.append((path, value))
+
+        sql = f"SELECT * FROM captures WHERE {' AND '.join(clauses)} ORDER BY timestamp_ms, path"
+        if limit is not None and not body_filters:
+            sql += f" LIMIT {int(limit)}"
+        cursor = self.db.execute(sql, params)
+        columns = [d[0] for d in cursor.description]
+        # Identical captures share a body; unpack each one once.
+        bodies = {}
+        count = 0
+        for values in cursor:
+            row = dict(zip(columns, values))
+            if body_filters:
+                key = row["body_key"]
+                if key not in bodies:
+                    bodies[key] = self.body(key)
+                msg, typedef = bodies[key]
+                if not all(any(_matches(v, value) for v in field_values(msg, path)) for path, value in body_filters):
+                    continue
+                row["message_content"], row["schema_definition"] = msg, typedef
+            yield row
+            count += 1
+            if limit is not None and count >= limit:
+                return
+
+
+def _print_row(row, fields, index):
+    when = ""
+    if row["timestamp_ms"] is not None:
+        when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row["timestamp_ms"] / 1000))
+        when += f".{row['timestamp_ms'] % 1000:03d}"
+    line = f"{when:<23}  {row['service'] or '-'}  {row['method'] or '-'}  {row['path']}"
+    if fields:
+        if "message_content" not in row:
+            row["message_content"], row["schema_definition"] = index.body(row["body_key"])
+        for path in fields:
+            values = field_values(row["message_content"], path)
+            shown = ",".join(v.decode("utf-8", "replace") if isinstance(v, bytes) else str(v) for v in values)
+            line += f"  {path}={shown}"
+    print(line)
+
+
+def main():
+    """Main function."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Index decoded captures in SQLite and query them by RPC")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    update = commands.add_parser("update", help="Index new and changed captures; drop removed ones")
+    update.add_argument("index", help="Index database file")
+    update.add_argument("input", help="Directory or glob of captures")
+    update.add_argument("-j", "--workers", type=int, help="Worker processes (default: all cores)")
+    update.add_argument("--layers", help="Comma-separated framing layers to try (default: http,msgpack,gzip)")
+    update.add_argument(
+        "--header-only", action="store_true", help="Decode and store only the RPC header (field 1) of new captures"
+    )
+    update.add_argument(
+        "--index-field",
+        action="append",
+        default=[],
+        metavar="PATH",
+        help="Also index the values of this field path for --where, e.g. 2.1 (repeatable; kept for later updates)",
+    )
+
+    query = commands.add_parser("query", help="List indexed captures")
+    query.add_argument("index", help="Index database file")
+    query.add_argument("--service", help="Service (1.1); * and ? are wildcards")
+    query.add_argument("--method", help="Method (1.7), e.g. Family.GetFamilyBaseInfo; * and ? are wildcards")
+    query.add_argument("--since", type=parse_time, help="Timestamp (1.2) from: ISO date/time (local) or epoch ms")
+    query.add_argument("--until", type=parse_time, help="Timestamp (1.2) before: ISO date/time (local) or epoch ms")
+    query.add_argument(
+        "--where",
+        action="append",
+        default=[],
+        metavar="PATH=VALUE",
+        help=(
+            "Field path that must equal VALUE, e.g. 1.9=2 or 2.1=BlackPlugins (repeatable). Paths other than the"
+            " header and update --index-field ones are checked by unpacking every selected body"
+        ),
+    )
+    query.add_argument("--field", action="append", default=[], metavar="PATH", help="Also print this field path")
+    query.add_argument("--records", action="store_true", help="Write the stored decoded records as JSONL instead")
+    query.add_argument("--count", action="store_true", help="Only print how many captures match")
+    query.add_argument("--limit", type=int, help="Stop after this many matches")
+
+    args = parser.parse_args()
+    if args.command == "update":
+        layers = [name for name in args.layers.split(",") if name] if args.layers else None
+        index = CaptureIndex(args.index)
+        started = time.perf_counter()
+        try:
+            indexed, failed, removed = index.update(
+                args.input, args.workers, layers, args.header_only, args.index_field
+            )
+        except Exception as err:
+            print(f"An error occurred: {err}")
+            sys.exit(1)
+        finally:
+            index.close()
+        print(
+            f"Indexed {indexed} captures ({failed} failed), removed {removed} "
+            f"in {time.perf_counter() - started:.2f}s -> '{args.index}'"
+        )
+        return
+
+    where = []
+    for item in args.where:
+        path, sep, value = item.partition("=")
+        if not sep:
+            parser.error(f"--where expects PATH=VALUE, got {item!r}")
+        where.append((path, value))
+    if not os.path.exists(args.index):
+        parser.error(f"no index at {args.index}; run update first")
+
+    index = CaptureIndex(args.index)
+    rows = index.query(args.service, args.method, args.since, args.until, where, args.limit)
+    try:
+        if args.count:
+            print(sum(1 for _ in rows))
+        elif args.records:
+            from .output_writers import serialize
+
+            out = sys.stdout.buffer
+            for row in rows:
+                if "message_content" not in row:
+                    row["message_content"], row["schema_definition"] = index.body(row["body_key"])
+                record = {
+                    "source": row["path"],
+                    "message_content": row["message_content"],
+                    "schema_definition": row["schema_definition"],
+                }
+                out.write(serialize(record, "jsonl"))
+            out.flush()
+        else:
+            for row in rows:
+                _print_row(row, args.field, index)
+    except BrokenPipeError:
+        sys.stderr.close()
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
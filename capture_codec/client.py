@@ -0,0 +1,180 @@
+"""
+Client for the decode daemon (daemon.py).
+
+    python -m capture_codec.client decode capture1 capture2 ... > out.jsonl
+    python -m capture_codec.client decode < capture > capture.json
+    python -m capture_codec.client encode capture.json > capture.pb
+    python -m capture_codec.client health
+
+Every file goes over one kept-alive connection. Only the standard library
+is imported, so each call starts about as fast as Python itself.
+"""
+
+import json
+import socket
+import sys
+
+DEFAULT_PORT = 8765  # same as daemon.DEFAULT_PORT, without importing the daemon
+
+
+class DaemonError(RuntimeError):
+    """The daemon answered with an error status."""
+
+
+class DaemonClient:
+    """
+    A kept-alive connection to a running daemon.
+
+    Speaks just the HTTP/1.1 the daemon answers with (every response has a
+    Content-Length) over a plain socket; http.client alone takes longer to
+    import than a small capture takes to decode.
+    """
+
+    def __init__(self, socket_path=None, port=DEFAULT_PORT, timeout=60.0):
+        self.socket_path = socket_path
+        self.port = port
+        self.timeout = timeout
+        self.sock = None
+        self.reader = None
+
+    def _connect(self):
+        if self.socket_path:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            address = self.socket_path
+        else:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            address = ("127.0.0.1", self.port)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(address)
+        self.reader = self.sock.makefile("rb")
+
+    def request(self, method, path, body=None):
+        """Send one request. Returns the response body; raises DaemonError on an error status."""
+        if self.sock is None:
+            self._connect()
+        head = f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n"
+        if body is not None:
+            head += f"Content-Type: application/octet-stream\r\nContent-Length: {len(body)}\r\n"
+        self.sock.sendall(head.encode("ascii") + b"\r\n" + (body or b""))
+
+        status_line = self.reader.readline()
+        if not status_line:
+            self.close()
+            raise ConnectionError("The daemon closed the connection")
+        status = int(status_line.split()[1])
+        length, keep_alive = 0, True
+        for line in iter(self.reader.readline, b"\r\n"):
+            if not line:
+                raise ConnectionError("The daemon closed the connection")
+            name, _, value = line.decode("latin-1").partition(":")
+            name = name.strip().lower()
+            if name == "content-length":
+                length = int(value)
+            elif name == "connection" and value.strip().lower() == "close":
+                keep_alive = False
+        data = self.reader.read(length)
+        if not keep_alive:
+            self.close()
+
+        if status != 200:
+            try:
+                message = json.loads(data)["error"]
+            except Exception:
+                message = data.decode("utf-8", "replace")
+            raise DaemonError(f"{status}: {message}")
+        return data
+
+    def decode(self, raw, fmt="json", layers=None):
+        """Decode a raw capture. Returns the serialized record bytes."""
+        path = f"/decode?format={fmt}"
+        if layers:
+            path += f"&layers={layers}"
+        return self.request("POST", path, raw)
+
+    def encode(self, record_json, native=False):
+        """Encode a decoder JSON record (bytes). Returns protobuf bytes."""
+        return self.request("POST", "/encode?native=1" if native else "/encode", record_json)
+
+    def health(self):
+        return json.loads(self.request("GET", "/health"))
+
+    def close(self):
+        if self.sock is not None:
+            self.reader.close()
+            self.sock.close()
+            self.sock = self.reader = None
+
+
+def _read(path):
+    if path == "-":
+        return sys.stdin.buffer.read()
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def main():
+    """Main function."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Send captures to a running decode daemon")
+    where = parser.add_mutually_exclusive_group()
+    where.add_argument("--socket", metavar="PATH", help="Daemon Unix socket")
+    where.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Daemon port on 127.0.0.1 (default: {DEFAULT_PORT})")
+    output = argparse.ArgumentParser(add_help=False)
+    output.add_argument("-o", "--output", help="Output file (default: stdout)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    decode = commands.add_parser("decode", parents=[output], help="Decode captures (stdin if none are given)")
+    decode.add_argument("inputs", nargs="*", default=["-"])
+    decode.add_argument(
+        "--format",
+        choices=("json", "jsonl", "msgpack"),
+        help="Record format (default: json for one input, jsonl for several)",
+    )
+    decode.add_argument("--layers", help="Comma-separated framing layers to try")
+
+    encode = commands.add_parser("encode", parents=[output], help="Encode decoder JSON records (stdin if none are given)")
+    encode.add_argument("inputs", nargs="*", default=["-"])
+    encode.add_argument("--native", action="store_true", help="Encode through compiled google.protobuf classes")
+
+    commands.add_parser("health", parents=[output], help="Print the daemon's counters")
+
+    args = parser.parse_args()
+    client = DaemonClient(args.socket, args.port)
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    failed = 0
+    try:
+        if args.command == "health":
+            out.write(json.dumps(client.health(), indent=2).encode("utf-8") + b"\n")
+            return
+        fmt = getattr(args, "format", None) or ("json" if len(args.inputs) == 1 else "jsonl")
+        for path in args.inputs:
+            try:
+                data = _read(path)
+            except OSError as err:
+                failed += 1
+                print(f"{path}: {err}", file=sys.stderr)
+                continue
+            try:
+                if args.command == "decode":
+                    out.write(client.decode(data, fmt, args.layers))
+                else:
+                    out.write(client.encode(data, args.native))
+            except DaemonError as err:
+                failed += 1
+                print(f"{path}: {err}", file=sys.stderr)
+        out.flush()
+    except (ConnectionError, FileNotFoundError) as err:
+        where = args.socket or f"127.0.0.1:{args.port}"
+        print(f"Error: cannot reach the decode daemon at {where} ({err})", file=sys.stderr)
+        sys.exit(2)
+    finally:
+        client.close()
+        if out is not sys.stdout.buffer:
+            out.close()
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
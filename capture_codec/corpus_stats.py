@@ -0,0 +1,312 @@
+"""
+Aggregate statistics over a capture corpus, without decoding it.
+
+    python -m capture_codec.corpus_stats caps/
+    python -m capture_codec.corpus_stats caps/ --format csv -o stats.csv
+
+Each capture is read once: HTTP framing is stripped, the {IsZip,
+ZipDataLen} envelope is read and removed with strip_msgpack_envelope (a
+bare gzip body is inflated), and the RPC header (field 1) is read off the
+wire for the service and method. The nesting depth comes from walking the
+wire format, not from blackboxprotobuf.
+
+Per service/method the report has the message count, raw capture bytes,
+ZipDataLen bytes, decompressed protobuf bytes, the compression ratio and
+histograms of nesting depth and body size. Results are CorpusStats
+objects that merge, so workers each take a share of the files and the
+parent adds up their partial results.
+"""
+
+import json
+import os
+import sys
+import time
+
+from .lazy_decode import iter_field_spans
+
+# Length-delimited fields are walked as nested messages at most this deep.
+DEPTH_LIMIT = 32
+# Byte sums kept per service/method. The compression ratio is
+# compressed_bytes / inflated_bytes, over the gzipped captures only.
+SIZE_FIELDS = ("raw_bytes", "zip_bytes", "body_bytes", "compressed_bytes", "inflated_bytes")
+CSV_COLUMNS = (
+    "service", "method", "count", "enveloped", "compressed", "raw_bytes", "zip_bytes", "body_bytes",
+    "compression_ratio", "mean_body_bytes", "max_body_bytes", "max_depth", "depth_histogram",
+)
+
+
+def wire_depth(data, start=0, end=None, limit=DEPTH_LIMIT):
+    """
+    Nesting depth of a protobuf message, counted like
+    pipeline_metrics.message_shape: length-delimited fields that parse as
+    messages are nested ones. Now and then blackboxprotobuf keeps such a
+    field as a string, so this can be one deeper than a full decode.
+    Raises ValueError if data is not a message.
+    """
+    end = len(data) if end is None else end
+    deepest = 0
+    if limit > 1:
+        for _, wire_type, _, value_start, field_end in iter_field_spans(data, start, end):
+            if wire_type != 2 or value_start == field_end:
+                continue
+            try:
+                deepest = max(deepest, wire_depth(data, value_start, field_end, limit - 1))
+            except (ValueError, IndexError):
+                # A string or bytes value.
+                pass
+    else:
+        # Still has to be a message to count as this level.
+        for _ in iter_field_spans(data, start, end):
+            pass
+    return deepest + 1
+
+
+def size_bucket(size):
+    """Power-of-two bucket label for a byte count: "<=1k", "<=2k", ..."""
+    bucket = 1 << max(size - 1, 0).bit_length()
+    if bucket < 1024:
+        return f"<={bucket}"
+    if bucket < 1024 * 1024:
+        return f"<={bucket // 1024}k"
+    return f"<={bucket // (1024 * 1024)}M"
+
+
+def capture_stats(raw):
+    """
+    Sizes, envelope and header of one raw capture. Returns a dict with
+    service, method, raw_bytes, zip_bytes (None without an envelope),
+    compressed_bytes (None unless the payload was gzipped), body_bytes and
+    depth (None if the body is not a message).
+    """
+    from .decoder import gzip_layer, read_envelope, strip_http_framing, strip_msgpack_envelope
+    from .typedef_registry import read_rpc_header
+
+    buf = strip_http_framing(raw)
+    try:
+        header = read_envelope(buf)
+    except RuntimeError:
+        header = None
+    envelope = header[0] if header else None
+    body = strip_msgpack_envelope(buf)
+    compressed = envelope["ZipDataLen"] if envelope is not None and envelope.get("IsZip") else None
+    if body is buf:
+        body = gzip_layer(buf)
+        if body is None:
+            body = buf
+        else:
+            compressed = len(buf)
+
+    try:
+        depth = wire_depth(body)
+    except (ValueError, IndexError):
+        depth = None
+    service, method = read_rpc_header(body) if depth is not None else (None, None)
+    return {
+        "service": service or "",
+        "method": method or "",
+        "raw_bytes": len(raw),
+        "zip_bytes": envelope["ZipDataLen"] if envelope is not None else None,
+        "compressed_bytes": compressed,
+        "body_bytes": len(body),
+        "depth": depth,
+    }
+
+
+class CorpusStats:
+    """Per service/method totals and histograms; add captures, merge partials."""
+
+    def __init__(self):
+        # "service/method" -> totals
+        self.methods = {}
+        self.captures = 0
+        self.errors = 0
+        self.error_samples = []
+
+    def _entry(self, service, method):
+        key = f"{service}/{method}"
+        entry = self.methods.get(key)
+        if entry is None:
+            entry = self.methods[key] = {
+                "service": service,
+                "method": method,
+                "count": 0,
+                "enveloped": 0,
+                "compressed": 0,
+                "not_protobuf": 0,
+                **{name: 0 for name in SIZE_FIELDS},
+                "max_body_bytes": 0,
+                "depth_histogram": {},
+                "size_histogram": {},
+            }
+        return entry
+
+    def add(self, row):
+        """Count one capture_stats() row."""
+        self.captures += 1
+        entry = self._entry(row["service"], row["method"])
+        entry["count"] += 1
+        entry["raw_bytes"] += row["raw_bytes"]
+        entry["body_bytes"] += row["body_bytes"]
+        entry["max_body_bytes"] = max(entry["max_body_bytes"], row["body_bytes"])
+        if row["zip_bytes"] is not None:
+            entry["enveloped"] += 1
+            entry["zip_bytes"] += row["zip_bytes"]
+        if row["compressed_bytes"] is not None:
+            entry["compressed"] += 1
+            entry["compressed_bytes"] += row["compressed_bytes"]
+            entry["inflated_bytes"] += row["body_bytes"]
+        if row["depth"] is None:
+            entry["not_protobuf"] += 1
+        else:
+            depth = str(row["depth"])
+            entry["depth_histogram"][depth] = entry["depth_histogram"].get(depth, 0) + 1
+        bucket = size_bucket(row["body_bytes"])
+        entry["size_histogram"][bucket] = entry["size_histogram"].get(bucket, 0) + 1
+
+    def add_error(self, source, error):
+        self.errors += 1
+        if len(self.error_samples) < 10:
+            self.error_samples.append({"source": source, "error": error})
+
+    def merge(self, other):
+        """Add another CorpusStats (e.g. a worker's share) into this one."""
+        self.captures += other.captures
+        self.errors += other.errors
+        self.error_samples = (self.error_samples + other.error_samples)[:10]
+        for theirs in other.methods.values():
+            entry = self._entry(theirs["service"], theirs["method"])
+            for name in ("count", "enveloped", "compressed", "not_protobuf", *SIZE_FIELDS):
+                entry[name] += theirs[name]
+            entry["max_body_bytes"] = max(entry["max_body_bytes"], theirs["max_body_bytes"])
+            for histogram in ("depth_histogram", "size_histogram"):
+                for bucket, count in theirs[histogram].items():
+                    entry[histogram][bucket] = entry[histogram].get(bucket, 0) + count
+        return self
+
+    def rows(self):
+        """One summary dict per service/method, largest decompressed volume first."""
+        rows = []
+        for entry in self.methods.values():
+            row = dict(entry)
+            inflated = entry["inflated_bytes"]
+            row["compression_ratio"] = entry["compressed_bytes"] / inflated if inflated else None
+            row["mean_body_bytes"] = entry["body_bytes"] / entry["count"]
+            depths = [int(depth) for depth in entry["depth_histogram"]]
+            row["max_depth"] = max(depths) if depths else None
+            row["depth_histogram"] = dict(sorted(entry["depth_histogram"].items(), key=lambda item: int(item[0])))
+            rows.append(row)
+        rows.sort(key=lambda row: (-row["body_bytes"], row["service"], row["method"]))
+        return rows
+
+    def to_dict(self):
+        totals = {name: sum(entry[name] for entry in self.methods.values()) for name in SIZE_FIELDS}
+        return {
+            "captures": self.captures,
+            "errors": self.errors,
+            "error_samples": self.error_samples,
+            "totals": totals,
+            "methods": self.rows(),
+        }
+
+    def write_json(self, f):
+        json.dump(self.to_dict(), f, indent=2)
+        f.write("\n")
+
+    def write_csv(self, f):
+        import csv
+
+        writer = csv.writer(f)
+        writer.writerow(CSV_COLUMNS)
+        for row in self.rows():
+            row["depth_histogram"] = " ".join(f"{depth}:{count}" for depth, count in row["depth_histogram"].items())
+            if row["compression_ratio"] is not None:
+                row["compression_ratio"] = round(row["compression_ratio"], 4)
+            row["mean_body_bytes"] = round(row["mean_body_bytes"], 1)
+            writer.writerow([row[column] for column in CSV_COLUMNS])
+
+    def print_report(self, top=20, file=None):
+        print(f"{self.captures} captures, {self.errors} unreadable", file=file)
+        print(f"  {'count':>7} {'raw MB':>9} {'zip MB':>9} {'body MB':>9} {'ratio':>6} {'depth':>5}  service/method", file=file)
+        for row in self.rows()[:top]:
+            ratio = f"{row['compression_ratio']:.2f}" if row["compression_ratio"] is not None else "-"
+            name = "/".join(part for part in (row["service"], row["method"]) if part) or "(no header)"
+            print(
+                f"  {row['count']:>7} {row['raw_bytes'] / 1e6:>9.3f} {row['zip_bytes'] / 1e6:>9.3f} "
+                f"{row['body_bytes'] / 1e6:>9.3f} {ratio:>6} {row['max_depth'] or '-':>5}  {name}",
+                file=file,
+            )
+
+
+def stats_for_paths(paths):
+    """A CorpusStats over some capture files (one worker's share)."""
+    from .decoder import open_capture
+
+    stats = CorpusStats()
+    for path in paths:
+        try:
+            with open_capture(path) as raw:
+                stats.add(capture_stats(raw))
+        except Exception as err:
+            stats.add_error(path, str(err))
+    return stats
+
+
+def corpus_stats(pattern, workers=None, chunk_size=64):
+    """Statistics for every capture under a directory or glob, across a process pool."""
+    from .decoder import collect_inputs
+
+    paths = collect_inputs(pattern)
+    if not paths:
+        raise FileNotFoundError(pattern)
+    chunks = [paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size)]
+    if workers == 1 or len(chunks) == 1:
+        return _merge(map(stats_for_paths, chunks))
+
+    from multiprocessing import Pool
+
+    with Pool(workers or os.cpu_count()) as pool:
+        return _merge(pool.imap_unordered(stats_for_paths, chunks))
+
+
+def _merge(partials):
+    total = CorpusStats()
+    for partial in partials:
+        total.merge(partial)
+    return total
+
+
+def main():
+    """Main function."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Per-method volume, size and compression statistics for a capture corpus")
+    parser.add_argument("input", help="Directory or glob of captures")
+    parser.add_argument("-j", "--workers", type=int, help="Worker processes (default: all cores)")
+    parser.add_argument("--format", choices=("text", "json", "csv"), default="text", help="Report format (default: text)")
+    parser.add_argument("-o", "--output", help="Write the report here instead of stdout")
+    parser.add_argument("--top", type=int, default=20, help="Methods listed in the text report (default: 20)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    try:
+        stats = corpus_stats(args.input, args.workers)
+    except FileNotFoundError:
+        print(f"Error: no captures match '{args.input}'", file=sys.stderr)
+        sys.exit(1)
+
+    out = open(args.output, "w", encoding="utf-8", newline="") if args.output else sys.stdout
+    try:
+        if args.format == "json":
+            stats.write_json(out)
+        elif args.format == "csv":
+            stats.write_csv(out)
+        else:
+            stats.print_report(args.top, out)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"{stats.captures} captures in {time.perf_counter() - started:.2f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""
+Long-running decode service on a Unix socket or localhost port.
+
+Keeps the interpreter, blackboxprotobuf, the typedef registry and the
+compiled encode plans warm between requests, so tooling that decodes one
+capture at a time does not pay process startup and schema inference on
+every call. Talk to it with client.py (python -m capture_codec.client).
+
+    POST /decode?format=json|jsonl|msgpack&layers=http,msgpack,gzip
+         body: raw capture            -> the serialized record
+    POST /encode?native=1
+         body: decoder JSON record    -> protobuf bytes
+    GET  /health                      -> counters as JSON
+
+Errors come back as {"success": false, "error": ...} with a 4xx/5xx status.
+At most --max-concurrent requests are decoded at once; the rest wait up
+to --queue-timeout seconds and then get 503.
+"""
+
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+from urllib.parse import parse_qs, urlsplit
+
+from . import decoder
+from .encoder import PlanCache
+from .output_writers import serialize
+
+DEFAULT_PORT = 8765
+MAX_CONCURRENT = 4
+QUEUE_TIMEOUT = 30.0
+# Captures larger than this are refused with 413.
+MAX_CAPTURE_SIZE = 64 * 1024 * 1024
+# Learned typedefs are written back at most this often (and on shutdown).
+SAVE_INTERVAL = 30.0
+
+CONTENT_TYPES = {
+    "json": "application/json",
+    "jsonl": "application/x-ndjson",
+    "msgpack": "application/msgpack",
+}
+
+
+class RequestError(Exception):
+    """A request the service refuses; carries the HTTP status to answer with."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class DecodeService:
+    """The warm state shared by every request: registry, plans and limits."""
+
+    def __init__(self, registry_path=None, native=False, layers=None,
+                 max_concurrent=MAX_CONCURRENT, queue_timeout=QUEUE_TIMEOUT, cache=None):
+        self.registry = None
+        if registry_path:
+            from .typedef_registry import TypedefRegistry
+
+            self.registry = TypedefRegistry(registry_path, native)
+        self.layers = layers
+        # A decode_cache.DecodeCache; only used without a registry.
+        self.cache = cache
+        self.plans = {False: PlanCache(False), True: PlanCache(True)}
+        self.slots = threading.BoundedSemaphore(max_concurrent)
+        self.queue_timeout = queue_timeout
+        # Counters and plan caches are shared dicts.
+        self.state_lock = threading.Lock()
+        # The registry learns while decoding, so registry decodes take turns;
+        # without one, decoding shares no state.
+        self.registry_lock = threading.Lock() if self.registry is not None else nullcontext()
+        self.started = time.time()
+        self.last_save = time.monotonic()
+        self.counters = {"decoded": 0, "encoded": 0, "failed": 0, "rejected": 0, "in_flight": 0}
+
+    def _count(self, name, delta=1):
+        with self.state_lock:
+            self.counters[name] += delta
+
+    def run(self, func, *args):
+        """Run func under the concurrency limit, counting the outcome."""
+        if not self.slots.acquire(timeout=self.queue_timeout):
+            self._count("rejected")
+            raise RequestError(503, f"Busy: no decode slot within {self.queue_timeout}s")
+        self._count("in_flight")
+        try:
+            return func(*args)
+        except RequestError:
+            self._count("failed")
+            raise
+        except Exception as err:
+            self._count("failed")
+            raise RequestError(400, str(err))
+        finally:
+            self._count("in_flight", -1)
+            self.slots.release()
+
+    def decode(self, raw, fmt="json", layers=None):
+        """Decode one capture and serialize it. Returns bytes."""
+        if fmt not in CONTENT_TYPES:
+            raise RequestError(400, f"Unsupported format {fmt!r} (use {', '.join(CONTENT_TYPES)})")
+        with self.registry_lock:
+            msg, typedef = decoder.decode_capture(raw, self.registry, layers or self.layers, None, self.cache)
+            self._maybe_save()
+        self._count("decoded")
+        return serialize({"message_content": msg, "schema_definition": typedef}, fmt)
+
+    def encode(self, body, native=False):
+        """Encode a decoder JSON record. Returns the protobuf bytes."""
+        record = json.loads(body)
+        if "message_content" not in record or "schema_definition" not in record:
+            raise RequestError(400, "Expected a record with message_content and schema_definition")
+        with self.state_lock:
+            plan = self.plans[native].get(record["schema_definition"])
+            self.counters["encoded"] += 1
+        return plan.encode(record["message_content"])
+
+    def health(self):
+        with self.registry_lock:
+            registry_methods = len(self.registry) if self.registry is not None else None
+        with self.state_lock:
+            return {
+                "success": True,
+                "pid": os.getpid(),
+                "uptime_seconds": round(time.time() - self.started, 1),
+                "registry_methods": registry_methods,
+                "encode_plans": sum(len(cache.plans) for cache in self.plans.values()),
+                "cache_hits": self.cache.hits if self.cache is not None else None,
+                "cache_misses": self.cache.misses if self.cache is not None else None,
+                **self.counters,
+            }
+
+    def _maybe_save(self):
+        # Called with registry_lock held.
+        if self.registry is not None and time.monotonic() - self.last_save >= SAVE_INTERVAL:
+            self.registry.save()
+            self.last_save = time.monotonic()
+
+    def close(self):
+        if self.registry is not None:
+            with self.registry_lock:
+                self.registry.save()
+
+
+class DecodeHandler(BaseHTTPRequestHandler):
+    """Routes requests to the server's DecodeService."""
+
+    # Keep-alive, so a client can send many captures over one connection.
+    protocol_version = "HTTP/1.1"
+    server_version = "capture-codec"
+
+    def address_string(self):
+        # Unix socket peers have no address.
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, data):
+        self._send(status, json.dumps(data).encode("utf-8"), "application/json")
+
+    def _read_body(self):
+        header = self.headers.get("Content-Length")
+        try:
+            length = None if header is None else int(header)
+        except ValueError:
+            length = -1
+        if length is None or length < 0 or length > MAX_CAPTURE_SIZE:
+            # The body is not read, so the connection cannot be reused.
+            self.close_connection = True
+            if length is None:
+                raise RequestError(411, "Content-Length required")
+            if length < 0:
+                raise RequestError(400, f"Invalid Content-Length {header!r}")
+            raise RequestError(413, f"Request body over {MAX_CAPTURE_SIZE} bytes")
+        return self.rfile.read(length)
+
+    def do_GET(self):
+        if urlsplit(self.path).path == "/health":
+            self._send_json(200, self.server.service.health())
+        else:
+            self._send_json(404, {"success": False, "error": f"No route {self.path}"})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        service = self.server.service
+        try:
+            body = self._read_body()
+            if url.path == "/decode":
+                fmt = query.get("format", "json")
+                layers = [name for name in query["layers"].split(",") if name] if query.get("layers") else None
+                if layers and any(name not in decoder.LAYERS for name in layers):
+                    raise RequestError(400, f"Unknown layers in {query['layers']!r}")
+                result = service.run(service.decode, body, fmt, layers)
+                self._send(200, result, CONTENT_TYPES[fmt])
+            elif url.path == "/encode":
+                native = query.get("native", "0") not in ("", "0", "false")
+                result = service.run(service.encode, body, native)
+                self._send(200, result, "application/x-protobuf")
+            else:
+                raise RequestError(404, f"No route {url.path}")
+        except RequestError as err:
+            self._send_json(err.status, {"success": False, "error": str(err)})
+
+
+class LocalHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Bursts of clients queue in the kernel instead of being refused; the
+    # concurrency limit applies once a request is read.
+    request_queue_size = 128
+
+
+class UnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def make_server(service, socket_path=None, port=DEFAULT_PORT, verbose=False):
+    """A threaded HTTP server for service on a Unix socket, or on 127.0.0.1:port."""
+    if socket_path:
+        if os.path.exists(socket_path):
+            # A stale socket from a previous run; refuse if something answers.
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(socket_path)
+            except OSError:
+                os.unlink(socket_path)
+            else:
+                raise RuntimeError(f"Another daemon is already listening on {socket_path}")
+            finally:
+                probe.close()
+        server = UnixHTTPServer(socket_path, DecodeHandler)
+    else:
+        server = LocalHTTPServer(("127.0.0.1", port), DecodeHandler)
+    server.service = service
+    server.verbose = verbose
+    return server
+
+
+def main():
+    """Main function."""
+    import argparse
+    import signal
+
+    parser = argparse.ArgumentParser(description="Warm decode daemon for captures")
+    where = parser.add_mutually_exclusive_group()
+    where.add_argument("--socket", metavar="PATH", help="Listen on this Unix socket")
+    where.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Listen on 127.0.0.1:PORT (default: {DEFAULT_PORT})")
+    parser.add_argument("--registry", metavar="PATH", help="Typedef registry to decode known RPCs with and keep learning into")
+    parser.add_argument("--native", action="store_true", help="With --registry, decode known methods through compiled google.protobuf classes")
+    parser.add_argument("--layers", help="Default comma-separated framing layers (default: http,msgpack,gzip)")
+    parser.add_argument("--cache", metavar="DIR", help="Decode cache directory (not used with --registry)")
+    parser.add_argument("--cache-size", type=int, help="Byte budget of the decode cache (default: 256 MiB)")
+    parser.add_argument("--max-concurrent", type=int, default=MAX_CONCURRENT, help=f"Requests decoded at once (default: {MAX_CONCURRENT})")
+    parser.add_argument(
+        "--queue-timeout",
+        type=float,
+        default=QUEUE_TIMEOUT,
+        help=f"Seconds a request waits for a slot before 503 (default: {QUEUE_TIMEOUT:g})",
+    )
+    parser.add_argument("-v", "--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+    if args.native and not args.registry:
+        parser.error("--native needs --registry")
+    if args.cache and args.registry:
+        parser.error("--cache is not used with --registry")
+
+    layers = [name for name in args.layers.split(",") if name] if args.layers else None
+    cache = None
+    if args.cache:
+        from .decode_cache import MAX_CACHE_BYTES, DecodeCache
+
+        cache = DecodeCache(args.cache, args.cache_size or MAX_CACHE_BYTES)
+    service = DecodeService(args.registry, args.native, layers, args.max_concurrent, args.queue_timeout, cache)
+    try:
+        server = make_server(service, args.socket, args.port, args.verbose)
+    except (RuntimeError, OSError) as err:
+        print(f"Error: {err}", file=sys.stderr)
+        sys.exit(1)
+    # Stop cleanly on SIGTERM too, so learned typedefs are saved.
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+
+    where = args.socket or f"http://127.0.0.1:{args.port}"
+    print(f"Decode daemon listening on {where} (pid {os.getpid()}, {args.max_concurrent} concurrent)", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if args.socket and os.path.exists(args.socket):
+            os.unlink(args.socket)
+        print("Decode daemon stopped", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Content-addressed on-disk cache of decoded captures.
+
+An entry is keyed by a hash of the raw capture bytes, the framing layers
+it was decoded with, the speculation and gunzip limits in force and the
+decoder version, and holds the decoded
+(message, typedef) as msgpack, which keeps bytes and str apart and loads
+far faster than blackboxprotobuf infers a message. Entries live under
+<directory>/<2 hex>/<hash>; a hit touches the file's mtime, and once the
+directory grows past its byte budget the least recently used entries
+are deleted.
+
+Captures decoded through a typedef registry are not cached: their result
+depends on what the registry had learned at the time.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+
+from . import gunzip_stream, speculation
+
+# Bump whenever decoding produces different messages or typedefs for the
+# same bytes, so old entries stop matching.
+CACHE_VERSION = 1
+# Default byte budget of a cache directory.
+MAX_CACHE_BYTES = 256 * 1024 * 1024
+
+_decoder_version = None
+
+
+def decoder_version():
+    """
+    CACHE_VERSION plus the installed blackboxprotobuf, identified by its
+    location and modification time (reading its package metadata costs more
+    than a cache hit saves on a small capture).
+    """
+    global _decoder_version
+    if _decoder_version is None:
+        from importlib.util import find_spec
+
+        spec = find_spec("blackboxprotobuf")
+        origin = spec.origin if spec is not None else None
+        mtime = os.stat(origin).st_mtime_ns if origin else 0
+        _decoder_version = f"{CACHE_VERSION}:{origin}:{mtime}".encode("utf-8")
+    return _decoder_version
+
+
+def decode_limits():
+    """
+    The limits that change what a capture decodes to: the speculation
+    limits (size, depth, budget) and the gunzip output and ratio limits.
+    """
+    size, depth, budget, _ = speculation.get_limits()
+    limits = (size, depth, budget, gunzip_stream.MAX_OUTPUT_SIZE, gunzip_stream.MAX_EXPANSION_RATIO)
+    return repr(limits).encode("utf-8")
+
+
+class DecodeCache:
+    """A directory of decoded captures with an LRU byte budget."""
+
+    def __init__(self, directory, max_bytes=MAX_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # Bytes on disk, counted on the first put() and kept up to date after.
+        self.size = None
+        # Daemon threads share one cache; this keeps size in step with the disk.
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, raw, layers=None):
+        """The hex key for a raw capture decoded with the given layers."""
+        digest = hashlib.blake2b(raw, digest_size=20, person=b"capture-codec")
+        digest.update(b"\0" + decoder_version())
+        digest.update(b"\0" + ",".join(layers or ()).encode("utf-8"))
+        digest.update(b"\0" + decode_limits())
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key):
+        """Return the cached (message, typedef) for key, or None."""
+        import msgpack
+
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            self.misses += 1
+            return None
+        try:
+            msg, typedef = msgpack.unpackb(data, raw=False, strict_map_key=False)
+        except Exception:
+            # A truncated or foreign file; decode again and overwrite it.
+            self.misses += 1
+            return None
+        self.hits += 1
+        return msg, typedef
+
+    def put(self, key, msg, typedef):
+        """Store a decoded capture, evicting old entries if over budget."""
+        import msgpack
+
+        data = msgpack.packb([msg, typedef], use_bin_type=True)
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written aside under a name no other process or thread uses and
+        # renamed, so concurrent readers (batch workers, the daemon) never
+        # see half an entry.
+        fd, tmp = tempfile.mkstemp(suffix=".tmp", prefix=f"{key}.", dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            with self._lock:
+                try:
+                    replaced = os.stat(path).st_size
+                except FileNotFoundError:
+                    replaced = 0
+                os.replace(tmp, path)
+                if self.size is None:
+                    self.size = sum(size for _, size, _ in self._entries())
+                else:
+                    # An overwritten entry's bytes are already counted.
+                    self.size += len(data) - replaced
+                if self.size > self.max_bytes:
+                    self.trim()
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def _entries(self):
+        """Yield (mtime, size, path) for every entry on disk."""
+        try:
+            buckets = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return
+        for bucket in buckets:
+            if not bucket.is_dir():
+                continue
+            for entry in os.scandir(bucket.path):
+                if entry.name.endswith(".tmp"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                yield stat.st_mtime_ns, stat.st_size, entry.path
+
+    def trim(self, max_bytes=None):
+        """
+        Delete the least recently used entries until the directory fits in
+        max_bytes (the cache's budget by default). Returns how many went.
+        """
+        budget = self.max_bytes if max_bytes is None else max_bytes
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in entries:
+            if total <= budget:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                # Another process evicted it first.
+                pass
+            total -= size
+            removed += 1
+        self.size = total
+        return removed
@@ -0,0 +1,884 @@
+import os
+import re
+import sys
+import time
+from contextlib import contextmanager
+
+# blackboxprotobuf, msgpack, multiprocessing and the typedef registry are
+# imported by the stages that use them, so importing this module (or running
+# the CLI on a raw protobuf capture) does not pay for all of them.
+from . import gunzip_stream
+from .gunzip_stream import DecompressionError, gunzip
+from .http_stream import iter_responses, read_response
+from .output_writers import FORMATS, RecordWriter, serialize
+from .pipeline_metrics import trace_row
+
+# 1. SETUP: Define your input file and output file
+INPUT_FILE = "test"  # The file you uploaded
+OUTPUT_FILE = "test.json"
+
+# How much of the stream to read at a time when walking concatenated frames.
+FRAME_READ_SIZE = 64 * 1024
+# The {IsZip, ZipDataLen} map is a few dozen bytes; anything larger than this
+# is not an envelope we know how to frame.
+ENVELOPE_MAX_SIZE = 256
+# Files at least this large are mmap'd instead of read into memory.
+MMAP_MIN_SIZE = 1024 * 1024
+
+# The framing stages run on memoryview slices, which have no find(); the re
+# module searches any buffer without copying it.
+GZIP_MAGIC_RE = re.compile(re.escape(b"\x1f\x8b\x08"))
+# gzip magic is only looked for this far into a payload.
+GZIP_SNIFF_WINDOW = 16
+
+# Progress messages are printed by the CLI; library callers and batch
+# workers stay quiet.
+VERBOSE = False
+
+def log(message):
+    """Print a progress message unless running quietly."""
+    if VERBOSE:
+        print(message)
+
+def strip_msgpack_envelope(blob: bytes) -> bytes:
+    """
+    Some captures arrive as a msgpack map that advertises whether the payload
+    is zipped and its length. If detected, remove the envelope and optionally
+    decompress the payload.
+    Accepts bytes or a memoryview; an uncompressed payload is returned as a
+    slice of the input rather than a copy.
+    """
+    import msgpack
+
+    try:
+        # The envelope is tiny, so only its first bytes are fed to msgpack
+        # instead of copying the whole capture into the unpacker.
+        unpacker = msgpack.Unpacker()
+        unpacker.feed(blob[:ENVELOPE_MAX_SIZE])
+        envelope = next(unpacker)
+    except Exception:
+        return blob
+
+    if isinstance(envelope, dict) and {"IsZip", "ZipDataLen"} <= set(envelope.keys()):
+        payload_start = unpacker.tell()
+        payload = memoryview(blob)[payload_start:]
+        log(
+            f"Detected msgpack envelope (IsZip={envelope['IsZip']}, "
+            f"ZipDataLen={envelope['ZipDataLen']}), stripping..."
+        )
+
+        zip_len = envelope["ZipDataLen"] or None
+        if zip_len and zip_len != len(payload):
+            if envelope.get("IsZip"):
+                # Truncated or padded: don't bother inflating a frame we know is bad.
+                raise DecompressionError(
+                    f"Envelope length={zip_len} but {len(payload)} bytes remain"
+                )
+            print(
+                f"Warning: envelope length={envelope['ZipDataLen']} "
+                f"but {len(payload)} bytes remain",
+                file=sys.stderr,
+            )
+
+        if envelope.get("IsZip"):
+            try:
+                payload = gunzip(payload, zip_len)
+            except DecompressionError as err:
+                raise DecompressionError(f"Envelope indicates zip but failed to decompress: {err}")
+
+        return payload
+
+    return blob
+
+def strip_http_framing(raw_data: bytes) -> bytes:
+    """
+    Some captures are full HTTP responses (status line + headers + body).
+    If so, strip the headers so we only decode the protobuf payload.
+    Chunked bodies are de-chunked and Content-Encoding is undone; a plain
+    body is returned as a memoryview slice of the input.
+    """
+    if bytes(raw_data[:5]) != b"HTTP/":
+        return raw_data
+
+    log("Detected HTTP response framing, stripping headers...")
+    _, _, body, _ = read_response(raw_data)
+    return body
+
+def decode_body(data: bytes, registry=None, paths=None):
+    """
+    Decode a protobuf body into (message, typedef), using the typedef stored
+    for its RPC when a registry is given instead of inferring every field.
+    With paths (e.g. ["1"] or ["1.7", "3.2"]) only those fields are decoded
+    and the rest of the body is skipped; see lazy_decode.py. The registry
+    then only lends its typedef and learns nothing.
+    """
+    # blackboxprotobuf needs real bytes; this is a no-op if data already is.
+    data = bytes(data)
+    if paths is not None:
+        from .lazy_decode import decode_paths
+        from .typedef_registry import read_rpc_header
+
+        typedef = registry.get(*read_rpc_header(data)) if registry is not None else None
+        return decode_paths(data, paths, typedef)
+    if registry is not None:
+        return registry.decode(data)
+    from .speculation import decode_message
+
+    return decode_message(data)
+
+def _http_layer(buf):
+    if bytes(buf[:5]) != b"HTTP/":
+        return None
+    return strip_http_framing(buf)
+
+def _msgpack_layer(buf):
+    # Envelopes are small maps: fixmap (0x80-0x8f) or map16 (0xde).
+    if not buf or not (0x80 <= buf[0] <= 0x8F or buf[0] == 0xDE):
+        return None
+    payload = strip_msgpack_envelope(buf)
+    return None if payload is buf else payload
+
+def gzip_layer(buf):
+    """
+    Inflate a gzip payload at (or a few bytes after) the start of buf.
+    Returns None if there is none.
+    """
+    # Some captures arrive as a small wrapper with a gzip blob inside, so the
+    # magic is looked for in the first few bytes only, never the whole body.
+    magic = GZIP_MAGIC_RE.search(buf, 0, GZIP_SNIFF_WINDOW)
+    if magic is None:
+        return None
+    magic_pos = magic.start()
+    log(f"Detected gzip payload at offset {magic_pos}, decompressing...")
+    try:
+        return gunzip(memoryview(buf)[magic_pos:])
+    except DecompressionError as gzip_err:
+        if magic_pos:
+            # Magic bytes inside a wrapper may just be protobuf data.
+            log(f"Not a gzip payload after all ({gzip_err}), passing")
+            return None
+        raise DecompressionError(f"Gzip found but failed to decompress: {gzip_err}")
+
+# Layer name -> function that returns the unwrapped buffer, or None to pass.
+# Each one looks at a fixed-size header before touching the rest of the buffer.
+LAYERS = {
+    "http": _http_layer,
+    "msgpack": _msgpack_layer,
+    "gzip": gzip_layer,
+}
+# Layers run in this order unless a capture source needs a different one.
+DEFAULT_LAYERS = ["http", "msgpack", "gzip"]
+
+def register_layer(name, func):
+    """Add a framing layer; func(buf) returns the unwrapped buffer or None to pass."""
+    LAYERS[name] = func
+
+def run_layers(buf, layers=None, trace=None):
+    """
+    Peel framing layers off a capture before the protobuf stage.
+    Each layer in order either claims the buffer and unwraps it or passes.
+    If trace is a list, one dict per layer is appended with whether it
+    claimed the buffer, how long it took and the sizes in and out.
+    """
+    for name in layers or DEFAULT_LAYERS:
+        started = time.perf_counter()
+        result = LAYERS[name](buf)
+        if trace is not None:
+            trace.append({
+                "layer": name,
+                "claimed": result is not None,
+                "seconds": time.perf_counter() - started,
+                "bytes_in": len(buf),
+                "bytes_out": len(buf if result is None else result),
+            })
+        if result is not None:
+            buf = result
+    return buf
+
+def read_envelope(buf):
+    """
+    Parse the {IsZip, ZipDataLen} map at the start of buf.
+    Returns (envelope, header_length), or None if buf is too short to tell.
+    """
+    import msgpack
+
+    unpacker = msgpack.Unpacker()
+    unpacker.feed(bytes(buf[:ENVELOPE_MAX_SIZE]))
+    try:
+        envelope = unpacker.unpack()
+    except msgpack.OutOfData:
+        if len(buf) >= ENVELOPE_MAX_SIZE:
+            raise RuntimeError(f"No msgpack envelope within {ENVELOPE_MAX_SIZE} bytes")
+        return None
+    except Exception as err:
+        raise RuntimeError(f"Invalid msgpack envelope: {err}")
+
+    if not (isinstance(envelope, dict) and {"IsZip", "ZipDataLen"} <= set(envelope.keys())):
+        raise RuntimeError(f"Expected an {{IsZip, ZipDataLen}} envelope, got {envelope!r}")
+    if not envelope["ZipDataLen"]:
+        raise RuntimeError("Envelope has no ZipDataLen, cannot find the end of the frame")
+    return envelope, unpacker.tell()
+
+def iter_frames(stream, read_size=FRAME_READ_SIZE):
+    """
+    Walk a binary stream of back-to-back msgpack-enveloped frames.
+    Yields (offset, envelope, payload) for each frame, where payload is the
+    raw ZipDataLen bytes after the envelope. Only the current frame plus one
+    read is held in memory at a time.
+    """
+    buf = bytearray()
+    offset = 0
+    eof = False
+
+    def fill():
+        nonlocal eof
+        chunk = stream.read(read_size)
+        if chunk:
+            buf.extend(chunk)
+        else:
+            eof = True
+
+    while True:
+        if not buf:
+            fill()
+            if eof:
+                return
+
+        header = read_envelope(buf)
+        while header is None:
+            if eof:
+                raise RuntimeError(f"Truncated msgpack envelope at offset {offset}")
+            fill()
+            header = read_envelope(buf)
+
+        envelope, header_len = header
+        frame_len = header_len + envelope["ZipDataLen"]
+        while len(buf) < frame_len:
+            if eof:
+                raise RuntimeError(
+                    f"Truncated frame at offset {offset}: envelope length="
+                    f"{envelope['ZipDataLen']} but {len(buf) - header_len} bytes remain"
+                )
+            fill()
+
+        payload = bytes(buf[header_len:frame_len])
+        del buf[:frame_len]
+        yield offset, envelope, payload
+        offset += frame_len
+
+def iter_buffer_frames(buf):
+    """
+    Like iter_frames, but over a buffer that is already addressable (bytes or
+    an mmap'd file). Payloads are memoryview slices, so nothing is copied.
+    """
+    view = memoryview(buf)
+    offset = 0
+    while offset < len(view):
+        header = read_envelope(view[offset:offset + ENVELOPE_MAX_SIZE])
+        if header is None:
+            raise RuntimeError(f"Truncated msgpack envelope at offset {offset}")
+
+        envelope, header_len = header
+        start = offset + header_len
+        end = start + envelope["ZipDataLen"]
+        if end > len(view):
+            raise RuntimeError(
+                f"Truncated frame at offset {offset}: envelope length="
+                f"{envelope['ZipDataLen']} but {len(view) - start} bytes remain"
+            )
+        yield offset, envelope, view[start:end]
+        offset = end
+
+def _metrics_row(trace, msg, label):
+    """trace_row plus the speculative-parse counts of the message just decoded."""
+    from . import speculation
+
+    row = trace_row(trace, msg, label)
+    if speculation.active():
+        row["speculation"] = speculation.reset_counts()
+    return row
+
+def _trace_step(trace, layer, started, bytes_in, bytes_out):
+    if trace is not None:
+        trace.append({
+            "layer": layer,
+            "claimed": True,
+            "seconds": time.perf_counter() - started,
+            "bytes_in": bytes_in,
+            "bytes_out": bytes_out,
+        })
+
+def _decode_frames(frames, registry=None, metrics=None):
+    for offset, envelope, payload in frames:
+        trace = [] if metrics is not None else None
+        if envelope.get("IsZip"):
+            started = time.perf_counter()
+            try:
+                payload = gunzip(payload, envelope["ZipDataLen"])
+            except DecompressionError as err:
+                raise DecompressionError(
+                    f"Frame at offset {offset} indicates zip but failed to decompress: {err}"
+                )
+            _trace_step(trace, "gzip", started, envelope["ZipDataLen"], len(payload))
+        started = time.perf_counter()
+        msg, typedef = decode_body(payload, registry)
+        _trace_step(trace, "protobuf", started, len(payload), len(payload))
+        if metrics is not None:
+            metrics.add(_metrics_row(trace, msg, offset))
+        yield {
+            "frame_offset": offset,
+            "message_content": msg,
+            "schema_definition": typedef,
+        }
+
+def iter_decoded_frames(stream, read_size=FRAME_READ_SIZE, registry=None, metrics=None):
+    """
+    Decode every frame of a concatenated capture, one message at a time.
+    Yields dicts in the same shape as the single-file JSON output, plus the
+    byte offset of the frame in the stream. A MetricsCollector passed as
+    metrics gets one row per frame.
+    """
+    return _decode_frames(iter_frames(stream, read_size), registry, metrics)
+
+def iter_decoded_buffer_frames(buf, registry=None, metrics=None):
+    """iter_decoded_frames for a bytes or mmap'd buffer (see open_capture)."""
+    return _decode_frames(iter_buffer_frames(buf), registry, metrics)
+
+@contextmanager
+def open_capture(path):
+    """
+    Yield a read-only memoryview over a capture file. Large files are
+    mmap'd so the framing stages slice the page cache instead of copying;
+    small ones are simply read, which is cheaper than setting up a mapping.
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < MMAP_MIN_SIZE:
+            yield memoryview(f.read())
+            return
+
+        import mmap
+
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        try:
+            yield view
+        finally:
+            try:
+                view.release()
+                mapped.close()
+            except BufferError:
+                # A slice is still alive (e.g. held by a traceback); the map
+                # is closed when it is garbage collected.
+                pass
+
+def iter_decoded_responses(buf, registry=None, layers=None, metrics=None):
+    """
+    Decode every response in a raw HTTP session dump in one pass.
+    Each body goes through the remaining framing layers and the protobuf
+    stage. Responses that fail to decode (HTML, JSON, ...) are yielded with
+    an error instead of stopping the walk.
+    """
+    layers = [name for name in layers or DEFAULT_LAYERS if name != "http"]
+    for offset, status, headers, body in iter_responses(buf):
+        record = {"response_offset": offset, "status": status}
+        trace = [] if metrics is not None else None
+        msg = None
+        try:
+            msg, typedef = decode_capture(body, registry, layers, trace)
+        except Exception as err:
+            record["error"] = str(err)
+        else:
+            record["message_content"] = msg
+            record["schema_definition"] = typedef
+        if metrics is not None:
+            metrics.add(_metrics_row(trace, msg, offset))
+        yield record
+
+def write_records(records, f, fmt="jsonl", metrics=None):
+    """
+    Write records to a binary file in an output_writers format. Returns the
+    count. With metrics, the time and size of each write is added to the
+    row the record's decoder just produced.
+    """
+    writer = RecordWriter(f, fmt)
+    for record in records:
+        if metrics is None:
+            writer.write(record)
+            continue
+        started, start_pos = time.perf_counter(), f.tell()
+        writer.write(record)
+        metrics.finish_last("serialize", time.perf_counter() - started, f.tell() - start_pos)
+    return writer.count
+
+def decode_capture(raw_data: bytes, registry=None, layers=None, trace=None, cache=None, paths=None):
+    """
+    Run every stage on one raw capture: the framing layers (HTTP headers,
+    msgpack envelope, gzip wrapper by default), then protobuf decoding.
+    Returns (message, typedef). See run_layers for layers and trace, and
+    decode_body for paths.
+    With a decode_cache.DecodeCache (and no registry or paths), a capture
+    decoded before is loaded from the cache instead.
+    """
+    if cache is not None and registry is None and paths is None:
+        started = time.perf_counter()
+        key = cache.key(raw_data, layers or DEFAULT_LAYERS)
+        cached = cache.get(key)
+        if cached is not None:
+            _trace_step(trace, "cache", started, len(raw_data), len(raw_data))
+            return cached
+        msg, typedef = decode_capture(raw_data, None, layers, trace)
+        cache.put(key, msg, typedef)
+        return msg, typedef
+
+    # 1-3. Strip HTTP, msgpack and gzip framing around the protobuf payload.
+    data = run_layers(raw_data, layers, trace)
+
+    # 4. DECODE: Reverse-engineer the protobuf structure
+    started = time.perf_counter()
+    msg, typedef = decode_body(data, registry, paths)
+    _trace_step(trace, "protobuf", started, len(data), len(data))
+    return msg, typedef
+
+def collect_inputs(pattern):
+    """
+    Expand a directory or glob pattern into a sorted list of capture files.
+    Directories are walked recursively; decoder output files are skipped.
+    """
+    import glob
+    from pathlib import Path
+
+    if os.path.isdir(pattern):
+        paths = (str(p) for p in Path(pattern).rglob("*") if p.is_file())
+    else:
+        paths = (p for p in glob.glob(pattern, recursive=True) if os.path.isfile(p))
+    return sorted(p for p in paths if not p.endswith(tuple(f".{fmt}" for fmt in FORMATS)))
+
+# Per-process batch state, set up by the pool initializer.
+_batch_registry = None
+_batch_layers = None
+_batch_format = "jsonl"
+_batch_metrics = False
+_batch_cache = None
+_batch_paths = None
+
+def batch_settings(registry_path=None, native=False, layers=None, fmt="jsonl", metrics=False, cache=None, paths=None):
+    """
+    Collect what a batch worker needs into one picklable dict. The gunzip
+    and speculation limits are copied explicitly because spawned workers
+    re-import the module defaults. cache is a DecodeCache; workers open
+    their own on the same directory. paths limits decoding to those field
+    paths.
+    """
+    from . import speculation
+
+    return {
+        "registry_path": registry_path,
+        "native": native,
+        "layers": layers,
+        "format": fmt,
+        "metrics": metrics,
+        "cache": (cache.directory, cache.max_bytes) if cache is not None else None,
+        "paths": paths,
+        "speculation": speculation.get_limits(),
+        "gunzip_limits": (gunzip_stream.MAX_OUTPUT_SIZE, gunzip_stream.MAX_EXPANSION_RATIO),
+    }
+
+def _init_batch_worker(settings):
+    """Apply batch settings and silence per-capture progress messages."""
+    global VERBOSE, _batch_registry, _batch_layers, _batch_format, _batch_metrics, _batch_cache, _batch_paths
+    VERBOSE = False
+    _batch_format = settings["format"]
+    _batch_metrics = settings.get("metrics", False)
+    gunzip_stream.MAX_OUTPUT_SIZE, gunzip_stream.MAX_EXPANSION_RATIO = settings["gunzip_limits"]
+    _batch_layers = settings["layers"]
+    _batch_paths = settings.get("paths")
+    if settings.get("speculation") is not None:
+        from . import speculation
+
+        speculation.set_limits(settings["speculation"])
+        speculation.reset_counts()
+    if settings["registry_path"] is not None:
+        from .typedef_registry import TypedefRegistry
+
+        _batch_registry = TypedefRegistry(settings["registry_path"], settings["native"])
+    if settings.get("cache") is not None:
+        from .decode_cache import DecodeCache
+
+        _batch_cache = DecodeCache(*settings["cache"])
+
+def _decode_path(path):
+    """
+    Decode one capture file and serialize it in the worker, so the parent
+    process only has to write bytes.
+    Returns (error, serialized, learned, metrics) where error is None on
+    success, learned lists registry typedefs this capture added or extended
+    and metrics is a pipeline_metrics row when the batch collects them.
+    """
+    learned = []
+    trace = [] if _batch_metrics else None
+    msg = error = None
+    try:
+        with open_capture(path) as raw_data:
+            msg, typedef = decode_capture(raw_data, _batch_registry, _batch_layers, trace, _batch_cache, _batch_paths)
+    except Exception as err:
+        error = str(err)
+        record = {"source": path, "error": error, "schema_definition": None}
+        if _batch_format != "typed":
+            del record["schema_definition"]
+    else:
+        if _batch_registry is not None and _batch_paths is None:
+            learned = _batch_registry.pop_changes()
+        record = {"source": path, "message_content": msg, "schema_definition": typedef}
+
+    if not _batch_metrics:
+        return error, serialize(record, _batch_format), learned, None
+    started = time.perf_counter()
+    serialized = serialize(record, _batch_format)
+    row = _metrics_row(trace, msg, path)
+    row["stages"]["serialize"] = time.perf_counter() - started
+    row["bytes_out"] = sum(map(len, serialized)) if isinstance(serialized, tuple) else len(serialized)
+    return error, serialized, learned, row
+
+def iter_batch_lines(paths, workers=None, ordered=True, chunksize=16, settings=None):
+    """
+    Decode many capture files across a process pool.
+    Yields (error, serialized, learned, metrics) per file, where serialized
+    is the record tagged with its source path in the settings' output
+    format. With ordered=False results come back as soon as they finish
+    instead of in input order. settings comes from batch_settings().
+    """
+    settings = settings or batch_settings()
+    if workers == 1:
+        _init_batch_worker(settings)
+        yield from map(_decode_path, paths)
+        return
+
+    from multiprocessing import Pool
+
+    with Pool(workers or os.cpu_count(), initializer=_init_batch_worker, initargs=(settings,)) as pool:
+        imap = pool.imap if ordered else pool.imap_unordered
+        yield from imap(_decode_path, paths, chunksize)
+
+def decode_batch(pattern, output_file, workers=None, ordered=True, settings=None, metrics=None):
+    """
+    Decode every capture matched by a directory or glob into one output file.
+    Typedefs learned by the workers are merged back into the registry. Pass
+    a MetricsCollector (and settings with metrics=True) to get a row per
+    capture.
+    """
+    paths = collect_inputs(pattern)
+    if not paths:
+        raise FileNotFoundError(pattern)
+    print(f"Decoding {len(paths)} captures with {workers or os.cpu_count()} workers...")
+
+    settings = settings or batch_settings()
+    registry_path = settings["registry_path"]
+    registry = None
+    if registry_path:
+        from .typedef_registry import TypedefRegistry
+
+        registry = TypedefRegistry(registry_path)
+    errors = 0
+    with open(output_file, "wb") as f:
+        writer = RecordWriter(f, settings["format"])
+        for error, serialized, learned, row in iter_batch_lines(paths, workers, ordered, settings=settings):
+            writer.write_serialized(serialized)
+            if error is not None:
+                errors += 1
+            if metrics is not None and row is not None:
+                metrics.add(row)
+            for service, method, typedef in learned:
+                registry.merge(service, method, typedef)
+
+    if registry is not None:
+        registry.save()
+    if settings.get("cache") is not None:
+        # Workers each count their own additions; settle the budget once.
+        from .decode_cache import DecodeCache
+
+        DecodeCache(*settings["cache"]).trim()
+    print(f"Success! {len(paths) - errors} captures saved to '{output_file}' ({errors} failed)")
+
+def print_speculation(counts):
+    """Print how many candidates were tried as nested messages and how many were not."""
+    from .speculation import rejected
+
+    reasons = ", ".join(f"{name[9:]} {value}" for name, value in counts.items() if name.startswith("rejected_"))
+    print(f"Speculative message parses: {counts['attempted']} tried, {rejected(counts)} rejected ({reasons})")
+
+def print_trace(trace):
+    """Print which layers claimed a capture and how long each took."""
+    for step in trace:
+        status = "claimed" if step["claimed"] else "passed"
+        print(
+            f"  {step['layer']:<9} {status:<8} {step['seconds'] * 1000:8.3f} ms  "
+            f"{step['bytes_in']} -> {step['bytes_out']} bytes"
+        )
+
+def decode_file(
+    input_file, output_file, registry=None, layers=None, show_trace=False, fmt="json", metrics=None, cache=None,
+    paths=None,
+):
+    """Decode a single capture and write it (indented JSON by default)."""
+    print(f"Reading {input_file}...")
+    trace = [] if show_trace or metrics is not None else None
+    with open_capture(input_file) as raw_data:
+        msg, typedef = decode_capture(raw_data, registry, layers, trace, cache, paths)
+    if cache is not None and cache.hits:
+        log("Loaded from the decode cache")
+    if show_trace:
+        print_trace(trace)
+    if metrics is not None:
+        metrics.add(_metrics_row(trace, msg, input_file))
+
+    # 5. EXPORT: Write to JSON with the custom handler
+    output_data = {
+        "message_content": msg,
+        "schema_definition": typedef,
+    }
+
+    with open(output_file, "wb") as f:
+        write_records([output_data], f, fmt, metrics)
+
+    print(f"Success! Data saved to '{output_file}'")
+
+def stream_file(input_file, output_file, registry=None, layers=None, fmt="json"):
+    """
+    Decode a single capture with stream_json.py: the JSON is written as the
+    message is walked instead of after the whole message is decoded.
+    """
+    from .stream_json import NotMessage, stream_record
+    from .typedef_registry import read_rpc_header
+
+    print(f"Reading {input_file}...")
+    with open_capture(input_file) as raw_data:
+        body = bytes(run_layers(raw_data, layers))
+    header = read_rpc_header(body) if registry is not None else (None, None)
+    known = registry.get(*header) if header != (None, None) else None
+
+    with open(output_file, "wb") as f:
+        try:
+            typedef = stream_record(body, f, fmt, known)
+        except NotMessage:
+            # Nothing is written before the top level is checked, so a stored
+            # typedef that does not fit can be dropped, as registry.decode does.
+            if known is None:
+                raise
+            typedef = stream_record(body, f, fmt)
+            registry.merge(*header, typedef)
+        else:
+            if header != (None, None):
+                registry.put(*header, typedef)
+
+    print(f"Success! Data saved to '{output_file}'")
+
+def decode_frames_file(input_file, output_file, registry=None, fmt="jsonl", metrics=None):
+    """Decode a dump of concatenated enveloped frames, one record per frame."""
+    print(f"Reading frames from {input_file}...")
+    with open_capture(input_file) as src, open(output_file, "wb") as dst:
+        count = write_records(iter_decoded_buffer_frames(src, registry, metrics), dst, fmt, metrics)
+
+    print(f"Success! {count} frames saved to '{output_file}'")
+
+def decode_http_file(input_file, output_file, registry=None, layers=None, fmt="jsonl", metrics=None):
+    """Decode a raw dump of pipelined HTTP responses, one record per response."""
+    print(f"Reading HTTP responses from {input_file}...")
+    with open_capture(input_file) as src, open(output_file, "wb") as dst:
+        count = write_records(iter_decoded_responses(src, registry, layers, metrics), dst, fmt, metrics)
+
+    print(f"Success! {count} responses saved to '{output_file}'")
+
+def main():
+    """Main function."""
+    import argparse
+
+    global VERBOSE
+    VERBOSE = True
+
+    from .pipeline_metrics import MetricsCollector, profiled
+    from .typedef_registry import TypedefRegistry
+
+    parser = argparse.ArgumentParser(description="Decode captured protobuf payloads to JSON")
+    parser.add_argument("input", nargs="?", default=INPUT_FILE, help="Capture file to decode")
+    parser.add_argument(
+        "output",
+        nargs="?",
+        help="Output file (default: test.json, <input>.<format> with --frames/--http, batch.<format> with --batch)",
+    )
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--frames",
+        action="store_true",
+        help="Input is a dump of back-to-back {IsZip, ZipDataLen} frames; write one record per frame",
+    )
+    mode.add_argument(
+        "--http",
+        action="store_true",
+        help="Input is a raw dump of many HTTP responses; write one record per response",
+    )
+    mode.add_argument(
+        "--batch",
+        action="store_true",
+        help="Input is a directory or glob of captures; decode them in parallel into one output file",
+    )
+    parser.add_argument("-j", "--workers", type=int, help="Worker processes for --batch (default: all cores)")
+    parser.add_argument(
+        "--unordered",
+        action="store_true",
+        help="With --batch, write results as they finish instead of in input order",
+    )
+    parser.add_argument(
+        "--registry",
+        metavar="PATH",
+        help="Per-RPC typedef registry (e.g. typedefs.json) used to decode known methods and updated with new ones",
+    )
+    parser.add_argument(
+        "--native",
+        action="store_true",
+        help="With --registry, decode known methods through compiled google.protobuf classes (needs protobuf)",
+    )
+    parser.add_argument(
+        "--max-output",
+        type=int,
+        default=gunzip_stream.MAX_OUTPUT_SIZE,
+        help="Refuse to decompress a payload past this many bytes",
+    )
+    parser.add_argument(
+        "--max-ratio",
+        type=int,
+        default=gunzip_stream.MAX_EXPANSION_RATIO,
+        help="Refuse compressed payloads that expand by more than this factor",
+    )
+    parser.add_argument(
+        "--max-speculative-size",
+        type=int,
+        metavar="BYTES",
+        help="Never try length-delimited fields larger than this as nested messages (default: no limit)",
+    )
+    parser.add_argument(
+        "--max-speculative-depth",
+        type=int,
+        metavar="DEPTH",
+        help="Only try length-delimited fields this deep as nested messages; top level is 1 (default: no limit)",
+    )
+    parser.add_argument(
+        "--speculation-budget",
+        type=float,
+        metavar="MS",
+        help="Milliseconds per message spent trying fields as nested messages before the rest stay bytes",
+    )
+    parser.add_argument(
+        "--layers",
+        default=",".join(DEFAULT_LAYERS),
+        help=f"Comma-separated framing layers to try, in order, for this capture source (available: {', '.join(LAYERS)})",
+    )
+    parser.add_argument(
+        "--cache",
+        metavar="DIR",
+        help="Decode cache directory: captures decoded before are loaded from it (not used with --registry)",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        help="Byte budget of the decode cache; least recently used entries go first (default: 256 MiB)",
+    )
+    parser.add_argument(
+        "--paths",
+        help="Comma-separated field paths to decode, e.g. 1 (the RPC header) or 1.7,3.2; the rest is skipped",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Write the JSON of a single capture while decoding it, field by field (json/jsonl only)",
+    )
+    parser.add_argument("--trace", action="store_true", help="Print per-layer timing for a single capture")
+    parser.add_argument(
+        "--format",
+        choices=FORMATS,
+        help="Output format (default: json for a single capture, jsonl otherwise); see output_writers.py",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Record per-stage time, sizes, depth and field counts per message and print percentiles",
+    )
+    parser.add_argument("--profile-out", metavar="PATH", help="With --profile, also write every metrics row as JSON")
+    parser.add_argument(
+        "--pstats",
+        metavar="PATH",
+        help="Run under cProfile and dump the stats here (with --batch, use -j 1 to profile the decoding itself)",
+    )
+
+    args = parser.parse_args()
+    if args.native and not args.registry:
+        parser.error("--native needs --registry")
+    layers = [name for name in args.layers.split(",") if name]
+    unknown = [name for name in layers if name not in LAYERS]
+    if unknown:
+        parser.error(f"unknown layers: {', '.join(unknown)}")
+    paths = [path for path in args.paths.split(",") if path] if args.paths else None
+    if paths and (args.frames or args.http):
+        parser.error("--paths works on single captures and --batch")
+    gunzip_stream.MAX_OUTPUT_SIZE = args.max_output
+    gunzip_stream.MAX_EXPANSION_RATIO = args.max_ratio
+    from . import speculation
+
+    budget = args.speculation_budget / 1000 if args.speculation_budget is not None else None
+    profiling = bool(args.profile or args.profile_out)
+    speculation.set_limits((args.max_speculative_size, args.max_speculative_depth, budget, profiling))
+    single = not (args.batch or args.frames or args.http)
+    fmt = args.format or ("json" if single else "jsonl")
+    if args.stream:
+        if not single:
+            parser.error("--stream works on single captures")
+        if fmt not in ("json", "jsonl"):
+            parser.error("--stream writes json or jsonl")
+        if paths or args.cache or args.trace or args.profile or args.profile_out:
+            parser.error("--stream does not go with --paths, --cache, --trace or --profile")
+    metrics = MetricsCollector() if args.profile or args.profile_out else None
+    cache = None
+    if args.cache:
+        from .decode_cache import MAX_CACHE_BYTES, DecodeCache
+
+        if args.registry:
+            print("Warning: --cache is not used with --registry", file=sys.stderr)
+        else:
+            cache = DecodeCache(args.cache, args.cache_size or MAX_CACHE_BYTES)
+
+    try:
+        with profiled(args.pstats):
+            if args.batch:
+                settings = batch_settings(args.registry, args.native, layers, fmt, metrics is not None, cache, paths)
+                output = args.output or f"batch.{fmt}"
+                decode_batch(args.input, output, args.workers, not args.unordered, settings, metrics)
+            else:
+                registry = TypedefRegistry(args.registry, args.native) if args.registry else None
+                if args.frames:
+                    decode_frames_file(args.input, args.output or f"{args.input}.{fmt}", registry, fmt, metrics)
+                elif args.http:
+                    output = args.output or f"{args.input}.{fmt}"
+                    decode_http_file(args.input, output, registry, layers, fmt, metrics)
+                elif args.stream:
+                    output = args.output or (OUTPUT_FILE if fmt == "json" else f"{args.input}.{fmt}")
+                    stream_file(args.input, output, registry, layers, fmt)
+                else:
+                    output = args.output or (OUTPUT_FILE if fmt == "json" else f"{args.input}.{fmt}")
+                    decode_file(args.input, output, registry, layers, args.trace, fmt, metrics, cache, paths)
+                if registry is not None:
+                    registry.save()
+        if speculation.active() and metrics is None and not args.batch:
+            print_speculation(speculation.reset_counts())
+        if metrics is not None:
+            metrics.print_report()
+            if args.profile_out:
+                metrics.write(args.profile_out)
+                print(f"Metrics saved to '{args.profile_out}'")
+    except FileNotFoundError:
+        print(f"Error: Could not find file named '{args.input}'. check the filename.")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+
+if __name__ == "__main__":
+    main()
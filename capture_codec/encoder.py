@@ -0,0 +1,262 @@
+import json
+import time
+
+import blackboxprotobuf
+
+from .output_writers import FORMATS, compile_plan, iter_records, message_from_json
+from .pipeline_metrics import MetricsCollector, message_shape, profiled
+
+try:
+    # Lets a plan convert the typedef dict to blackboxprotobuf's TypeDef once
+    # instead of on every encode_message call, and encode it without copying
+    # nested messages into their parents (see sized_encoder.py).
+    from .sized_encoder import SizedEncoder, encode_sized
+except ImportError:  # other blackboxprotobuf versions: use the public API
+    SizedEncoder = None
+
+# Default input (decoder output) and output (encoded protobuf) files
+INPUT_FILE = "msg.json"
+OUTPUT_FILE = "room_encoded"
+
+
+def restore_types(msg, typedef):
+    """
+    Convert JSON-loaded values back to bytes where the typedef says 'bytes'.
+    Plain strings are UTF-8 text, {"base64": ...} objects (and the older
+    "<BINARY_BASE64: ...>" strings) are binary. Recurses into nested
+    messages and repeated fields.
+    """
+    return message_from_json(msg, typedef)
+
+
+def encode(msg, typedef, native=False):
+    """
+    Encode a type-restored message with its typedef.
+    With native=True the typedef is compiled into a google.protobuf class
+    (see proto_codec.py); anything it cannot express falls back to
+    blackboxprotobuf.
+    """
+    if native:
+        from .proto_codec import NativeCodec
+
+        try:
+            return NativeCodec(typedef).encode(msg)
+        except Exception as err:
+            print(f"Native encoder unavailable ({err}), falling back to blackboxprotobuf")
+
+    if SizedEncoder is not None:
+        return encode_sized(msg, typedef)
+    return blackboxprotobuf.encode_message(msg, typedef)
+
+
+class EncodePlan:
+    """
+    A typedef compiled once for encoding many messages: which fields to turn
+    back into bytes (see output_writers.compile_plan) plus a ready encoder.
+    """
+
+    def __init__(self, typedef, native=False):
+        self.typedef = typedef
+        self.restore = compile_plan(typedef)
+        self._codec = None
+        self._sized = None
+        if native:
+            from .proto_codec import NativeCodec
+
+            try:
+                self._codec = NativeCodec(typedef)
+            except Exception as err:
+                print(f"Native encoder unavailable ({err}), falling back to blackboxprotobuf")
+        if self._codec is None and SizedEncoder is not None:
+            self._sized = SizedEncoder(typedef)
+
+    def encode(self, msg):
+        """Restore bytes fields of a JSON-loaded message and encode it."""
+        return self.encode_restored(self.restore_types(msg))
+
+    def restore_types(self, msg):
+        return message_from_json(msg, self.typedef, self.restore)
+
+    def encode_restored(self, msg):
+        """Encode a message whose bytes fields are already bytes."""
+        if self._codec is not None:
+            return self._codec.encode(msg)
+        if self._sized is not None:
+            return self._sized.encode(msg)
+        return blackboxprotobuf.encode_message(msg, self.typedef)
+
+
+class PlanCache:
+    """EncodePlans keyed by the packed typedef, so identical typedefs compile once."""
+
+    def __init__(self, native=False):
+        self.native = native
+        self.plans = {}
+
+    def get(self, typedef):
+        import msgpack
+
+        key = msgpack.packb(typedef, use_bin_type=True)
+        plan = self.plans.get(key)
+        if plan is None:
+            plan = self.plans[key] = EncodePlan(typedef, self.native)
+        return plan
+
+
+# One PlanCache per native setting, shared by encode_message calls.
+_plan_caches = {}
+
+
+def encode_message(msg, typedef, native=False):
+    """
+    Encode a message with its typedef and return the protobuf bytes.
+    msg may come straight from decode_capture or from JSON output
+    (see output_writers.message_to_json); the typedef is compiled once and
+    reused for later calls with an identical one.
+    """
+    cache = _plan_caches.get(native)
+    if cache is None:
+        cache = _plan_caches[native] = PlanCache(native)
+    return cache.get(typedef).encode(msg)
+
+
+def write_frame(f, body):
+    """Write one encoded message as an uncompressed {IsZip, ZipDataLen} frame."""
+    import msgpack
+
+    f.write(msgpack.packb({"IsZip": False, "ZipDataLen": len(body)}))
+    f.write(body)
+
+
+def timed_encode(plan, msg, metrics, label=None):
+    """plan.encode, adding a pipeline_metrics row for the message to metrics."""
+    started = time.perf_counter()
+    restored = plan.restore_types(msg)
+    restored_at = time.perf_counter()
+    body = plan.encode_restored(restored)
+    depth, fields = message_shape(msg)
+    metrics.add({
+        "source": label,
+        "bytes_out": len(body),
+        "depth": depth,
+        "fields": fields,
+        "stages": {
+            "restore_types": restored_at - started,
+            "encode_message": time.perf_counter() - restored_at,
+        },
+    })
+    return body
+
+
+def encode_batch(input_file, output_file, fmt="jsonl", native=False, metrics=None):
+    """
+    Encode every record of a decoder output file (jsonl, msgpack or typed)
+    in one process. The output is a stream of {IsZip, ZipDataLen} frames,
+    one per record, which decoder.py --frames reads back. A MetricsCollector
+    passed as metrics gets one row per record.
+    """
+    cache = PlanCache(native)
+    encoded = failed = 0
+    with open(input_file, "rb") as src, open(output_file, "wb") as out:
+        for index, record in enumerate(iter_records(src, fmt)):
+            if "message_content" not in record or not record.get("schema_definition"):
+                failed += 1
+                print(f"Skipping record {index}: {record.get('error', 'no message_content/schema_definition')}")
+                continue
+            try:
+                plan = cache.get(record["schema_definition"])
+                if metrics is None:
+                    body = plan.encode(record["message_content"])
+                else:
+                    body = timed_encode(plan, record["message_content"], metrics, index)
+            except Exception as err:
+                failed += 1
+                print(f"Failed to encode record {index}: {err}")
+                continue
+            write_frame(out, body)
+            encoded += 1
+
+    print(f"✔ Encoded {encoded} records ({len(cache.plans)} distinct typedefs, {failed} failed) to {output_file}")
+
+
+def encode_file(input_file, output_file, native=False, metrics=None):
+    """Encode a decoder JSON file (message_content + schema_definition) to protobuf bytes."""
+
+    # ===================== LOAD JSON =====================
+
+    with open(input_file, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    # Extract message content and schema definition
+    msg = data["message_content"]
+    typedef = data["schema_definition"]
+
+    if metrics is not None:
+        encoded_bytes = timed_encode(EncodePlan(typedef, native), msg, metrics, input_file)
+    else:
+        # ===================== FIX TYPES BEFORE ENCODING =====================
+
+        msg_fixed = restore_types(msg, typedef)
+
+        # ===================== ENCODE =====================
+
+        encoded_bytes = encode(msg_fixed, typedef, native)
+
+    with open(output_file, "wb") as f:
+        f.write(encoded_bytes)
+
+    print(f"✔ Successfully encoded {input_file} to {output_file}")
+
+
+def main():
+    """Main function."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Encode decoder JSON output back to protobuf bytes")
+    parser.add_argument("input", nargs="?", default=INPUT_FILE, help=f"Decoded JSON file (default: {INPUT_FILE})")
+    parser.add_argument(
+        "output",
+        nargs="?",
+        help=f"Encoded output file (default: {OUTPUT_FILE}, or <input>.frames with --batch)",
+    )
+    parser.add_argument(
+        "--native",
+        action="store_true",
+        help="Encode through a google.protobuf class compiled from the typedef (needs protobuf)",
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="Input holds many records (decoder --batch/--frames output); write one frame per record",
+    )
+    parser.add_argument(
+        "--format",
+        choices=[fmt for fmt in FORMATS if fmt != "json"],
+        default="jsonl",
+        help="Record format of the --batch input (default: jsonl)",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Time restore_types and encode_message per message and print percentiles",
+    )
+    parser.add_argument("--profile-out", metavar="PATH", help="With --profile, also write every metrics row as JSON")
+    parser.add_argument("--pstats", metavar="PATH", help="Run under cProfile and dump the stats here")
+
+    args = parser.parse_args()
+    metrics = MetricsCollector() if args.profile or args.profile_out else None
+
+    with profiled(args.pstats):
+        if args.batch:
+            encode_batch(args.input, args.output or f"{args.input}.frames", args.format, args.native, metrics)
+        else:
+            encode_file(args.input, args.output or OUTPUT_FILE, args.native, metrics)
+    if metrics is not None:
+        metrics.print_report()
+        if args.profile_out:
+            metrics.write(args.profile_out)
+            print(f"Metrics saved to '{args.profile_out}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+Incremental gunzip (and raw/zlib deflate and brotli, for HTTP
+Content-Encoding) with output limits and ZipDataLen checks.
+"""
+
+import zlib
+
+# Defaults for every gunzip call; decoder.py overrides them from the CLI.
+MAX_OUTPUT_SIZE = 256 * 1024 * 1024
+# deflate tops out around 1032:1, so anything past this is not a real capture.
+MAX_EXPANSION_RATIO = 1100
+CHUNK_SIZE = 64 * 1024
+
+GZIP_WBITS = zlib.MAX_WBITS | 16
+# Brotli input fed per step when the installed brotli cannot cap its output
+# (before 1.2); one step can then overshoot max_output by what this expands to.
+BROTLI_INPUT_STEP = 1024
+
+
+class DecompressionError(RuntimeError):
+    """The compressed payload is corrupt, truncated or exceeds a limit."""
+
+
+def _iter_chunks(source, chunk_size):
+    """Split a bytes-like source into memoryview chunks; pass iterables through."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source)
+        for start in range(0, len(view), chunk_size):
+            yield view[start:start + chunk_size]
+    else:
+        yield from source
+
+
+def _check_limits(produced, consumed, max_output, max_ratio):
+    if produced > max_output:
+        raise DecompressionError(f"Decompressed size exceeds the {max_output} byte limit")
+    if produced > max_ratio * max(consumed, 1):
+        raise DecompressionError(
+            f"Expansion ratio exceeds {max_ratio}:1 ({produced} bytes from {consumed})"
+        )
+
+
+def iter_gunzip(source, expected_size=None, max_output=None, max_ratio=None, chunk_size=CHUNK_SIZE):
+    """
+    Decompress a gzip stream chunk by chunk.
+
+    source is a bytes-like object or an iterable of chunks (e.g. reads from a
+    socket or file). Yields decompressed chunks of at most chunk_size bytes,
+    so a consumer can start parsing before the whole payload is inflated.
+
+    expected_size is the compressed length the envelope advertised
+    (ZipDataLen). The stream fails as soon as more input arrives than that, or
+    when the input ends before the gzip trailer. Output is capped at
+    max_output bytes and at max_ratio times the compressed input seen so far.
+    Raises DecompressionError.
+    """
+    max_output = MAX_OUTPUT_SIZE if max_output is None else max_output
+    max_ratio = MAX_EXPANSION_RATIO if max_ratio is None else max_ratio
+
+    decomp = zlib.decompressobj(GZIP_WBITS)
+    consumed = 0
+    produced = 0
+    for chunk in _iter_chunks(source, chunk_size):
+        if not chunk:
+            continue
+        if expected_size is not None and consumed + len(chunk) > expected_size:
+            raise DecompressionError(
+                f"More than ZipDataLen={expected_size} compressed bytes supplied"
+            )
+
+        data = chunk
+        while data:
+            if decomp.eof:
+                # Concatenated gzip members are valid; anything else is junk.
+                if bytes(data[:2]) != b"\x1f\x8b":
+                    raise DecompressionError(f"{len(data)} trailing bytes after the gzip stream")
+                decomp = zlib.decompressobj(GZIP_WBITS)
+            try:
+                out = decomp.decompress(data, chunk_size)
+            except zlib.error as err:
+                raise DecompressionError(f"Corrupt gzip data after {consumed} bytes: {err}")
+
+            remaining = decomp.unconsumed_tail or decomp.unused_data
+            consumed += len(data) - len(remaining)
+            data = remaining
+
+            produced += len(out)
+            _check_limits(produced, consumed, max_output, max_ratio)
+            if out:
+                yield out
+
+    if not decomp.eof:
+        raise DecompressionError(f"Truncated gzip stream after {consumed} compressed bytes")
+    if expected_size is not None and consumed != expected_size:
+        raise DecompressionError(
+            f"Envelope length={expected_size} but the gzip stream ended after {consumed} bytes"
+        )
+
+
+def gunzip(source, expected_size=None, max_output=None, max_ratio=None):
+    """Decompress a whole gzip payload with the same checks as iter_gunzip. Returns bytes."""
+    return b"".join(iter_gunzip(source, expected_size, max_output, max_ratio))
+
+
+def _is_zlib_header(data):
+    header = bytes(data[:2])
+    return len(header) == 2 and header[0] & 0x0F == 8 and (header[0] << 8 | header[1]) % 31 == 0
+
+
+def iter_inflate(source, max_output=None, max_ratio=None, chunk_size=CHUNK_SIZE):
+    """
+    Decompress an HTTP "deflate" body chunk by chunk, with the same output
+    and ratio limits as iter_gunzip. Servers send both zlib-wrapped and raw
+    deflate under that name; a body that does not start with a zlib header
+    is taken as raw. Raises DecompressionError.
+    """
+    max_output = MAX_OUTPUT_SIZE if max_output is None else max_output
+    max_ratio = MAX_EXPANSION_RATIO if max_ratio is None else max_ratio
+
+    decomp = None
+    consumed = 0
+    produced = 0
+    for chunk in _iter_chunks(source, chunk_size):
+        if not chunk:
+            continue
+        if decomp is None:
+            decomp = zlib.decompressobj(zlib.MAX_WBITS if _is_zlib_header(chunk) else -zlib.MAX_WBITS)
+        data = chunk
+        while data and not decomp.eof:
+            try:
+                out = decomp.decompress(data, chunk_size)
+            except zlib.error as err:
+                raise DecompressionError(f"Corrupt deflate data after {consumed} bytes: {err}")
+            consumed += len(data) - len(decomp.unconsumed_tail)
+            data = decomp.unconsumed_tail
+            produced += len(out)
+            _check_limits(produced, consumed, max_output, max_ratio)
+            if out:
+                yield out
+
+    if decomp is None or not decomp.eof:
+        raise DecompressionError(f"Truncated deflate stream after {consumed} compressed bytes")
+
+
+def inflate(source, max_output=None, max_ratio=None):
+    """Decompress a whole deflate body with the same checks as iter_inflate. Returns bytes."""
+    return b"".join(iter_inflate(source, max_output, max_ratio))
+
+
+def iter_unbrotli(source, max_output=None, max_ratio=None, chunk_size=CHUNK_SIZE):
+    """
+    Decompress a brotli body chunk by chunk, with the same output and ratio
+    limits as iter_gunzip. Needs the brotli package (ImportError otherwise).
+    Raises DecompressionError.
+    """
+    import brotli
+
+    max_output = MAX_OUTPUT_SIZE if max_output is None else max_output
+    max_ratio = MAX_EXPANSION_RATIO if max_ratio is None else max_ratio
+
+    decomp = brotli.Decompressor()
+    # brotli 1.2+ stops each process() call after about chunk_size bytes of output.
+    limited = hasattr(decomp, "can_accept_more_data")
+    consumed = 0
+    produced = 0
+    for chunk in _iter_chunks(source, chunk_size if limited else BROTLI_INPUT_STEP):
+        if not chunk:
+            continue
+        data = bytes(chunk)
+        consumed += len(data)
+        while True:
+            try:
+                if limited:
+                    out = decomp.process(data, output_buffer_limit=chunk_size)
+                else:
+                    out = decomp.process(data)
+            except brotli.error as err:
+                raise DecompressionError(f"Corrupt brotli data after {consumed} bytes: {err}")
+            data = b""
+            produced += len(out)
+            _check_limits(produced, consumed, max_output, max_ratio)
+            if not out:
+                break
+            yield out
+            # With a capped output, keep draining until no more comes out.
+            if not limited or decomp.is_finished():
+                break
+
+    if not decomp.is_finished():
+        raise DecompressionError(f"Truncated brotli stream after {consumed} compressed bytes")
+
+
+def unbrotli(source, max_output=None, max_ratio=None):
+    """Decompress a whole brotli body with the same checks as iter_unbrotli. Returns bytes."""
+    return b"".join(iter_unbrotli(source, max_output, max_ratio))
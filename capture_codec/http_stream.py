@@ -0,0 +1,153 @@
+"""Single-pass parser for raw HTTP/1.1 response dumps."""
+
+import re
+
+from .gunzip_stream import DecompressionError, gunzip, inflate, unbrotli
+
+HEADER_END_RE = re.compile(rb"\r?\n\r?\n")
+LINE_END_RE = re.compile(rb"\r?\n")
+HEAD_LINE_RE = re.compile(r"\r?\n")
+
+# Status codes that never carry a body.
+NO_BODY_STATUSES = {204, 304}
+
+
+class HTTPParseError(RuntimeError):
+    """The dump is not a well-formed sequence of HTTP responses."""
+
+
+def _parse_head(head):
+    """Parse a status line and header block into (status, headers)."""
+    lines = HEAD_LINE_RE.split(bytes(head).decode("iso-8859-1"))
+    parts = lines[0].split(" ", 2)
+    if len(parts) < 2 or not parts[0].startswith("HTTP/") or not parts[1].isdigit():
+        raise HTTPParseError(f"Bad status line: {lines[0]!r}")
+
+    headers = {}
+    for line in lines[1:]:
+        if not line:
+            continue
+        name, sep, value = line.partition(":")
+        if not sep:
+            raise HTTPParseError(f"Bad header line: {line!r}")
+        name = name.strip().lower()
+        value = value.strip()
+        # Repeated headers are folded the way RFC 9110 allows.
+        headers[name] = f"{headers[name]}, {value}" if name in headers else value
+    return int(parts[1]), headers
+
+
+def _read_chunked(view, pos):
+    """De-chunk a body starting at pos. Returns (body, end_pos)."""
+    chunks = []
+    while True:
+        line_end = LINE_END_RE.search(view, pos)
+        if line_end is None:
+            raise HTTPParseError(f"Truncated chunk size line at offset {pos}")
+        size_text = bytes(view[pos:line_end.start()]).split(b";", 1)[0].strip()
+        try:
+            size = int(size_text, 16)
+        except ValueError:
+            raise HTTPParseError(f"Bad chunk size {size_text!r} at offset {pos}")
+        pos = line_end.end()
+        if size == 0:
+            break
+        if pos + size > len(view):
+            raise HTTPParseError(f"Truncated chunk at offset {pos}: {size} bytes expected")
+        chunks.append(view[pos:pos + size])
+        pos += size
+        crlf = LINE_END_RE.match(view, pos)
+        if crlf is None:
+            raise HTTPParseError(f"Missing CRLF after chunk at offset {pos}")
+        pos = crlf.end()
+
+    # Skip trailer fields up to the blank line that ends the message.
+    while True:
+        line_end = LINE_END_RE.search(view, pos)
+        if line_end is None:
+            pos = len(view)
+            break
+        blank = line_end.start() == pos
+        pos = line_end.end()
+        if blank:
+            break
+
+    if len(chunks) == 1:
+        return chunks[0], pos
+    return b"".join(chunks), pos
+
+
+def decode_content(body, encoding):
+    """Undo a Content-Encoding header (gzip, deflate, br; applied last-first)."""
+    for coding in reversed([c.strip().lower() for c in encoding.split(",") if c.strip()]):
+        if coding == "identity":
+            continue
+        if coding in ("gzip", "x-gzip"):
+            body = gunzip(body)
+        elif coding == "deflate":
+            body = inflate(body)
+        elif coding == "br":
+            try:
+                body = unbrotli(body)
+            except ImportError:
+                raise HTTPParseError("Brotli-encoded body needs the brotli package: pip install brotli")
+        else:
+            raise HTTPParseError(f"Unsupported Content-Encoding {coding!r}")
+    return body
+
+
+def read_response(buf, pos=0):
+    """
+    Parse one response starting at pos.
+    Returns (status, headers, body, end_pos) where body is de-chunked and
+    content-decoded. A Content-Length past the end of the dump is treated
+    as a truncated capture and takes whatever bytes remain.
+    """
+    view = memoryview(buf)
+    head_end = HEADER_END_RE.search(view, pos)
+    if head_end is None:
+        raise HTTPParseError(f"HTTP-like input but no header terminator found at offset {pos}")
+    status, headers = _parse_head(view[pos:head_end.start()])
+    pos = head_end.end()
+
+    if 100 <= status < 200 or status in NO_BODY_STATUSES:
+        body, end = view[pos:pos], pos
+    elif "chunked" in headers.get("transfer-encoding", "").lower():
+        body, end = _read_chunked(view, pos)
+    elif "content-length" in headers:
+        try:
+            length = int(headers["content-length"])
+        except ValueError:
+            raise HTTPParseError(f"Bad Content-Length {headers['content-length']!r}")
+        end = min(pos + length, len(view))
+        body = view[pos:end]
+    else:
+        # No framing: the body runs until the connection closed.
+        body, end = view[pos:], len(view)
+
+    if headers.get("content-encoding"):
+        try:
+            body = decode_content(body, headers["content-encoding"])
+        except DecompressionError as err:
+            raise HTTPParseError(f"Failed to decode {headers['content-encoding']} body: {err}")
+    return status, headers, body, end
+
+
+def iter_responses(buf):
+    """
+    Walk a dump of back-to-back (pipelined) HTTP responses in one pass.
+    Yields (offset, status, headers, body) for each response. Whitespace
+    between responses is skipped.
+    """
+    view = memoryview(buf)
+    pos = 0
+    while pos < len(view):
+        while pos < len(view) and view[pos] in b" \t\r\n":
+            pos += 1
+        if pos >= len(view):
+            return
+        if bytes(view[pos:pos + 5]) != b"HTTP/":
+            raise HTTPParseError(f"Expected an HTTP status line at offset {pos}")
+        status, headers, body, end = read_response(view, pos)
+        yield pos, status, headers, body
+        pos = end
@@ -0,0 +1,194 @@
+"""
+Selective decoding: materialize only some field paths of a protobuf body.
+
+    msg, typedef = decode_paths(body, ["1", "3.2"])
+
+Paths are dotted field numbers as in the decoder output ("3.2" is field 2
+of the message in field 3). The wire format is walked without decoding
+anything, and length-delimited fields off the requested paths are skipped
+by their length prefix instead of being parsed, so reading the RPC header
+(field 1) of a large capture costs about as much as the header itself.
+
+The fields a path ends at are cut out as raw wire bytes and handed to
+blackboxprotobuf together, so they get the same values and inferred types
+as in a full decode_message; the result is the full decode with every
+other field left out.
+"""
+
+import blackboxprotobuf
+
+from . import packed_fields
+from .schema_merge import merge_typedefs
+from .typedef_registry import _read_varint
+
+# The RPC header.
+HEADER_PATHS = ["1"]
+
+
+class GroupField(ValueError):
+    """A group (wire type 3 or 4), which iter_field_spans does not walk."""
+
+
+def iter_field_spans(data, start=0, end=None):
+    """
+    Walk one level of a protobuf message without decoding values.
+    Yields (field_number, wire_type, field_start, value_start, field_end);
+    field_start is where the key begins, so data[field_start:field_end] is
+    the field as it appears on the wire. Raises GroupField (a ValueError)
+    on groups and ValueError on malformed input.
+    """
+    pos = start
+    end = len(data) if end is None else end
+    while pos < end:
+        field_start = pos
+        key, pos = _read_varint(data, pos)
+        field_number, wire_type = key >> 3, key & 0x7
+        if wire_type == 0:
+            value_start = pos
+            _, pos = _read_varint(data, pos)
+        else:
+            if wire_type == 2:
+                length, pos = _read_varint(data, pos)
+            elif wire_type == 1:
+                length = 8
+            elif wire_type == 5:
+                length = 4
+            elif wire_type in (3, 4):
+                raise GroupField(f"Unsupported wire type {wire_type}")
+            else:
+                raise ValueError(f"Unsupported wire type {wire_type}")
+            value_start = pos
+            pos += length
+        if pos > end:
+            raise ValueError("Field runs past the end of the message")
+        yield field_number, wire_type, field_start, value_start, pos
+
+
+def path_tree(paths):
+    """
+    Turn dotted paths into {field: subtree}, where None means the whole
+    field. A path that covers another one wins ("3" over "3.2").
+    """
+    tree = {}
+    for path in paths:
+        parts = path.split(".")
+        if not all(part.isdigit() for part in parts):
+            raise ValueError(f"Invalid field path {path!r}")
+        node = tree
+        for part in parts[:-1]:
+            child = node.setdefault(part, {})
+            if child is None:
+                break
+            node = child
+        else:
+            node[parts[-1]] = None
+    return tree
+
+
+def _message_typedef(field_def):
+    if field_def and field_def.get("type") == "message":
+        return field_def.get("message_typedef")
+    return None
+
+
+def _select(data, start, end, tree, typedef):
+    """Decode the fields of data[start:end] that tree asks for. Returns (message, typedef)."""
+    order = {}
+    leaves = []
+    nested = {}
+    for number, wire_type, field_start, value_start, field_end in iter_field_spans(data, start, end):
+        key = str(number)
+        if key not in tree:
+            continue
+        order.setdefault(key, len(order))
+        if tree[key] is None:
+            leaves.append(data[field_start:field_end])
+        elif wire_type == 2:
+            nested.setdefault(key, []).append((value_start, field_end))
+
+    msg, out_typedef = {}, {}
+    if leaves:
+        known = None
+        if typedef:
+            known = {key: field_def for key, field_def in typedef.items() if tree.get(key, False) is None}
+        msg, out_typedef = blackboxprotobuf.decode_message(b"".join(leaves), known or None)
+
+    for key, spans in nested.items():
+        values = []
+        merged = _message_typedef(typedef.get(key)) if typedef else None
+        for value_start, value_end in spans:
+            try:
+                value, value_typedef = _select(data, value_start, value_end, tree[key], merged)
+            except GroupField:
+                # decode_paths decodes the whole body instead.
+                raise
+            except (ValueError, IndexError):
+                # Not a message on this occurrence, so the path does not go on.
+                continue
+            values.append(value)
+            # Later occurrences are decoded with what the earlier ones showed,
+            # as decode_message does for a repeated message.
+            merged = value_typedef if merged is None else merge_typedefs(merged, value_typedef)[0]
+        if values:
+            msg[key] = values[0] if len(values) == 1 else values
+            out_typedef[key] = {"field_order": list(merged), "message_typedef": merged, "type": "message"}
+
+    if nested and len(msg) > 1:
+        msg = {key: msg[key] for key in sorted(msg, key=order.get)}
+    return msg, out_typedef
+
+
+def _prune_typedef(typedef, tree):
+    out = {}
+    for key, subtree in tree.items():
+        field_def = typedef.get(key)
+        if field_def is None:
+            continue
+        if subtree is None:
+            out[key] = field_def
+        elif _message_typedef(field_def) is not None:
+            sub_typedef = _prune_typedef(_message_typedef(field_def), subtree)
+            out[key] = {"field_order": list(sub_typedef), "message_typedef": sub_typedef, "type": "message"}
+    return out
+
+
+def _prune(msg, typedef, tree):
+    """Cut a fully decoded message down to the fields tree asks for."""
+    out = {}
+    for key, value in msg.items():
+        if key not in tree:
+            continue
+        subtree = tree[key]
+        if subtree is None:
+            out[key] = value
+        elif _message_typedef(typedef.get(key)) is not None:
+            sub_typedef = _message_typedef(typedef[key])
+            if isinstance(value, list):
+                out[key] = [_prune(item, sub_typedef, subtree)[0] for item in value]
+            else:
+                out[key] = _prune(value, sub_typedef, subtree)[0]
+    return out, _prune_typedef({key: typedef[key] for key in out}, tree)
+
+
+def decode_paths(data, paths, typedef=None):
+    """
+    Decode only the given field paths of a protobuf body.
+    Returns (message, typedef) holding just those fields (and the messages
+    leading to them); paths missing from the body are left out. A known
+    typedef for the whole message is used for the fields it covers.
+    Bodies with groups on the way to a path are decoded in full and cut
+    down instead.
+    """
+    tree = path_tree(paths)
+    data = bytes(data)
+    packed_fields.install()
+    try:
+        return _select(data, 0, len(data), tree, typedef)
+    except (ValueError, IndexError):
+        msg, full_typedef = blackboxprotobuf.decode_message(data, typedef)
+        return _prune(msg, full_typedef, tree)
+
+
+def decode_header(data, typedef=None):
+    """decode_paths for the RPC header (field 1) alone."""
+    return decode_paths(data, HEADER_PATHS, typedef)
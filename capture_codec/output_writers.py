@@ -0,0 +1,256 @@
+"""
+Serializers for decoded records.
+
+    json     one indented JSON document (the original decoder.py output)
+    jsonl    one compact JSON object per line
+    msgpack  a stream of msgpack maps; bytes stay bytes instead of being
+             turned into text or base64
+    typed    a msgpack stream where each distinct schema_definition is
+             written once and records refer to it by id, so batches of the
+             same RPC do not repeat the typedef on every line
+
+JSON goes through orjson when it is installed. In the JSON formats a
+field the typedef marks as "bytes" is written as a plain string when it is
+valid UTF-8 and as {"base64": ...} otherwise, so text and binary stay
+distinct and encoder.py gets the exact bytes back (see message_to_json).
+"""
+
+import base64
+import json
+import re
+from array import array
+
+# orjson module once looked up (None if it is not installed); importing it
+# costs more than a small capture takes to decode, so it waits until needed.
+_orjson = False
+
+FORMATS = ("json", "jsonl", "msgpack", "typed")
+
+# Tags of the two kinds of entries in a typed stream:
+#   ["T", typedef_id, schema_definition]
+#   ["R", typedef_id, record without schema_definition]
+TYPEDEF_TAG = "T"
+RECORD_TAG = "R"
+
+# Key of the object that holds a non-UTF-8 bytes value in JSON output.
+BINARY_KEY = "base64"
+BINARY_TAG_RE = re.compile(r"<BINARY_BASE64: ([A-Za-z0-9+/=]*)>\Z")
+# Nested field types and the typedef key that describes their fields.
+NESTED_TYPES = {"message": "message_typedef", "group": "group_typedef"}
+
+
+def bytes_to_string_handler(obj):
+    """
+    Custom handler to convert bytes to strings for JSON.
+    It tries to decode as UTF-8 (readable text); if that fails,
+    it converts the binary to a Base64 string to preserve data.
+    """
+    if isinstance(obj, bytes):
+        try:
+            return obj.decode('utf-8')
+        except UnicodeDecodeError:
+            # Return as a tagged string so you know it was binary
+            return f"<BINARY_BASE64: {base64.b64encode(obj).decode('ascii')}>"
+    if isinstance(obj, array):
+        # Packed numeric fields decoded in bulk (see packed_fields.py).
+        return obj.tolist()
+    raise TypeError(f"Type {type(obj)} is not JSON serializable")
+
+
+def _bytes_to_json(value):
+    if not isinstance(value, (bytes, bytearray)):
+        # Already JSON-safe, e.g. a message that was loaded from JSON.
+        return value
+    try:
+        return value.decode("utf-8")
+    except UnicodeDecodeError:
+        return {BINARY_KEY: base64.b64encode(value).decode("ascii")}
+
+
+def _bytes_from_json(value):
+    if isinstance(value, dict):
+        return base64.b64decode(value[BINARY_KEY])
+    if isinstance(value, str):
+        # Tagged strings written by older versions of decoder.py.
+        tagged = BINARY_TAG_RE.match(value)
+        if tagged:
+            return base64.b64decode(tagged.group(1))
+        return value.encode("utf-8")
+    return value
+
+
+def compile_plan(typedef):
+    """
+    Compile a typedef into the plan message_to_json/message_from_json walk:
+    {field: None} for a "bytes" field, {field: subplan} for a nested message
+    that has bytes somewhere below it. Values blackboxprotobuf decoded with
+    one of a field's alt_typedefs are keyed "<field>-<alt id>" and get
+    entries the same way. Fields with nothing to convert are left out, so
+    applying a plan never visits them.
+    """
+    plan = {}
+    for key, field_def in (typedef or {}).items():
+        ftype = field_def.get("type")
+        if ftype == "bytes":
+            plan[key] = None
+        elif ftype in NESTED_TYPES:
+            subplan = compile_plan(field_def.get(NESTED_TYPES[ftype]))
+            if subplan:
+                plan[key] = subplan
+        for alt_id, alt_typedef in (field_def.get("alt_typedefs") or {}).items():
+            # A type name, or the message typedef of a message alternative
+            if alt_typedef == "bytes":
+                plan[f"{key}-{alt_id}"] = None
+            elif isinstance(alt_typedef, dict):
+                subplan = compile_plan(alt_typedef)
+                if subplan:
+                    plan[f"{key}-{alt_id}"] = subplan
+    return plan
+
+
+def apply_plan(msg, plan, convert_bytes):
+    """Copy of msg with convert_bytes applied to the fields the plan marks as bytes."""
+    if not plan or not isinstance(msg, dict):
+        return msg
+    out = dict(msg)
+    for key, subplan in plan.items():
+        value = out.get(key)
+        if value is None:
+            continue
+        if subplan is None:
+            if isinstance(value, list):
+                out[key] = [convert_bytes(v) for v in value]
+            else:
+                out[key] = convert_bytes(value)
+        elif isinstance(value, list):
+            out[key] = [apply_plan(v, subplan, convert_bytes) for v in value]
+        else:
+            out[key] = apply_plan(value, subplan, convert_bytes)
+    return out
+
+
+def message_to_json(msg, typedef, plan=None):
+    """
+    JSON-safe copy of a decoded message. "bytes" fields become str when they
+    are valid UTF-8 and {"base64": ...} when not; everything else is shared.
+    Pass a compile_plan(typedef) result as plan to reuse it across messages.
+    """
+    return apply_plan(msg, compile_plan(typedef) if plan is None else plan, _bytes_to_json)
+
+
+def message_from_json(msg, typedef, plan=None):
+    """Inverse of message_to_json: turn "bytes" fields back into bytes."""
+    return apply_plan(msg, compile_plan(typedef) if plan is None else plan, _bytes_from_json)
+
+
+def json_record(record):
+    """record with message_content made JSON-safe according to schema_definition."""
+    if "message_content" not in record:
+        return record
+    out = dict(record)
+    out["message_content"] = message_to_json(record["message_content"], record.get("schema_definition"))
+    return out
+
+
+def load_orjson():
+    """The orjson module, or None when it is not installed (stdlib json is used instead)."""
+    global _orjson
+    if _orjson is False:
+        try:
+            import orjson as _orjson
+        except ImportError:
+            _orjson = None
+    return _orjson
+
+
+def dumps_json(record):
+    """Compact JSON as UTF-8 bytes, using orjson when available."""
+    orjson = load_orjson()
+    if orjson is not None:
+        try:
+            return orjson.dumps(record, default=bytes_to_string_handler)
+        except TypeError:
+            # Integers past 64 bits and the like: let stdlib json handle it.
+            pass
+    return json.dumps(
+        record, default=bytes_to_string_handler, separators=(",", ":"), ensure_ascii=False
+    ).encode("utf-8")
+
+
+def _pack(obj):
+    import msgpack
+
+    return msgpack.packb(obj, use_bin_type=True)
+
+
+def serialize(record, fmt):
+    """
+    Serialize one record for a format. Returns bytes, or for the typed
+    format a (packed_record, packed_typedef) pair so the typedef can be
+    deduplicated by whoever writes the stream (see RecordWriter).
+    """
+    if fmt == "json":
+        return json.dumps(json_record(record), indent=4, default=bytes_to_string_handler).encode("utf-8")
+    if fmt == "jsonl":
+        return dumps_json(json_record(record)) + b"\n"
+    if fmt == "msgpack":
+        return _pack(record)
+    if fmt == "typed":
+        rest = {k: v for k, v in record.items() if k != "schema_definition"}
+        return _pack(rest), _pack(record.get("schema_definition"))
+    raise ValueError(f"Unknown output format {fmt!r}")
+
+
+class RecordWriter:
+    """Write records to a binary file in one of FORMATS."""
+
+    def __init__(self, f, fmt="jsonl"):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown output format {fmt!r}")
+        self.f = f
+        self.fmt = fmt
+        self.count = 0
+        # packed typedef -> id, for the typed format
+        self._typedef_ids = {}
+
+    def write(self, record):
+        self.write_serialized(serialize(record, self.fmt))
+
+    def write_serialized(self, item):
+        """Write the output of serialize(), e.g. produced in a worker process."""
+        self.count += 1
+        if self.fmt != "typed":
+            self.f.write(item)
+            return
+
+        packed_record, packed_typedef = item
+        typedef_id = self._typedef_ids.get(packed_typedef)
+        if typedef_id is None:
+            typedef_id = self._typedef_ids[packed_typedef] = len(self._typedef_ids)
+            # A 3-element fixarray is 0x93 followed by its packed elements.
+            self.f.write(b"\x93" + _pack(TYPEDEF_TAG) + _pack(typedef_id) + packed_typedef)
+        self.f.write(b"\x93" + _pack(RECORD_TAG) + _pack(typedef_id) + packed_record)
+
+
+def iter_records(f, fmt):
+    """Read records back from a binary file written by RecordWriter."""
+    import msgpack
+
+    if fmt == "json":
+        yield json.load(f)
+    elif fmt == "jsonl":
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+    elif fmt == "msgpack":
+        yield from msgpack.Unpacker(f, raw=False)
+    elif fmt == "typed":
+        typedefs = {}
+        for tag, typedef_id, value in msgpack.Unpacker(f, raw=False, use_list=True):
+            if tag == TYPEDEF_TAG:
+                typedefs[typedef_id] = value
+            else:
+                value["schema_definition"] = typedefs[typedef_id]
+                yield value
+    else:
+        raise ValueError(f"Unknown output format {fmt!r}")
@@ -0,0 +1,217 @@
+"""
+Bulk decoding of packed repeated numeric fields.
+
+blackboxprotobuf decodes a packed field (a typedef type like
+"packed_uint") one element at a time, and re-encodes every varint to check
+that it is canonical. For long ID lists and counters that per-element
+Python loop is most of the decode.
+
+decode_packed turns a whole packed run into an array.array at once:
+fixed32/fixed64/float/double runs are a single frombytes, and varint runs
+are split at their terminating bytes and combined with NumPy when it is
+installed. Without NumPy, runs of one-byte varints are still copied in
+bulk and only the longer varints are decoded one by one. The checks stay
+the same: a truncated, over-long or non-canonical varint is an error, so
+blackboxprotobuf falls back to its default type exactly as before.
+
+install() puts these decoders in place of blackboxprotobuf's own for the
+packed_* types. blackboxprotobuf flattens packed values into a list, so
+under it the array is expanded with tolist(); callers of decode_packed get
+the array, and bytes_to_string_handler only turns it into a list when it
+is written out as JSON.
+"""
+
+import re
+import sys
+from array import array
+
+# numpy module once looked up (None if it is not installed, in which case
+# varints are decoded in pure Python). speculation.py imports this module on
+# every blind decode, which never produces packed types, so the numpy import
+# waits until a packed run is decoded.
+numpy = False
+
+# bbpb packed type -> (base type, array typecode)
+PACKED_TYPES = {
+    "packed_uint": ("uint", "Q"),
+    "packed_int": ("int", "q"),
+    "packed_sint": ("sint", "q"),
+    "packed_fixed32": ("fixed32", "I"),
+    "packed_sfixed32": ("sfixed32", "i"),
+    "packed_float": ("float", "f"),
+    "packed_fixed64": ("fixed64", "Q"),
+    "packed_sfixed64": ("sfixed64", "q"),
+    "packed_double": ("double", "d"),
+}
+VARINT_TYPES = {"uint", "int", "sint"}
+# Item size of each fixed-width type on the wire.
+FIXED_SIZES = {"fixed32": 4, "sfixed32": 4, "float": 4, "fixed64": 8, "sfixed64": 8, "double": 8}
+
+# A varint of two or more bytes; the bytes between matches are one-byte varints.
+MULTI_BYTE_VARINT_RE = re.compile(rb"[\x80-\xff]+[\x00-\x7f]")
+CONTINUATION_RE = re.compile(rb"[\x80-\xff]")
+MAX_VARINT_SIZE = 10
+
+# Set by install(): packed type -> the decoder blackboxprotobuf had.
+_original_decoders = {}
+
+
+class PackedDecodeError(ValueError):
+    """The bytes are not a valid packed run of the requested type."""
+
+
+def load_numpy():
+    """The numpy module, or None when it is not installed."""
+    global numpy
+    if numpy is False:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+    return numpy
+
+
+def _varints_numpy(data, start, end):
+    raw = numpy.frombuffer(data, dtype=numpy.uint8, count=end - start, offset=start)
+    last = raw < 0x80
+    if not last[-1]:
+        raise PackedDecodeError("Packed varints end in the middle of a varint")
+    ends = numpy.flatnonzero(last)
+    starts = numpy.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    sizes = ends - starts + 1
+    if sizes.max() > MAX_VARINT_SIZE:
+        raise PackedDecodeError("Varint longer than 10 bytes")
+    if (raw[ends[sizes > 1]] == 0).any():
+        raise PackedDecodeError("Varint is not canonically encoded")
+    if (raw[ends[sizes == MAX_VARINT_SIZE]] > 1).any():
+        raise PackedDecodeError("Varint does not fit in 64 bits")
+    if len(ends) == len(raw):
+        # Every value fits in one byte.
+        return array("Q", raw.astype(numpy.uint64).tobytes())
+    shifts = (numpy.arange(len(raw), dtype=numpy.uint64) - numpy.repeat(starts, sizes).astype(numpy.uint64)) * 7
+    groups = (raw & 0x7F).astype(numpy.uint64) << shifts
+    return array("Q", numpy.add.reduceat(groups, starts).tobytes())
+
+
+def _varints_python(data, start, end):
+    values = array("Q")
+    append = values.append
+    pos = start
+    for match in MULTI_BYTE_VARINT_RE.finditer(data, start, end):
+        varint_start, varint_end = match.span()
+        # One-byte varints are their own value.
+        values.extend(data[pos:varint_start])
+        if varint_end - varint_start > MAX_VARINT_SIZE:
+            raise PackedDecodeError("Varint longer than 10 bytes")
+        if data[varint_end - 1] == 0:
+            raise PackedDecodeError("Varint is not canonically encoded")
+        value = shift = 0
+        for byte in data[varint_start:varint_end]:
+            value |= (byte & 0x7F) << shift
+            shift += 7
+        if value >> 64:
+            raise PackedDecodeError("Varint does not fit in 64 bits")
+        append(value)
+        pos = varint_end
+    if CONTINUATION_RE.search(data, pos, end):
+        raise PackedDecodeError("Packed varints end in the middle of a varint")
+    values.extend(data[pos:end])
+    return values
+
+
+def decode_varints(data, start=0, end=None, kind="uint"):
+    """
+    Decode data[start:end] as back-to-back varints. kind is "uint"
+    (array "Q"), "int" (two's complement, array "q") or "sint" (zigzag,
+    array "q").
+    """
+    end = len(data) if end is None else end
+    if start == end:
+        return array("q" if kind != "uint" else "Q")
+    numpy = load_numpy()
+    if numpy is not None:
+        values = _varints_numpy(data, start, end)
+    else:
+        values = _varints_python(data, start, end)
+    if kind == "uint":
+        return values
+    if kind == "int":
+        return array("q", values.tobytes())
+    if numpy is not None:
+        unsigned = numpy.frombuffer(values, dtype=numpy.uint64)
+        signed = (unsigned >> numpy.uint64(1)).view(numpy.int64) ^ -(unsigned & numpy.uint64(1)).view(numpy.int64)
+        return array("q", signed.tobytes())
+    return array("q", [(value >> 1) ^ -(value & 1) for value in values])
+
+
+def decode_fixed(data, start=0, end=None, kind="fixed64"):
+    """Decode data[start:end] as little-endian fixed-width values of kind."""
+    end = len(data) if end is None else end
+    typecode = PACKED_TYPES[f"packed_{kind}"][1]
+    size = FIXED_SIZES[kind]
+    if (end - start) % size:
+        raise PackedDecodeError(f"Packed {kind} length {end - start} is not a multiple of {size}")
+    values = array(typecode)
+    values.frombytes(data[start:end])
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def decode_packed(data, field_type, start=0, end=None):
+    """
+    Decode the payload of a packed field (data[start:end], without the
+    length prefix) whose typedef type is field_type ("packed_uint", ...).
+    Returns an array.array.
+    """
+    kind = PACKED_TYPES[field_type][0]
+    if kind in VARINT_TYPES:
+        return decode_varints(data, start, end, kind)
+    return decode_fixed(data, start, end, kind)
+
+
+def _bbpb_decoder(field_type):
+    from blackboxprotobuf.lib.exceptions import DecoderException
+    from blackboxprotobuf.lib.types.varint import decode_varint
+
+    def decode(buf, pos):
+        length, pos = decode_varint(buf, pos)
+        end = pos + length
+        if end > len(buf):
+            raise DecoderException(f"Packed field length {length} runs past the end of the buffer")
+        try:
+            values = decode_packed(buf, field_type, pos, end)
+        except PackedDecodeError as err:
+            raise DecoderException(f"Error decoding {field_type}: {err}")
+        return values.tolist(), end
+
+    return decode
+
+
+def install():
+    """
+    Use the bulk decoders for blackboxprotobuf's packed_* types. Safe to
+    call more than once; returns False when this blackboxprotobuf version
+    keeps its decoders somewhere else.
+    """
+    if _original_decoders:
+        return True
+    try:
+        from blackboxprotobuf.lib.types import type_maps
+    except ImportError:
+        return False
+    for field_type in PACKED_TYPES:
+        if field_type in type_maps.DECODERS:
+            _original_decoders[field_type] = type_maps.DECODERS[field_type]
+            type_maps.DECODERS[field_type] = _bbpb_decoder(field_type)
+    return bool(_original_decoders)
+
+
+def uninstall():
+    """Put blackboxprotobuf's own packed decoders back."""
+    from blackboxprotobuf.lib.types import type_maps
+
+    type_maps.DECODERS.update(_original_decoders)
+    _original_decoders.clear()
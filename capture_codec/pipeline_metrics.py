@@ -0,0 +1,164 @@
+"""
+Per-message metrics for the decode/encode pipeline (--profile).
+
+Each decoded or encoded message becomes one row: time per stage, bytes in
+and out, expansion ratio (protobuf body over raw capture bytes), nesting
+depth and field count. A collector keeps the rows and summarizes them into
+percentiles so a batch shows which stage (framing, gunzip,
+blackboxprotobuf, serialization) dominates for a capture source.
+"""
+
+import json
+import math
+from contextlib import contextmanager
+
+PERCENTILES = (50, 90, 99)
+# Per-message values summarized next to the stage timings.
+VALUE_METRICS = ("bytes_in", "bytes_out", "expansion_ratio", "depth", "fields")
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def message_shape(msg):
+    """
+    Returns (nesting depth, field count) of a decoded message. Every value
+    of a repeated field counts as one field, nested messages included.
+    """
+    if not isinstance(msg, dict):
+        return 0, 0
+    depth = fields = 0
+    for value in msg.values():
+        for item in value if isinstance(value, list) else (value,):
+            item_depth, item_fields = message_shape(item)
+            depth = max(depth, item_depth)
+            fields += 1 + item_fields
+    return depth + 1, fields
+
+
+def trace_row(trace, msg, label=None):
+    """
+    Build a metrics row from a decoder trace (see decoder.run_layers) and the
+    decoded message. Stages are named after the layers; an enveloped capture
+    is inflated inside the msgpack stage, a bare gzip one in the gzip stage.
+    """
+    depth, fields = message_shape(msg)
+    raw = trace[0]["bytes_in"] if trace else 0
+    body = trace[-1]["bytes_in"] if trace else 0
+    stages = {}
+    for step in trace:
+        stages[step["layer"]] = stages.get(step["layer"], 0.0) + step["seconds"]
+    return {
+        "source": label,
+        "bytes_in": raw,
+        "body_bytes": body,
+        "bytes_out": None,
+        # Inflated over raw, the inverse of corpus_stats' compression_ratio.
+        "expansion_ratio": body / raw if raw else None,
+        "depth": depth,
+        "fields": fields,
+        "stages": stages,
+    }
+
+
+class MetricsCollector:
+    """Collects metrics rows and summarizes them."""
+
+    def __init__(self):
+        self.rows = []
+
+    def add(self, row):
+        self.rows.append(row)
+
+    def finish_last(self, stage, seconds, bytes_out):
+        """Record the output stage of the row added last (records are written right after decoding)."""
+        if self.rows:
+            row = self.rows[-1]
+            row["stages"][stage] = row["stages"].get(stage, 0.0) + seconds
+            row["bytes_out"] = bytes_out
+
+    def summary(self):
+        """Percentiles per stage and per value metric over all rows."""
+        stage_times = {}
+        for row in self.rows:
+            for stage, seconds in row["stages"].items():
+                stage_times.setdefault(stage, []).append(seconds)
+        total = sum(sum(times) for times in stage_times.values())
+
+        stages = {}
+        for stage, times in stage_times.items():
+            times.sort()
+            stages[stage] = {
+                "count": len(times),
+                "total_seconds": sum(times),
+                "share": sum(times) / total if total else 0.0,
+                "max_ms": times[-1] * 1000,
+                **{f"p{pct}_ms": percentile(times, pct) * 1000 for pct in PERCENTILES},
+            }
+
+        values = {}
+        for name in VALUE_METRICS:
+            column = sorted(row[name] for row in self.rows if row.get(name) is not None)
+            if column:
+                values[name] = {
+                    "max": column[-1],
+                    **{f"p{pct}": percentile(column, pct) for pct in PERCENTILES},
+                }
+        summary = {"messages": len(self.rows), "total_seconds": total, "stages": stages, "values": values}
+        speculation = {}
+        for row in self.rows:
+            for name, count in row.get("speculation", {}).items():
+                speculation[name] = speculation.get(name, 0) + count
+        if speculation:
+            summary["speculation"] = speculation
+        return summary
+
+    def write(self, path):
+        """Write the summary and every row as JSON."""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"summary": self.summary(), "messages": self.rows}, f, indent=2)
+
+    def print_report(self):
+        summary = self.summary()
+        print(f"Profile: {summary['messages']} messages, {summary['total_seconds'] * 1000:.1f} ms in measured stages")
+        header = "".join(f"{f'p{pct} ms':>10}" for pct in PERCENTILES)
+        print(f"  {'stage':<15} {'count':>7} {'total ms':>10} {'share':>6}{header} {'max ms':>9}")
+        for stage, s in sorted(summary["stages"].items(), key=lambda item: -item[1]["total_seconds"]):
+            pcts = "".join(f"{s[f'p{pct}_ms']:>10.3f}" for pct in PERCENTILES)
+            print(
+                f"  {stage:<15} {s['count']:>7} {s['total_seconds'] * 1000:>10.1f} "
+                f"{s['share']:>6.1%}{pcts} {s['max_ms']:>9.3f}"
+            )
+        for name, v in summary["values"].items():
+            pcts = "  ".join(f"p{pct}={v[f'p{pct}']:.4g}" for pct in PERCENTILES)
+            print(f"  {name:<17} {pcts}  max={v['max']:.4g}")
+        if "speculation" in summary:
+            counts = summary["speculation"]
+            rejected = {name[9:]: value for name, value in counts.items() if name.startswith("rejected_")}
+            reasons = " ".join(f"{name}={value}" for name, value in rejected.items())
+            print(f"  speculative parses tried={counts.get('attempted', 0)} rejected={sum(rejected.values())} ({reasons})")
+
+
+@contextmanager
+def profiled(pstats_path=None, top=15):
+    """Run the body under cProfile when pstats_path is set, then dump and summarize it."""
+    if not pstats_path:
+        yield
+        return
+    import cProfile
+    import pstats
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(pstats_path)
+        print(f"cProfile stats saved to '{pstats_path}' (top {top} by cumulative time):")
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(top)
@@ -0,0 +1,290 @@
+"""
+Compile stable typedefs into native protobuf message classes.
+
+blackboxprotobuf interprets every message field by field in Python. Once the
+registry holds a typedef for a method, the same typedef can be turned into a
+protobuf descriptor and decoded/encoded by the C-accelerated google.protobuf
+runtime instead. Every field is declared `repeated` (proto2), so fields that
+appear several times on the wire are kept instead of last-one-wins, and both
+packed and unpacked encodings are accepted.
+"""
+
+import binascii
+import re
+from pathlib import Path
+
+try:
+    from google.protobuf import descriptor_pb2, descriptor_pool, message_factory
+    from google.protobuf.unknown_fields import UnknownFieldSet
+except ImportError:  # optional: only needed for the native fast path
+    descriptor_pb2 = None
+
+from .typedef_registry import iter_wire_fields
+
+FDP = descriptor_pb2.FieldDescriptorProto if descriptor_pb2 else None
+
+# blackboxprotobuf type -> (FieldDescriptorProto type, packed)
+SCALAR_TYPES = {
+    "int": ("TYPE_INT64", False),
+    "uint": ("TYPE_UINT64", False),
+    "sint": ("TYPE_SINT64", False),
+    "fixed32": ("TYPE_FIXED32", False),
+    "sfixed32": ("TYPE_SFIXED32", False),
+    "float": ("TYPE_FLOAT", False),
+    "fixed64": ("TYPE_FIXED64", False),
+    "sfixed64": ("TYPE_SFIXED64", False),
+    "double": ("TYPE_DOUBLE", False),
+    "bytes": ("TYPE_BYTES", False),
+    "bytes_hex": ("TYPE_BYTES", False),
+    "string": ("TYPE_STRING", False),
+    "packed_int": ("TYPE_INT64", True),
+    "packed_uint": ("TYPE_UINT64", True),
+    "packed_sint": ("TYPE_SINT64", True),
+    "packed_fixed32": ("TYPE_FIXED32", True),
+    "packed_sfixed32": ("TYPE_SFIXED32", True),
+    "packed_float": ("TYPE_FLOAT", True),
+    "packed_fixed64": ("TYPE_FIXED64", True),
+    "packed_sfixed64": ("TYPE_SFIXED64", True),
+    "packed_double": ("TYPE_DOUBLE", True),
+}
+
+NAME_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+class UnsupportedTypedef(ValueError):
+    """The typedef uses something the native runtime cannot express."""
+
+
+def _require_protobuf():
+    if descriptor_pb2 is None:
+        raise RuntimeError("The native codec needs the protobuf package: pip install protobuf")
+
+
+def _field_name(number, field_def):
+    name = field_def.get("name") or ""
+    return name if NAME_RE.match(name) else f"field_{number}"
+
+
+def _fill_message(proto, typedef, type_name):
+    proto.name = type_name.rsplit(".", 1)[-1]
+    used_names = set()
+    for key in sorted(typedef, key=int):
+        field_def = typedef[key]
+        ftype = field_def.get("type")
+        number = int(key)
+
+        field = proto.field.add()
+        field.number = number
+        field.label = FDP.LABEL_REPEATED
+        field.name = _field_name(number, field_def)
+        if field.name in used_names:
+            field.name = f"field_{number}"
+        used_names.add(field.name)
+
+        if ftype == "message":
+            if field_def.get("alt_typedefs"):
+                raise UnsupportedTypedef(f"field {key} has alternate typedefs")
+            nested_name = f"{type_name}.M{number}"
+            _fill_message(proto.nested_type.add(), field_def.get("message_typedef", {}), nested_name)
+            field.type = FDP.TYPE_MESSAGE
+            field.type_name = f".{nested_name}"
+        elif ftype in SCALAR_TYPES:
+            type_enum, packed = SCALAR_TYPES[ftype]
+            field.type = getattr(FDP, type_enum)
+            if packed:
+                field.options.packed = True
+        else:
+            raise UnsupportedTypedef(f"field {key} has unsupported type {ftype!r}")
+
+
+def _hex_fields(typedef, type_name, out):
+    """Collect {message full name: field numbers typed bytes_hex}, named as _fill_message names them."""
+    for key, field_def in typedef.items():
+        if field_def.get("type") == "message":
+            _hex_fields(field_def.get("message_typedef", {}), f"{type_name}.M{int(key)}", out)
+        elif field_def.get("type") == "bytes_hex":
+            out.setdefault(type_name, set()).add(int(key))
+    return out
+
+
+def _list_fields(typedef, type_name, out):
+    """
+    Collect {message full name: field numbers blackboxprotobuf always returns
+    as a list}: packed types and fields marked seen_repeated.
+    """
+    for key, field_def in typedef.items():
+        if field_def.get("type") == "message":
+            _list_fields(field_def.get("message_typedef", {}), f"{type_name}.M{int(key)}", out)
+        if field_def.get("seen_repeated") or str(field_def.get("type")).startswith("packed_"):
+            out.setdefault(type_name, set()).add(int(key))
+    return out
+
+
+def typedef_to_file_descriptor(typedef, message_name="Message", package="bbpb"):
+    """Build a FileDescriptorProto holding one message type for a typedef."""
+    _require_protobuf()
+    file_proto = descriptor_pb2.FileDescriptorProto()
+    file_proto.name = f"{package}/{message_name}.proto"
+    file_proto.package = package
+    file_proto.syntax = "proto2"
+    _fill_message(file_proto.message_type.add(), typedef, f"{package}.{message_name}")
+    return file_proto
+
+
+def export_descriptor_set(file_protos, path):
+    """Write FileDescriptorProtos as a serialized FileDescriptorSet (protoc -o format)."""
+    _require_protobuf()
+    descriptor_set = descriptor_pb2.FileDescriptorSet()
+    descriptor_set.file.extend(file_protos)
+    Path(path).write_bytes(descriptor_set.SerializeToString())
+
+
+def _proto_text(message, indent, lines):
+    pad = "  " * indent
+    lines.append(f"{pad}message {message.name} {{")
+    for nested in message.nested_type:
+        _proto_text(nested, indent + 1, lines)
+    for field in message.field:
+        if field.type == FDP.TYPE_MESSAGE:
+            type_name = field.type_name.rsplit(".", 1)[-1]
+        else:
+            type_name = FDP.Type.Name(field.type)[len("TYPE_"):].lower()
+        packed = " [packed = true]" if field.options.packed else ""
+        lines.append(f"{pad}  repeated {type_name} {field.name} = {field.number}{packed};")
+    lines.append(f"{pad}}}")
+
+
+def file_descriptor_to_proto(file_proto):
+    """Render a FileDescriptorProto built by typedef_to_file_descriptor as .proto text."""
+    lines = [f'syntax = "{file_proto.syntax}";', "", f"package {file_proto.package};", ""]
+    for message in file_proto.message_type:
+        _proto_text(message, 0, lines)
+    return "\n".join(lines) + "\n"
+
+
+class NativeCodec:
+    """A typedef compiled into a google.protobuf message class."""
+
+    def __init__(self, typedef, message_name="Message", package="bbpb"):
+        _require_protobuf()
+        self.typedef = typedef
+        self.file_proto = typedef_to_file_descriptor(typedef, message_name, package)
+        pool = descriptor_pool.DescriptorPool()
+        pool.Add(self.file_proto)
+        descriptor = pool.FindMessageTypeByName(f"{package}.{message_name}")
+        self.message_class = message_factory.GetMessageClass(descriptor)
+        # bytes_hex fields are TYPE_BYTES in the descriptor; blackboxprotobuf
+        # gives their values as hex.
+        self.hex_fields = _hex_fields(typedef, f"{package}.{message_name}", {})
+        self.list_fields = _list_fields(typedef, f"{package}.{message_name}", {})
+        # The typedef laid out the way blackboxprotobuf returns one, for
+        # callers that hand it out next to decode()'s message.
+        from blackboxprotobuf.lib.typedef import TypeDef
+
+        self.schema = TypeDef.from_dict(typedef).to_dict()
+
+    def decode(self, data):
+        """
+        Parse bytes into the same dict shape blackboxprotobuf returns:
+        field number keys in the order they first appear on the wire, a list
+        when a field repeats or its typedef is packed or seen_repeated. Raises UnsupportedTypedef if the message
+        has fields the typedef lacks.
+        """
+        data = bytes(data)
+        message = self.message_class.FromString(data)
+        return _to_dict(message, data, 0, len(data), self.hex_fields, self.list_fields)
+
+    def encode(self, value):
+        """Serialize a blackboxprotobuf-style dict. Fields come out in field-number order."""
+        message = self.message_class()
+        _from_dict(message, value, self.hex_fields)
+        return message.SerializeToString()
+
+
+def _to_dict(message, data, start, end, hex_fields, list_fields):
+    if len(UnknownFieldSet(message)):
+        raise UnsupportedTypedef("message has fields the typedef does not cover")
+    # field number -> (start, end) of each length-delimited value, in wire order
+    spans = {}
+    for number, wire_type, value in iter_wire_fields(data, start, end):
+        spans.setdefault(number, [])
+        if wire_type == 2:
+            spans[number].append(value)
+    fields = {field.number: (field, values) for field, values in message.ListFields()}
+    hex_numbers = hex_fields.get(message.DESCRIPTOR.full_name, ())
+    list_numbers = list_fields.get(message.DESCRIPTOR.full_name, ())
+    out = {}
+    for number in spans:
+        if number not in fields:
+            continue
+        field, values = fields[number]
+        if field.message_type is not None:
+            values = [
+                _to_dict(sub, data, sub_start, sub_end, hex_fields, list_fields)
+                for sub, (sub_start, sub_end) in zip(values, spans[number])
+            ]
+        elif number in hex_numbers:
+            values = [binascii.hexlify(item) for item in values]
+        out[str(number)] = list(values) if len(values) > 1 or number in list_numbers else values[0]
+    return out
+
+
+def _from_dict(message, value, hex_fields):
+    fields = message.DESCRIPTOR.fields_by_number
+    hex_numbers = hex_fields.get(message.DESCRIPTOR.full_name, ())
+    for key, item in value.items():
+        field = fields.get(int(key))
+        if field is None:
+            raise UnsupportedTypedef(f"field {key} is not in the typedef")
+        items = item if isinstance(item, list) else [item]
+        container = getattr(message, field.name)
+        if field.message_type is not None:
+            for sub in items:
+                _from_dict(container.add(), sub, hex_fields)
+        elif field.number in hex_numbers:
+            container.extend(binascii.unhexlify(hex_item) for hex_item in items)
+        else:
+            container.extend(items)
+
+
+def message_name_for(service, method):
+    """A stable message type name for an RPC, e.g. net_ihago_channel_srv_mgr__Channel_GetCurrentChannels."""
+    name = re.sub(r"[^A-Za-z0-9_]+", "_", f"{service}__{method}").strip("_")
+    return name if name and not name[0].isdigit() else f"M_{name}"
+
+
+def main():
+    """Main function."""
+    import argparse
+
+    from .typedef_registry import REGISTRY_FILE, TypedefRegistry
+
+    parser = argparse.ArgumentParser(description="Export registry typedefs as .proto files and a descriptor set")
+    parser.add_argument("--registry", default=REGISTRY_FILE, help=f"Typedef registry (default: {REGISTRY_FILE})")
+    parser.add_argument("--out-dir", default="proto", help="Directory for the generated .proto files")
+    parser.add_argument("--descriptor-set", help="Also write all messages as a FileDescriptorSet to this path")
+
+    args = parser.parse_args()
+
+    registry = TypedefRegistry(args.registry)
+    out_dir = Path(args.out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    file_protos = []
+    for service, methods in sorted(registry.typedefs.items()):
+        for method, typedef in sorted(methods.items()):
+            message_name = message_name_for(service, method)
+            try:
+                file_proto = typedef_to_file_descriptor(typedef, message_name)
+            except UnsupportedTypedef as err:
+                print(f"Skipping {service} {method}: {err}")
+                continue
+            (out_dir / f"{message_name}.proto").write_text(file_descriptor_to_proto(file_proto))
+            file_protos.append(file_proto)
+
+    if args.descriptor_set:
+        export_descriptor_set(file_protos, args.descriptor_set)
+    print(f"Exported {len(file_protos)} messages to '{out_dir}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""Fold typedefs inferred from many samples of one RPC into a single typedef."""
+
+import copy
+import json
+from pathlib import Path
+
+# Types blackboxprotobuf picks on its own for each wire type. When one side
+# of a conflict is the default and the other is a more specific type of the
+# same wire type (usually set by hand), the specific one wins.
+DEFAULT_TYPES = {"int", "fixed32", "fixed64", "bytes"}
+
+WIRE_TYPES = {
+    "int": 0, "uint": 0, "sint": 0,
+    "fixed32": 5, "sfixed32": 5, "float": 5,
+    "fixed64": 1, "sfixed64": 1, "double": 1,
+    "bytes": 2, "string": 2, "bytes_hex": 2, "message": 2,
+    "packed_int": 2, "packed_uint": 2, "packed_sint": 2,
+    "packed_fixed32": 2, "packed_sfixed32": 2, "packed_float": 2,
+    "packed_fixed64": 2, "packed_sfixed64": 2, "packed_double": 2,
+    "group": 3,
+}
+
+# Length-delimited types from most to least general. A value that decoded as
+# a message also decodes as bytes, but not the other way around, so the
+# merged type is the most general one seen.
+LENGTH_DELIM_ORDER = ["bytes", "bytes_hex", "string", "message"]
+
+
+def _conflict(path, old_type, new_type, resolved, ambiguous):
+    return {
+        "path": path,
+        "types": [old_type, new_type],
+        "resolved": resolved,
+        "ambiguous": ambiguous,
+    }
+
+
+def _resolve_type(path, old_type, new_type, conflicts):
+    """Pick one type for a field seen as old_type and new_type."""
+    old_wire, new_wire = WIRE_TYPES.get(old_type), WIRE_TYPES.get(new_type)
+
+    if old_wire != new_wire or old_wire is None:
+        # Same field number on different wire types (e.g. int vs fixed32):
+        # nothing decodes both, so keep what we had and flag it.
+        conflicts.append(_conflict(path, old_type, new_type, old_type, True))
+        return old_type
+
+    if old_type in LENGTH_DELIM_ORDER and new_type in LENGTH_DELIM_ORDER:
+        resolved = min(old_type, new_type, key=LENGTH_DELIM_ORDER.index)
+        # A submessage in one sample and bytes in another is a real guess;
+        # string vs bytes just means some samples were not valid UTF-8.
+        ambiguous = "message" in (old_type, new_type)
+        conflicts.append(_conflict(path, old_type, new_type, resolved, ambiguous))
+        return resolved
+
+    if old_type in DEFAULT_TYPES or new_type in DEFAULT_TYPES:
+        resolved = new_type if old_type in DEFAULT_TYPES else old_type
+        conflicts.append(_conflict(path, old_type, new_type, resolved, False))
+        return resolved
+
+    conflicts.append(_conflict(path, old_type, new_type, old_type, True))
+    return old_type
+
+
+def _merge_field_order(old_order, new_order):
+    """Keep the known field order and append fields only the new sample had."""
+    if not old_order:
+        return list(new_order or [])
+    merged = list(old_order)
+    known = set(merged)
+    merged.extend(f for f in new_order or [] if f not in known)
+    return merged
+
+
+def _merge_fields(old_def, new_def, path, conflicts):
+    """Merge two field definitions for the same field number."""
+    old_type, new_type = old_def.get("type"), new_def.get("type")
+    merged = dict(old_def)
+
+    if old_type != new_type:
+        merged_type = _resolve_type(path, old_type, new_type, conflicts)
+        if merged_type == new_type:
+            merged = dict(new_def)
+        if merged_type != "message":
+            merged.pop("message_typedef", None)
+            merged.pop("field_order", None)
+            merged.pop("alt_typedefs", None)
+        merged["type"] = merged_type
+    elif old_type == "message":
+        merged["message_typedef"] = _merge_typedef(
+            old_def.get("message_typedef", {}), new_def.get("message_typedef", {}), path, conflicts
+        )
+        if "field_order" in old_def or "field_order" in new_def:
+            merged["field_order"] = _merge_field_order(old_def.get("field_order"), new_def.get("field_order"))
+        alt = dict(new_def.get("alt_typedefs", {}))
+        alt.update(old_def.get("alt_typedefs", {}))
+        if alt:
+            merged["alt_typedefs"] = alt
+    elif old_type == "group":
+        merged["group_typedef"] = _merge_typedef(
+            old_def.get("group_typedef", {}), new_def.get("group_typedef", {}), path, conflicts
+        )
+
+    if not merged.get("name") and new_def.get("name"):
+        merged["name"] = new_def["name"]
+    return merged
+
+
+def _merge_typedef(old, new, prefix, conflicts):
+    merged = {}
+    for field, old_def in old.items():
+        path = f"{prefix}.{field}" if prefix else field
+        if field in new:
+            merged[field] = _merge_fields(old_def, new[field], path, conflicts)
+        else:
+            merged[field] = copy.deepcopy(old_def)
+    for field, new_def in new.items():
+        if field not in old:
+            merged[field] = copy.deepcopy(new_def)
+    return merged
+
+
+def merge_typedefs(old, new):
+    """
+    Merge a newly inferred typedef into an existing one.
+    Fields missing from either side are kept, nested messages are merged
+    recursively and type conflicts are resolved to the type that decodes
+    every sample seen so far where possible.
+    Returns (merged_typedef, conflicts); each conflict is a dict with the
+    dotted field path, both types, the resolved type and whether the choice
+    was ambiguous.
+    """
+    conflicts = []
+    if old is None:
+        return copy.deepcopy(new), conflicts
+    return _merge_typedef(old, new, "", conflicts), conflicts
+
+
+def merge_all(typedefs):
+    """Fold any number of typedefs for one method into one. Returns (typedef, conflicts)."""
+    merged, conflicts = None, []
+    for typedef in typedefs:
+        merged, found = merge_typedefs(merged, typedef)
+        conflicts.extend(found)
+    return merged, conflicts
+
+
+def _rpc_key(message):
+    """Return (service, method) from a decoded message's header field."""
+    header = message.get("1") if isinstance(message, dict) else None
+    if not isinstance(header, dict):
+        return None, None
+    service, method = header.get("1"), header.get("7")
+    return (
+        service if isinstance(service, str) else None,
+        method if isinstance(method, str) else None,
+    )
+
+
+def iter_decoded_samples(path):
+    """Yield decoded records from decoder JSON output or JSONL (frames/batch) output."""
+    text = Path(path).read_text(encoding="utf-8")
+    if path.endswith(".jsonl"):
+        for line in text.splitlines():
+            if line.strip():
+                yield json.loads(line)
+    else:
+        yield json.loads(text)
+
+
+def main():
+    """Main function."""
+    import argparse
+
+    from .typedef_registry import REGISTRY_FILE, TypedefRegistry
+
+    parser = argparse.ArgumentParser(
+        description="Merge schema_definition typedefs from decoded samples into the per-RPC registry"
+    )
+    parser.add_argument("samples", nargs="+", help="Decoder output files (.json or .jsonl)")
+    parser.add_argument("--registry", default=REGISTRY_FILE, help=f"Registry to refine (default: {REGISTRY_FILE})")
+    parser.add_argument("--all", action="store_true", help="List every resolved conflict, not just ambiguous ones")
+
+    args = parser.parse_args()
+
+    registry = TypedefRegistry(args.registry)
+    samples = skipped = 0
+    # (service, method, path, types, resolved, ambiguous) -> times seen
+    report = {}
+    for path in args.samples:
+        for record in iter_decoded_samples(path):
+            typedef = record.get("schema_definition")
+            service, method = _rpc_key(record.get("message_content"))
+            if typedef is None or (service is None and method is None):
+                skipped += 1
+                continue
+            samples += 1
+            for conflict in registry.merge(service, method, typedef):
+                key = (service or "", method or "", conflict["path"], tuple(conflict["types"]),
+                       conflict["resolved"], conflict["ambiguous"])
+                report[key] = report.get(key, 0) + 1
+
+    changed = len(registry.changed)
+    registry.save()
+    print(f"Merged {samples} samples into '{args.registry}' ({changed} methods updated, {skipped} skipped)")
+
+    for (service, method, path, types, resolved, ambiguous), count in report.items():
+        if not (ambiguous or args.all):
+            continue
+        label = "AMBIGUOUS" if ambiguous else "resolved"
+        print(f"  [{label}] {service} {method} field {path}: "
+              f"{types[0]} vs {types[1]} -> {resolved} (x{count})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Encode a message in two passes, copying every byte once.
+
+blackboxprotobuf's encode_message builds every nested message as its own
+bytearray, puts the tag and length prefix in front of it (a copy) and adds
+it to its parent (another copy), so a byte at depth d is copied about 2*d
+times before the message is done. SizedEncoder first walks the message in
+output order, encoding the scalar fields into a flat list of chunks and
+leaving a slot for each nested message's length prefix, which is filled in
+once the length of its contents is known. The chunks are then joined into
+one buffer of the final size.
+
+Field lookup and the field_order rules (the top level keeps data order)
+are those of blackboxprotobuf.lib.types.length_delim and the bytes are
+identical to blackboxprotobuf.encode_message. When a message does not
+encode, it is run through blackboxprotobuf to raise the same exception.
+"""
+
+import logging
+
+from blackboxprotobuf.lib.api import default_config
+from blackboxprotobuf.lib.exceptions import EncoderException, TypedefException
+from blackboxprotobuf.lib.typedef import TypeDef
+from blackboxprotobuf.lib.types import type_maps
+from blackboxprotobuf.lib.types.length_delim import encode_message as encode_with_typedef
+from blackboxprotobuf.lib.types.length_delim import encode_tag
+from blackboxprotobuf.lib.types.varint import encode_varint
+
+logger = logging.getLogger(__name__)
+
+
+def encode_sized(msg, typedef, config=None):
+    """
+    Encode msg with typedef (a typedef dict or a blackboxprotobuf TypeDef)
+    and return the protobuf bytes, like blackboxprotobuf.encode_message.
+    """
+    return SizedEncoder(typedef, config).encode(msg)
+
+
+class SizedEncoder:
+    """
+    A typedef ready for two-pass encoding. Field lookups are kept from one
+    encode call to the next, so a message type named through
+    config.known_types is resolved the first time it is used.
+    """
+
+    def __init__(self, typedef, config=None):
+        self.typedef = typedef if isinstance(typedef, TypeDef) else TypeDef.from_dict(typedef)
+        self.config = config or default_config
+        # TypeDef -> {field key: lookup}
+        self.lookups = {}
+
+    def encode(self, msg):
+        """Encode msg and return the protobuf bytes."""
+        chunks = []
+        try:
+            self.message(chunks, msg, self.typedef, [], None)
+        except Exception:
+            # Raise whatever blackboxprotobuf raises for this message.
+            encode_with_typedef(msg, self.config, self.typedef)
+            raise
+        return b"".join(chunks)
+
+    def lookup(self, typedef, path, field_id):
+        """(field number, field path, tag, encoder or None, field type, field_order) of field_id."""
+        field_key = field_id if isinstance(field_id, str) else str(field_id)
+        fielddef_results = typedef.lookup_fielddef(field_key)
+        if fielddef_results is None:
+            raise EncoderException(f"Provided field name/number {field_key} is not valid", path)
+        field_number, fielddef = fielddef_results
+        field_path = path + [str(field_number)]
+        field_type = fielddef.lookup_field_type(field_key, self.config, field_path)
+        if field_type is None:
+            raise EncoderException(f"Provided field name/number {field_key} / {field_number} is not valid", field_path)
+
+        encoder = None
+        if isinstance(field_type, TypeDef):
+            tag = encode_tag(int(field_number), type_maps.WIRETYPES["message"])
+        else:
+            encoder = type_maps.ENCODERS.get(field_type)
+            if encoder is None:
+                raise TypedefException(f"Unknown type: {field_type}", field_path)
+            tag = encode_tag(int(field_number), type_maps.WIRETYPES[field_type])
+        return field_number, field_path, tag, encoder, field_type, fielddef.field_order
+
+    def message(self, chunks, msg, typedef, path, field_order):
+        """Append one message level's chunks; returns their total size."""
+        known = self.lookups.get(typedef)
+        if known is None:
+            known = self.lookups[typedef] = {}
+        # field number -> [(lookup, value)], grouped the way blackboxprotobuf groups them
+        pending = {}
+        count = 0
+        for field_id, value in msg.items():
+            field = known.get(field_id)
+            if field is None:
+                field = known[field_id] = self.lookup(typedef, path, field_id)
+            if isinstance(value, list) and (field[3] is None or not field[4].startswith("packed_")):
+                occurrences = [(field, item) for item in value]
+            else:
+                occurrences = [(field, value)]
+            count += len(occurrences)
+            if field[0] in pending:
+                pending[field[0]].extend(occurrences)
+            else:
+                pending[field[0]] = occurrences
+
+        if count and self.config.preserve_field_order and field_order is not None and len(field_order) == count:
+            if isinstance(field_order[0], tuple):
+                field_order = [number for number, *_ in field_order]
+            cursors = {number: iter(occurrences) for number, occurrences in pending.items()}
+            sequence = []
+            for number in field_order:
+                occurrence = next(cursors[number], None) if number in cursors else None
+                if occurrence is None:
+                    logger.warning("The field_order list does not match the fields from _encode_message_field")
+                    break
+                sequence.append(occurrence)
+            for cursor in cursors.values():
+                sequence.extend(cursor)
+        else:
+            sequence = [occurrence for occurrences in pending.values() for occurrence in occurrences]
+
+        append = chunks.append
+        size = 0
+        for (_, field_path, tag, encoder, field_type, nested_order), value in sequence:
+            append(tag)
+            if encoder is not None:
+                encoded = encoder(value)
+                append(encoded)
+                size += len(tag) + len(encoded)
+            else:
+                slot = len(chunks)
+                append(b"")
+                nested = self.message(chunks, value, field_type, field_path, nested_order)
+                prefix = chunks[slot] = encode_varint(nested)
+                size += len(tag) + len(prefix) + nested
+        return size
@@ -0,0 +1,176 @@
+"""
+Limits on speculative nested-message parsing during blind decoding.
+
+blackboxprotobuf tries every length-delimited field it has no type for as
+a nested message first, recursively, and only falls back to string or
+bytes when that fails. On large binary blobs (images, opaque tokens) the
+attempt is expensive and now and then "succeeds" with a nonsense
+submessage.
+
+decode_message walks the wire format first and decides which candidates
+are worth trying: one larger than MAX_SPECULATIVE_SIZE, nested deeper than
+MAX_SPECULATIVE_DEPTH, or reached (or still being walked) once the message
+has used up SPECULATION_BUDGET seconds is typed as string (valid UTF-8) or
+bytes up front, so blackboxprotobuf decodes it as such without trying it as a
+message. Candidates within the limits are left to blackboxprotobuf as
+before. COUNTS keeps running totals of the candidates tried and rejected.
+"""
+
+import time
+
+from . import packed_fields
+from .lazy_decode import iter_field_spans
+
+# Defaults for every blind decode; decoder.py overrides them from the CLI.
+# None means no limit.
+MAX_SPECULATIVE_SIZE = None
+# Top-level fields are depth 1; 0 turns nested-message inference off.
+MAX_SPECULATIVE_DEPTH = None
+# Seconds of speculative walking per message.
+SPECULATION_BUDGET = None
+# Walk and count candidates even without limits (for --profile).
+COUNT_ONLY = False
+
+# How many fields are walked between looks at the clock.
+BUDGET_CHECK_INTERVAL = 256
+
+# Running totals since reset_counts(). "attempted" candidates were walked as
+# messages; each rejected_* is a candidate that was not, and why.
+COUNTS = {
+    "attempted": 0,
+    "rejected_size": 0,
+    "rejected_depth": 0,
+    "rejected_budget": 0,
+    "rejected_malformed": 0,
+}
+
+
+def get_limits():
+    """The current limits, as a picklable tuple for batch workers."""
+    return MAX_SPECULATIVE_SIZE, MAX_SPECULATIVE_DEPTH, SPECULATION_BUDGET, COUNT_ONLY
+
+
+def set_limits(limits):
+    """Apply a get_limits() tuple."""
+    global MAX_SPECULATIVE_SIZE, MAX_SPECULATIVE_DEPTH, SPECULATION_BUDGET, COUNT_ONLY
+    MAX_SPECULATIVE_SIZE, MAX_SPECULATIVE_DEPTH, SPECULATION_BUDGET, COUNT_ONLY = limits
+
+
+def active():
+    """True when decode_message does anything beyond blackboxprotobuf's own decode."""
+    return COUNT_ONLY or any(limit is not None for limit in get_limits()[:3])
+
+
+def reset_counts():
+    """Zero COUNTS and return what they were."""
+    counts = dict(COUNTS)
+    for name in COUNTS:
+        COUNTS[name] = 0
+    return counts
+
+
+def rejected(counts=None):
+    """Total rejected candidates in counts (COUNTS by default)."""
+    counts = COUNTS if counts is None else counts
+    return sum(value for name, value in counts.items() if name.startswith("rejected_"))
+
+
+def _leaf_type(data, spans):
+    # The type blackboxprotobuf falls back to once the message attempt fails.
+    try:
+        for start, end in spans:
+            data[start:end].decode("utf-8")
+    except UnicodeDecodeError:
+        return "bytes"
+    return "string"
+
+
+class BudgetExceeded(Exception):
+    """The message ran out of speculation time while walking a candidate."""
+
+
+def _message_hints(data, start, end, depth, deadline):
+    """
+    Typedef hints for the message in data[start:end], whose fields are at
+    depth. Raises ValueError or IndexError if it is not a message, and
+    BudgetExceeded if a nested candidate runs past the deadline.
+    """
+    fields = {}
+    # The top level is not speculative; only candidates are cut short.
+    check = deadline is not None and depth > 1
+    for count, (number, wire_type, _, value_start, field_end) in enumerate(iter_field_spans(data, start, end)):
+        if check and count % BUDGET_CHECK_INTERVAL == BUDGET_CHECK_INTERVAL - 1 and time.perf_counter() > deadline:
+            raise BudgetExceeded()
+        wire_types, spans = fields.setdefault(str(number), (set(), []))
+        wire_types.add(wire_type)
+        if wire_type == 2:
+            spans.append((value_start, field_end))
+
+    hints = {}
+    for key, (wire_types, spans) in fields.items():
+        if wire_types == {2}:
+            hint = _field_hint(data, spans, depth, deadline)
+            if hint is not None:
+                hints[key] = hint
+    return hints
+
+
+def _field_hint(data, spans, depth, deadline):
+    """A typedef hint for a length-delimited field (all its occurrences), or None to leave it be."""
+    reason = None
+    if MAX_SPECULATIVE_DEPTH is not None and depth > MAX_SPECULATIVE_DEPTH:
+        reason = "rejected_depth"
+    elif MAX_SPECULATIVE_SIZE is not None and any(end - start > MAX_SPECULATIVE_SIZE for start, end in spans):
+        reason = "rejected_size"
+    elif deadline is not None and time.perf_counter() > deadline:
+        reason = "rejected_budget"
+    if reason is not None:
+        COUNTS[reason] += len(spans)
+        return {"type": _leaf_type(data, spans)}
+
+    nested = {}
+    for start, end in spans:
+        COUNTS["attempted"] += 1
+        try:
+            nested.update(_message_hints(data, start, end, depth + 1, deadline))
+        except BudgetExceeded:
+            COUNTS["rejected_budget"] += 1
+            return {"type": _leaf_type(data, spans)}
+        except (ValueError, IndexError):
+            # Not a message as far as the wire walk can tell; blackboxprotobuf
+            # will find out the same (groups aside) and fall back by itself.
+            COUNTS["rejected_malformed"] += 1
+            return None
+    if not nested:
+        return None
+    return {"type": "message", "message_typedef": nested}
+
+
+def speculation_hints(data):
+    """
+    Typedef hints that keep blackboxprotobuf from trying the candidates over
+    the limits as messages. Returns {} when there is nothing to hint.
+    """
+    deadline = None if SPECULATION_BUDGET is None else time.perf_counter() + SPECULATION_BUDGET
+    try:
+        return _message_hints(data, 0, len(data), 1, deadline)
+    except (ValueError, IndexError):
+        # Groups or garbage at the top level: leave it to blackboxprotobuf.
+        return {}
+
+
+def decode_message(data, typedef=None):
+    """
+    blackboxprotobuf.decode_message under the speculation limits.
+    A given typedef takes precedence over the hints for the fields it has.
+    """
+    import blackboxprotobuf
+
+    packed_fields.install()
+    data = bytes(data)
+    if not active():
+        return blackboxprotobuf.decode_message(data, typedef)
+    hints = speculation_hints(data)
+    if typedef:
+        hints.update(typedef)
+    return blackboxprotobuf.decode_message(data, hints or None)
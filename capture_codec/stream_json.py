@@ -0,0 +1,438 @@
+"""
+Decode a protobuf body straight to JSON, writing fields as the wire walk
+reaches them.
+
+    with open("out.json", "wb") as f:
+        typedef = stream_record(body, f)
+
+The usual path builds the whole decoded message and its typedef, then
+serializes them, so a large response is held several times over before the
+first byte is written. Here each level of the message is walked once to
+find its fields (their offsets only), and every field is decoded and
+written out in turn; nested messages are walked the same way as they are
+reached. What is held is the body, the field offsets of the messages on
+the current path and the typedef, which is written last.
+
+Types are inferred the way blackboxprotobuf does it, so the output is the
+same record decode_capture + RecordWriter would write (json or jsonl):
+varints are "int", fixed-width fields "fixed32"/"fixed64", and a
+length-delimited field is a message when every occurrence parses as one,
+else a string when every occurrence is UTF-8, else bytes. Later
+occurrences of a repeated message are decoded with what the earlier ones
+showed. A known typedef (e.g. from the registry) is followed the same way;
+a field it does not fit, or whose type has no decoder here (packed and
+group fields), is handed to blackboxprotobuf on its own and its result
+written in place. Under the speculation limits of speculation.py the
+message starts from the same speculation_hints typedef that
+speculation.decode_message gives blackboxprotobuf, so limited decodes come
+out the same too (a time budget aside, which can cut two runs short at
+different points).
+"""
+
+import json
+import struct
+import time
+
+from . import speculation
+from .output_writers import _bytes_to_json, bytes_to_string_handler, dumps_json
+from .schema_merge import WIRE_TYPES as ALL_WIRE_TYPES
+
+# Buffered output is written out once it reaches this many characters.
+FLUSH_SIZE = 64 * 1024
+
+# Wire type of each field type decoded here.
+WIRE_TYPES = {
+    "int": 0, "uint": 0, "sint": 0,
+    "fixed64": 1, "sfixed64": 1, "double": 1,
+    "string": 2, "bytes": 2, "message": 2,
+    "fixed32": 5, "sfixed32": 5, "float": 5,
+}
+FIXED_FORMATS = {
+    "fixed64": "<Q", "sfixed64": "<q", "double": "<d",
+    "fixed32": "<I", "sfixed32": "<i", "float": "<f",
+}
+# What blackboxprotobuf infers for each wire type (length-delimited aside).
+DEFAULT_TYPES = {0: "int", 1: "fixed64", 5: "fixed32"}
+# Field definition keys blackboxprotobuf writes ahead of the rest, in order.
+NAME_KEYS = ("name", "message_type_name", "example_value_ignored")
+
+
+class NotMessage(ValueError):
+    """The bytes do not parse as a protobuf message."""
+
+
+def _read_varint(data, pos, end):
+    # Canonical varints only, like blackboxprotobuf.
+    start = pos
+    value = shift = 0
+    while True:
+        if pos >= end:
+            raise NotMessage("Varint runs past the end of the message")
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            break
+        shift += 7
+    if (byte == 0 and pos - start > 1) or value >> 64:
+        raise NotMessage("Varint is not canonically encoded")
+    return value, pos
+
+
+def walk_fields(data, start, end):
+    """
+    One level of a message as {field_number: [(wire_type, value_start,
+    value_end), ...]} in order of first occurrence, plus the field order
+    (one key per occurrence). Raises NotMessage if it is not a message.
+    """
+    fields = {}
+    order = []
+    pos = start
+    while pos < end:
+        key, pos = _read_varint(data, pos, end)
+        number, wire_type = key >> 3, key & 0x7
+        if wire_type == 0:
+            value_start = pos
+            _, pos = _read_varint(data, pos, end)
+        else:
+            if wire_type == 2:
+                length, pos = _read_varint(data, pos, end)
+            elif wire_type == 1:
+                length = 8
+            elif wire_type == 5:
+                length = 4
+            else:
+                raise NotMessage(f"Unsupported wire type {wire_type}")
+            value_start = pos
+            pos += length
+            if pos > end:
+                raise NotMessage("Field runs past the end of the message")
+        occurrences = fields.get(number)
+        if occurrences is None:
+            occurrences = fields[number] = []
+        elif occurrences[0][0] != wire_type:
+            raise NotMessage(f"Field {number} has mismatched wire types")
+        occurrences.append((wire_type, value_start, pos))
+        order.append(str(number))
+    return fields, order
+
+
+def is_message(data, start, end):
+    """True if data[start:end] parses as a message."""
+    try:
+        walk_fields(data, start, end)
+    except NotMessage:
+        return False
+    return True
+
+
+def _is_utf8(data, start, end):
+    try:
+        data[start:end].decode("utf-8")
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def canonical_typedef(typedef):
+    """
+    typedef with every field definition laid out the way blackboxprotobuf
+    writes one back, fields the message does not have included.
+    """
+    return {key: _canonical_field(field_def) for key, field_def in typedef.items()}
+
+
+def _canonical_field(field_def):
+    out = {}
+    for name in (*NAME_KEYS, "seen_repeated", "field_order"):
+        if field_def.get(name):
+            out[name] = field_def[name]
+    if field_def.get("type") == "message" and "message_typedef" in field_def:
+        out["message_typedef"] = canonical_typedef(field_def["message_typedef"])
+    if "type" in field_def:
+        out["type"] = field_def["type"]
+    if field_def.get("alt_typedefs"):
+        out["alt_typedefs"] = {
+            number: canonical_typedef(alt) if isinstance(alt, dict) else alt
+            for number, alt in field_def["alt_typedefs"].items()
+        }
+    return out
+
+
+def typedef_fits(fields, typedef):
+    """
+    False if a field of a walk_fields() level is on another wire type than
+    the (non-message) type typedef gives it, which blackboxprotobuf rejects.
+    """
+    for number, occurrences in fields.items():
+        field_type = (typedef.get(str(number)) or {}).get("type")
+        if field_type is not None and field_type != "message" and ALL_WIRE_TYPES.get(field_type) != occurrences[0][0]:
+            return False
+    return True
+
+
+def _message_check(data, occurrences, typedef=None):
+    """
+    "message" if every occurrence is a message and each field number keeps
+    one wire type across them (and the one typedef gives it), "mixed" if
+    they are messages that disagree, None if one is not a message.
+    """
+    wire_types = {key: ALL_WIRE_TYPES.get(field_def.get("type")) for key, field_def in (typedef or {}).items()}
+    agree = True
+    for _, start, end in occurrences:
+        try:
+            fields, _ = walk_fields(data, start, end)
+        except NotMessage:
+            return None
+        for number, field_occurrences in fields.items():
+            if wire_types.setdefault(str(number), field_occurrences[0][0]) != field_occurrences[0][0]:
+                agree = False
+    return "message" if agree else "mixed"
+
+
+class JsonStream:
+    """Writes one record at a time to a binary file in the json or jsonl layout."""
+
+    def __init__(self, f, fmt="json"):
+        if fmt not in ("json", "jsonl"):
+            raise ValueError(f"Streaming writes json or jsonl, not {fmt!r}")
+        self.f = f
+        self.fmt = fmt
+        self.indent = 4 if fmt == "json" else None
+        self.key_separator = ": " if self.indent else ":"
+        self._parts = []
+        self._size = 0
+        self.deadline = None
+
+    def write(self, text):
+        self._parts.append(text)
+        self._size += len(text)
+        if self._size >= FLUSH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self._parts:
+            self.f.write("".join(self._parts).encode("utf-8"))
+            self._parts = []
+            self._size = 0
+
+    def _newline(self, level):
+        if self.indent:
+            self.write("\n" + " " * (self.indent * level))
+
+    def _value(self, value, level=0):
+        # A fully built value, serialized exactly as RecordWriter would.
+        if self.fmt == "jsonl":
+            self.write(dumps_json(value).decode("utf-8"))
+        elif isinstance(value, (dict, list)) and value:
+            text = json.dumps(value, indent=self.indent, default=bytes_to_string_handler)
+            self.write(text.replace("\n", "\n" + " " * (self.indent * level)))
+        else:
+            self.write(json.dumps(value, default=bytes_to_string_handler))
+
+    def _key(self, key, first, level):
+        if not first:
+            self.write(",")
+        self._newline(level)
+        self.write(json.dumps(key) + self.key_separator)
+
+    def record(self, data, typedef=None, extra=None):
+        """
+        Write {**extra, "message_content": ..., "schema_definition": ...}
+        for the protobuf body data. Returns the typedef. Raises NotMessage
+        before writing anything if data is not a message.
+        """
+        fields, order = walk_fields(data, 0, len(data))
+        if speculation.active():
+            # The hints speculation.decode_message gives blackboxprotobuf, so
+            # the fields they cover are typed, and ordered, the same way.
+            hints = speculation.speculation_hints(data)
+            if typedef:
+                hints.update(typedef)
+            typedef = hints or None
+        if typedef:
+            if not typedef_fits(fields, typedef):
+                raise NotMessage("The typedef does not fit the message")
+            typedef = canonical_typedef(typedef)
+        if speculation.SPECULATION_BUDGET is not None:
+            self.deadline = time.perf_counter() + speculation.SPECULATION_BUDGET
+        self.write("{")
+        first = True
+        for key, value in (extra or {}).items():
+            self._key(key, first, 1)
+            self._value(value, 1)
+            first = False
+        self._key("message_content", first, 1)
+        out_typedef = self._message(data, fields, order, typedef, 1)
+        self._key("schema_definition", False, 1)
+        self._value(out_typedef, 1)
+        self._newline(0)
+        self.write("}" if self.indent else "}\n")
+        self.flush()
+        return out_typedef
+
+    def _message(self, data, fields, order, hints, level, depth=1):
+        """Write one message object. Returns its typedef."""
+        typedef = dict(hints) if hints else {}
+        if not fields:
+            self.write("{}")
+            return typedef
+        self.write("{")
+        first = True
+        for number, occurrences in fields.items():
+            key = str(number)
+            hint = typedef.get(key)
+            field_type = self._field_type(data, occurrences, hint, depth)
+            if field_type is None:
+                first = self._delegate(data, key, occurrences, hint, typedef, first, level + 1)
+                continue
+            self._key(key, first, level + 1)
+            first = False
+            typedef[key] = self._field(data, occurrences, field_type, hint, level + 1, depth)
+        self._newline(level)
+        self.write("}")
+        return typedef
+
+    def _field_type(self, data, occurrences, hint, depth):
+        """The type to write a field as, or None to leave it to blackboxprotobuf."""
+        wire_type = occurrences[0][0]
+        if hint is not None:
+            field_type = hint.get("type")
+            if WIRE_TYPES.get(field_type) != wire_type:
+                return None
+            if field_type == "message" and _message_check(data, occurrences, hint.get("message_typedef")) != "message":
+                return None
+            if field_type == "string" and not all(_is_utf8(data, start, end) for _, start, end in occurrences):
+                return None
+            return field_type
+        if wire_type != 2:
+            return DEFAULT_TYPES[wire_type]
+        if self._speculate(data, occurrences, depth):
+            check = _message_check(data, occurrences)
+            if check == "message":
+                return "message"
+            if check == "mixed":
+                # Occurrences that disagree on a field's wire type get
+                # blackboxprotobuf's alternate types.
+                return None
+        if all(_is_utf8(data, start, end) for _, start, end in occurrences):
+            return "string"
+        return "bytes"
+
+    def _speculate(self, data, occurrences, depth):
+        # The limits speculation.decode_message puts on blind decodes.
+        reason = None
+        if speculation.MAX_SPECULATIVE_DEPTH is not None and depth > speculation.MAX_SPECULATIVE_DEPTH:
+            reason = "rejected_depth"
+        elif speculation.MAX_SPECULATIVE_SIZE is not None and any(
+            end - start > speculation.MAX_SPECULATIVE_SIZE for _, start, end in occurrences
+        ):
+            reason = "rejected_size"
+        elif self.deadline is not None and time.perf_counter() > self.deadline:
+            reason = "rejected_budget"
+        if reason is not None:
+            speculation.COUNTS[reason] += len(occurrences)
+            return False
+        if speculation.active():
+            speculation.COUNTS["attempted"] += len(occurrences)
+        return True
+
+    def _field(self, data, occurrences, field_type, hint, level, depth):
+        """Write a field's value (or list of values). Returns its field definition."""
+        repeated = len(occurrences) > 1 or bool(hint and hint.get("seen_repeated"))
+        # blackboxprotobuf only marks repeated strings and bytes when the
+        # typedef gave their type.
+        marked = repeated and (hint is not None or field_type not in ("string", "bytes"))
+        if repeated:
+            self.write("[")
+            item_level = level + 1
+        else:
+            item_level = level
+
+        message_typedef = hint.get("message_typedef") if hint else None
+        # blackboxprotobuf keeps the longest field order of the occurrences.
+        field_order = []
+        for index, (_, start, end) in enumerate(occurrences):
+            if repeated:
+                if index:
+                    self.write(",")
+                self._newline(item_level)
+            if field_type == "message":
+                fields, order = walk_fields(data, start, end)
+                message_typedef = self._message(data, fields, order, message_typedef, item_level, depth + 1)
+                if len(order) > len(field_order):
+                    field_order = order
+            else:
+                self._value(self._scalar(data, start, end, field_type), item_level)
+        if repeated:
+            self._newline(level)
+            self.write("]")
+
+        field_def = {name: hint[name] for name in NAME_KEYS if hint and hint.get(name)}
+        if marked:
+            field_def["seen_repeated"] = True
+        if field_type == "message":
+            if field_order:
+                field_def["field_order"] = field_order
+            field_def["message_typedef"] = message_typedef or {}
+        field_def["type"] = field_type
+        if hint and hint.get("alt_typedefs"):
+            field_def["alt_typedefs"] = hint["alt_typedefs"]
+        return field_def
+
+    @staticmethod
+    def _scalar(data, start, end, field_type):
+        if field_type in ("int", "uint", "sint"):
+            value, _ = _read_varint(data, start, end)
+            if field_type == "int" and value >> 63:
+                value -= 1 << 64
+            elif field_type == "sint":
+                value = (value >> 1) ^ -(value & 1)
+            return value
+        if field_type in FIXED_FORMATS:
+            return struct.unpack_from(FIXED_FORMATS[field_type], data, start)[0]
+        value = data[start:end]
+        if field_type == "string":
+            return value.decode("utf-8")
+        return _bytes_to_json(bytes(value))
+
+    def _delegate(self, data, key, occurrences, hint, typedef, first, level):
+        """Decode one field with blackboxprotobuf and write what it gives (maybe alternate keys)."""
+        import blackboxprotobuf
+
+        from .output_writers import message_to_json
+
+        wire = bytearray()
+        for wire_type, start, end in occurrences:
+            wire += _field_key(int(key), wire_type)
+            if wire_type == 2:
+                wire += _varint_bytes(end - start)
+            wire += data[start:end]
+        msg, field_typedef = blackboxprotobuf.decode_message(bytes(wire), {key: hint} if hint else None)
+        for out_key, value in message_to_json(msg, field_typedef).items():
+            self._key(out_key, first, level)
+            self._value(value, level)
+            first = False
+        typedef.update(field_typedef)
+        return first
+
+
+def _varint_bytes(value):
+    out = bytearray()
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+    return out
+
+
+def _field_key(number, wire_type):
+    return _varint_bytes(number << 3 | wire_type)
+
+
+def stream_record(data, f, fmt="json", typedef=None, extra=None):
+    """
+    Decode the protobuf body data and write it to the binary file f as one
+    json or jsonl record, field by field. Returns the typedef.
+    """
+    return JsonStream(f, fmt).record(data, typedef, extra)
@@ -0,0 +1,284 @@
+"""
+Structural diff between captures, by field path.
+
+    python -m capture_codec.structural_diff room1 room2
+    python -m capture_codec.structural_diff room1 caps/room* --summary
+
+Captures are compared on the wire, one message level at a time. Every
+field occurrence is hashed from its raw bytes, so a submessage's hash
+stands for its whole subtree (Merkle-style): fields whose occurrences hash
+the same on both sides are skipped without being decoded or walked, and
+only the length-delimited fields that differ and are typed "message" on
+both sides are descended into; a short string or bytes value that happens
+to parse as wire format is reported as a changed value. The type comes
+from the record's schema_definition for decoder JSON inputs; otherwise a
+differing field is decoded to find it, and the typedef that decode
+returns covers everything below it. Only the fields that actually changed
+are decoded, so the work follows the size of the change rather than the
+size of the message, and the base capture's hashes and decodes are kept
+when it is compared with many others.
+
+Repeated fields are matched by hash first, so an element that merely
+moved is not a change; what is left is paired up in order. Paths name the
+element as 3[1].2 when a field is repeated on either side.
+
+Inputs are raw captures (run through the framing layers) or decoder JSON
+records, which are encoded back to protobuf first.
+"""
+
+import hashlib
+import json
+import sys
+from collections import Counter
+
+from .lazy_decode import iter_field_spans
+
+DIGEST_SIZE = 16
+
+
+class WireMessage:
+    """
+    A protobuf body with its per-level field index, hashes and field
+    decodes memoized. typedef is the body's typedef when it is known.
+    """
+
+    def __init__(self, body, label=None, typedef=None):
+        self.data = bytes(body)
+        self.view = memoryview(self.data)
+        self.label = label
+        self.typedef = typedef
+        self._fields = {}
+        self._digests = {}
+        self._decoded = {}
+
+    def fields(self, start=0, end=None):
+        """
+        {field_number: [(wire_type, field_start, value_start, field_end), ...]}
+        for the message in data[start:end], or None if it is not one.
+        """
+        end = len(self.data) if end is None else end
+        key = (start, end)
+        if key not in self._fields:
+            groups = {}
+            try:
+                for number, wire_type, field_start, value_start, field_end in iter_field_spans(self.data, start, end):
+                    groups.setdefault(number, []).append((wire_type, field_start, value_start, field_end))
+            except (ValueError, IndexError):
+                groups = None
+            self._fields[key] = groups
+        return self._fields[key]
+
+    def digest(self, start, end):
+        """Hash of data[start:end], the subtree of one field occurrence."""
+        key = (start, end)
+        digest = self._digests.get(key)
+        if digest is None:
+            digest = self._digests[key] = hashlib.blake2b(self.view[start:end], digest_size=DIGEST_SIZE).digest()
+        return digest
+
+    def _decode(self, occurrence):
+        """Blind-decode one field occurrence. Returns (key, message, typedef)."""
+        _, field_start, _, field_end = occurrence
+        key = (field_start, field_end)
+        decoded = self._decoded.get(key)
+        if decoded is None:
+            import blackboxprotobuf
+
+            msg, typedef = blackboxprotobuf.decode_message(self.data[field_start:field_end])
+            (field, _), = msg.items()
+            decoded = self._decoded[key] = field, msg, typedef
+        return decoded
+
+    def field_def(self, typedef, number, occurrence):
+        """The typedef entry of a field occurrence: typedef's if it has the field, else decoded."""
+        field_def = typedef.get(str(number)) if typedef else None
+        if field_def is None:
+            field, _, decoded = self._decode(occurrence)
+            field_def = decoded[field]
+        return field_def
+
+    def typed_value(self, occurrence):
+        """Decode one field occurrence. Returns (type, JSON-safe value)."""
+        from .output_writers import message_to_json
+
+        field, msg, typedef = self._decode(occurrence)
+        return typedef[field]["type"], message_to_json(msg, typedef)[field]
+
+
+def _unmatched(occurrences, digests, other_digests):
+    """The occurrences (with their index) whose hash the other side does not have as often."""
+    spare = Counter(other_digests)
+    left = []
+    for index, (occurrence, digest) in enumerate(zip(occurrences, digests)):
+        if spare[digest]:
+            spare[digest] -= 1
+        else:
+            left.append((index, occurrence))
+    return left
+
+
+def _change(kind, path, old=None, new=None):
+    change = {"path": path, "change": kind}
+    for side, value in (("old", old), ("new", new)):
+        if value is not None:
+            change[f"{side}_type"], change[side] = value
+    types = {change.get("old_type"), change.get("new_type")} - {None}
+    if len(types) == 1:
+        change.pop("old_type", None)
+        change.pop("new_type", None)
+        change["type"] = types.pop()
+    return change
+
+
+def _diff_message(old, old_bounds, old_typedef, new, new_bounds, new_typedef, prefix, changes):
+    old_fields = old.fields(*old_bounds)
+    new_fields = new.fields(*new_bounds)
+    numbers = list(old_fields)
+    numbers += [number for number in new_fields if number not in old_fields]
+    for number in numbers:
+        old_occ = old_fields.get(number, [])
+        new_occ = new_fields.get(number, [])
+        old_digests = [old.digest(occ[1], occ[3]) for occ in old_occ]
+        new_digests = [new.digest(occ[1], occ[3]) for occ in new_occ]
+        if old_digests == new_digests:
+            continue
+
+        path = f"{prefix}{number}"
+        repeated = len(old_occ) > 1 or len(new_occ) > 1
+        removed = _unmatched(old_occ, old_digests, new_digests)
+        added = _unmatched(new_occ, new_digests, old_digests)
+        for (old_index, old_one), (new_index, new_one) in zip(removed, added):
+            where = f"{path}[{new_index}]" if repeated else path
+            old_value = (old_one[2], old_one[3])
+            new_value = (new_one[2], new_one[3])
+            old_def = new_def = None
+            if old_one[0] == new_one[0] == 2:
+                old_def = old.field_def(old_typedef, number, old_one)
+                new_def = new.field_def(new_typedef, number, new_one)
+            if (
+                old_def is not None
+                and old_def.get("type") == new_def.get("type") == "message"
+                and old.fields(*old_value) is not None
+                and new.fields(*new_value) is not None
+            ):
+                _diff_message(
+                    old, old_value, old_def.get("message_typedef"),
+                    new, new_value, new_def.get("message_typedef"),
+                    f"{where}.", changes,
+                )
+            else:
+                changes.append(_change("changed", where, old.typed_value(old_one), new.typed_value(new_one)))
+        for old_index, old_one in removed[len(added):]:
+            where = f"{path}[{old_index}]" if repeated else path
+            changes.append(_change("removed", where, old=old.typed_value(old_one)))
+        for new_index, new_one in added[len(removed):]:
+            where = f"{path}[{new_index}]" if repeated else path
+            changes.append(_change("added", where, new=new.typed_value(new_one)))
+
+
+def diff_messages(old, new):
+    """
+    Changes between two WireMessages (or protobuf bodies), in field order.
+    Each is {"path", "change": changed|added|removed, "type" (or
+    "old_type"/"new_type" when it changed), "old", "new"}.
+    """
+    if not isinstance(old, WireMessage):
+        old = WireMessage(old)
+    if not isinstance(new, WireMessage):
+        new = WireMessage(new)
+    if old.data == new.data:
+        return []
+    if old.fields() is None or new.fields() is None:
+        raise ValueError("Not a protobuf message")
+    changes = []
+    _diff_message(old, (0, len(old.data)), old.typedef, new, (0, len(new.data)), new.typedef, "", changes)
+    return changes
+
+
+def load_message(path, layers=None):
+    """A WireMessage for a raw capture or a decoder JSON record file."""
+    from .decoder import open_capture, run_layers
+
+    with open_capture(path) as raw:
+        if bytes(raw[:1]) == b"{":
+            try:
+                record = json.loads(bytes(raw))
+            except ValueError:
+                record = None
+            if isinstance(record, dict) and "message_content" in record:
+                from .encoder import encode_message
+
+                typedef = record["schema_definition"]
+                return WireMessage(encode_message(record["message_content"], typedef), path, typedef)
+        return WireMessage(run_layers(raw, layers), path)
+
+
+def _format_value(value):
+    text = json.dumps(value, ensure_ascii=False)
+    return text if len(text) <= 80 else text[:77] + "..."
+
+
+def print_changes(changes):
+    marks = {"changed": "~", "added": "+", "removed": "-"}
+    for change in changes:
+        kind = change.get("type") or f"{change['old_type']}->{change['new_type']}"
+        if change["change"] == "changed":
+            values = f"{_format_value(change['old'])} -> {_format_value(change['new'])}"
+        else:
+            values = _format_value(change["old" if change["change"] == "removed" else "new"])
+        print(f"  {marks[change['change']]} {change['path']:<20} {kind:<10} {values}")
+
+
+def main():
+    """Main function."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Structural diff of a capture against one or more others")
+    parser.add_argument("base", help="Capture (or decoder JSON record) to compare against")
+    parser.add_argument("others", nargs="+", help="Captures to compare with the base")
+    parser.add_argument("--layers", help="Comma-separated framing layers to try (default: http,msgpack,gzip)")
+    parser.add_argument("--json", action="store_true", help="Write one JSON line per compared capture")
+    parser.add_argument(
+        "--summary", action="store_true", help="Only list each changed path with how many captures changed it"
+    )
+    args = parser.parse_args()
+
+    layers = [name for name in args.layers.split(",") if name] if args.layers else None
+    try:
+        base = load_message(args.base, layers)
+    except Exception as err:
+        print(f"Error: cannot load {args.base}: {err}", file=sys.stderr)
+        sys.exit(1)
+
+    failed = 0
+    per_path = Counter()
+    compared = 0
+    try:
+        for path in args.others:
+            try:
+                changes = diff_messages(base, load_message(path, layers))
+            except Exception as err:
+                failed += 1
+                print(f"Error: {path}: {err}", file=sys.stderr)
+                continue
+            compared += 1
+            if args.json:
+                print(json.dumps({"base": args.base, "other": path, "changes": changes}, ensure_ascii=False))
+            elif args.summary:
+                per_path.update({change["path"]: 1 for change in changes})
+            else:
+                print(f"{path} vs {args.base}: {len(changes)} change(s)")
+                print_changes(changes)
+
+        if args.summary:
+            print(f"{compared} captures compared with {args.base}")
+            for path, count in per_path.most_common():
+                print(f"  {path:<24} changed in {count}")
+    except BrokenPipeError:
+        sys.stderr.close()
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
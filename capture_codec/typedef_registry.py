@@ -0,0 +1,221 @@
+"""Persistent (service, method) -> typedef registry for decoding known RPCs."""
+
+import json
+import os
+from pathlib import Path
+
+from .schema_merge import merge_typedefs
+
+# Default location of the registry file, next to the captures.
+REGISTRY_FILE = "typedefs.json"
+
+# Fields of the RPC header message (top-level field 1).
+HEADER_FIELD = 1
+SERVICE_FIELD = 1
+METHOD_FIELD = 7
+
+
+def _read_varint(data, pos):
+    """Read a base-128 varint starting at pos. Returns (value, new_pos)."""
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+        if shift == 63 and data[pos] > 1:
+            # Ten bytes at most, and the tenth holds only bit 63.
+            raise ValueError("Varint does not fit in 64 bits")
+
+
+def iter_wire_fields(data, start=0, end=None):
+    """
+    Walk the top level of a protobuf message without decoding values.
+    Yields (field_number, wire_type, value) where value is the integer for
+    varints and a (start, end) offset pair for everything else.
+    Raises ValueError on groups or malformed input.
+    """
+    pos = start
+    end = len(data) if end is None else end
+    while pos < end:
+        key, pos = _read_varint(data, pos)
+        field_number, wire_type = key >> 3, key & 0x7
+        if wire_type == 0:
+            value, pos = _read_varint(data, pos)
+            yield field_number, wire_type, value
+            continue
+        if wire_type == 2:
+            length, pos = _read_varint(data, pos)
+        elif wire_type == 1:
+            length = 8
+        elif wire_type == 5:
+            length = 4
+        else:
+            raise ValueError(f"Unsupported wire type {wire_type}")
+        if pos + length > end:
+            raise ValueError("Field runs past the end of the message")
+        yield field_number, wire_type, (pos, pos + length)
+        pos += length
+
+
+def read_rpc_header(data):
+    """
+    Pull (service, method) out of the RPC header without decoding the body.
+    Either value is None when it cannot be found.
+    """
+    service = method = None
+    try:
+        for number, wire_type, value in iter_wire_fields(data):
+            if number != HEADER_FIELD or wire_type != 2:
+                continue
+            for inner, inner_type, bounds in iter_wire_fields(data, *value):
+                if inner_type != 2:
+                    continue
+                if inner == SERVICE_FIELD:
+                    service = bytes(data[bounds[0]:bounds[1]]).decode("utf-8")
+                elif inner == METHOD_FIELD:
+                    method = bytes(data[bounds[0]:bounds[1]]).decode("utf-8")
+            break
+    except (ValueError, IndexError, UnicodeDecodeError):
+        pass
+    return service, method
+
+
+def has_alt_keys(msg):
+    """
+    Whether a decoded message (or any message inside it) has a field
+    decoded with one of its alt_typedefs, keyed "<field>-<alt id>".
+    """
+    for key, value in msg.items():
+        if "-" in key:
+            return True
+        for item in value if isinstance(value, list) else (value,):
+            if isinstance(item, dict) and has_alt_keys(item):
+                return True
+    return False
+
+
+class TypedefRegistry:
+    """
+    Known-good typedefs keyed by RPC service and method, stored as JSON:
+    {service: {method: typedef}}. A missing service or method is stored as "".
+    """
+
+    def __init__(self, path=REGISTRY_FILE, native=False):
+        self.path = Path(path)
+        self.typedefs = {}
+        # (service, method) keys updated since the last save()
+        self.changed = set()
+        # Decode known methods through compiled google.protobuf classes
+        self.native = native
+        self._codecs = {}
+        if self.path.exists():
+            self.typedefs = json.loads(self.path.read_text(encoding="utf-8"))
+
+    def __len__(self):
+        return sum(len(methods) for methods in self.typedefs.values())
+
+    def get(self, service, method):
+        """Return the stored typedef for an RPC, or None."""
+        return self.typedefs.get(service or "", {}).get(method or "")
+
+    def put(self, service, method, typedef):
+        """Store a typedef for an RPC if it differs from what is already known."""
+        service, method = service or "", method or ""
+        methods = self.typedefs.setdefault(service, {})
+        if methods.get(method) != typedef:
+            methods[method] = typedef
+            self.changed.add((service, method))
+            self._codecs.pop((service, method), None)
+
+    def merge(self, service, method, typedef):
+        """
+        Fold a typedef from another sample into the stored one, so new
+        captures refine the registry without re-scanning old ones.
+        Returns the list of type conflicts found while merging.
+        """
+        merged, conflicts = merge_typedefs(self.get(service, method), typedef)
+        self.put(service, method, merged)
+        return conflicts
+
+    def pop_changes(self):
+        """Return [(service, method, typedef)] updated since the last call."""
+        changes = [(s, m, self.typedefs[s][m]) for s, m in sorted(self.changed)]
+        self.changed.clear()
+        return changes
+
+    def save(self):
+        """Write the registry back to disk if anything changed."""
+        if not self.changed:
+            return
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        tmp_path.write_text(json.dumps(self.typedefs, indent=2, sort_keys=True), encoding="utf-8")
+        os.replace(tmp_path, self.path)
+        self.changed.clear()
+
+    def native_codec(self, service, method):
+        """
+        Return a proto_codec.NativeCodec for a known RPC, compiling it on
+        first use. Returns None if the typedef cannot be compiled.
+        """
+        key = (service or "", method or "")
+        if key not in self._codecs:
+            from .proto_codec import NativeCodec, UnsupportedTypedef
+
+            try:
+                self._codecs[key] = NativeCodec(self.get(service, method))
+            except UnsupportedTypedef:
+                self._codecs[key] = None
+        return self._codecs[key]
+
+    def decode(self, data):
+        """
+        Decode a protobuf body using the typedef registered for its RPC.
+        With native=True known RPCs go through the compiled protobuf class
+        first. Unknown RPCs are decoded blind and their typedef is remembered;
+        fields the stored typedef does not cover yet are added to it. If the
+        stored typedef does not fit the message, it is decoded blind instead
+        and the blind typedef is merged into the stored one; that includes
+        messages blackboxprotobuf could only decode by adding alternate
+        types ("1-1" keys) to the stored typedef.
+        Returns (message, typedef).
+        """
+        # Blind decodes go through the speculation limits; speculation.py
+        # imports this module (via lazy_decode), hence the late import.
+        from .speculation import decode_message
+
+        service, method = read_rpc_header(data)
+        if service is None and method is None:
+            return decode_message(data)
+
+        known = self.get(service, method)
+        if known is None:
+            msg, typedef = decode_message(data)
+            self.put(service, method, typedef)
+            return msg, typedef
+
+        if self.native:
+            codec = self.native_codec(service, method)
+            if codec is not None:
+                try:
+                    return codec.decode(data), codec.schema
+                except Exception:
+                    # New fields or a type mismatch: let blackboxprotobuf
+                    # sort it out and refine the stored typedef below.
+                    pass
+
+        try:
+            msg, typedef = decode_message(data, known)
+            fits = not has_alt_keys(msg)
+        except Exception:
+            fits = False
+        if not fits:
+            msg, typedef = decode_message(data)
+            self.merge(service, method, typedef)
+            return msg, typedef
+
+        self.put(service, method, typedef)
+        return msg, typedef